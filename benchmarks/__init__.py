@@ -0,0 +1 @@
+"""Throughput benchmarks for mailops. Run with `python -m benchmarks`."""
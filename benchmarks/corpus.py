@@ -0,0 +1,336 @@
+# benchmarks/corpus.py
+"""Synthetic DMARC aggregate and TLS-RPT report generator for the benchmarks."""
+import gzip
+import io
+import json
+import os
+import random
+import zipfile
+from datetime import datetime, timezone
+from email.mime.application import MIMEApplication
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from email.utils import format_datetime
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+# (reporting domain, org_name) pairs, roughly the mix a busy domain receives
+DEFAULT_ORGS = [
+    ("google.com", "google.com"),
+    ("yahoo.com", "Yahoo"),
+    ("protection.outlook.com", "Enterprise Outlook"),
+    ("mail.ru", "Mail.Ru"),
+    ("comcast.net", "Comcast"),
+]
+
+COMPRESSIONS = ("none", "gz", "zip")
+
+DAY = 86400
+
+
+def _random_ip(rng: random.Random) -> str:
+    return "{}.{}.{}.{}".format(
+        rng.choice([203, 198, 192, 45, 185, 209]),
+        rng.randint(0, 255),
+        rng.randint(0, 255),
+        rng.randint(1, 254),
+    )
+
+
+def sender_pool(size: int, seed: int = 0) -> List[str]:
+    """Returns a stable list of source IPs shared by every generated report."""
+    rng = random.Random(seed)
+    return [_random_ip(rng) for _ in range(size)]
+
+
+def write_asn_dataset(path: str, prefixes: int, seed: int = 0) -> str:
+    """
+    Writes an iptoasn-style range file (/24 networks, one AS each) covering
+    the sender pool plus random filler ranges, prefixes lines in total.
+    """
+    rng = random.Random(seed)
+    nets = {ip.rsplit(".", 1)[0] for ip in sender_pool(min(prefixes, 1000), seed)}
+    while len(nets) < prefixes:
+        nets.add(_random_ip(rng).rsplit(".", 1)[0])
+    ordered = sorted(nets, key=lambda net: [int(part) for part in net.split(".")])
+    with open(path, "w") as f:
+        for i, net in enumerate(ordered):
+            asn = 64512 + i % 1000
+            f.write(f"{net}.0\t{net}.255\t{asn}\tZZ\tBENCH-NET-{asn}\n")
+    return path
+
+
+def build_report(
+    org_name: str,
+    org_domain: str,
+    report_id: str,
+    policy_domain: str,
+    begin: int,
+    records: int,
+    rng: random.Random,
+    senders: List[str],
+    pass_rate: float = 0.9,
+) -> bytes:
+    """Builds one aggregate report (RFC 7489 appendix C layout) as bytes."""
+    parts = [
+        '<?xml version="1.0" encoding="UTF-8" ?>\n<feedback>\n',
+        "  <report_metadata>\n",
+        f"    <org_name>{org_name}</org_name>\n",
+        f"    <email>noreply-dmarc@{org_domain}</email>\n",
+        f"    <report_id>{report_id}</report_id>\n",
+        f"    <date_range><begin>{begin}</begin>"
+        f"<end>{begin + DAY - 1}</end></date_range>\n",
+        "  </report_metadata>\n",
+        "  <policy_published>\n",
+        f"    <domain>{policy_domain}</domain>\n",
+        "    <adkim>r</adkim><aspf>r</aspf><p>quarantine</p><pct>100</pct>\n",
+        "  </policy_published>\n",
+    ]
+    for _ in range(records):
+        spf = "pass" if rng.random() < pass_rate else "fail"
+        dkim = "pass" if rng.random() < pass_rate else "fail"
+        if spf == "pass" or dkim == "pass":
+            disposition = "none"
+        else:
+            disposition = rng.choice(["none", "quarantine", "reject"])
+        parts.append(
+            "  <record>\n"
+            "    <row>\n"
+            f"      <source_ip>{rng.choice(senders)}</source_ip>\n"
+            f"      <count>{rng.randint(1, 500)}</count>\n"
+            "      <policy_evaluated>"
+            f"<disposition>{disposition}</disposition>"
+            f"<dkim>{dkim}</dkim><spf>{spf}</spf>"
+            "</policy_evaluated>\n"
+            "    </row>\n"
+            f"    <identifiers><header_from>{policy_domain}</header_from>"
+            "</identifiers>\n"
+            "    <auth_results>\n"
+            f"      <dkim><domain>{policy_domain}</domain>"
+            f"<selector>default</selector><result>{dkim}</result></dkim>\n"
+            f"      <spf><domain>{policy_domain}</domain>"
+            f"<result>{spf}</result></spf>\n"
+            "    </auth_results>\n"
+            "  </record>\n"
+        )
+    parts.append("</feedback>\n")
+    return "".join(parts).encode("utf-8")
+
+
+def compress(xml_bytes: bytes, name: str, compression: str) -> Tuple[str, bytes]:
+    """Packs a report the way receivers send it. Returns (filename, payload)."""
+    if compression == "gz":
+        return f"{name}.xml.gz", gzip.compress(xml_bytes)
+    if compression == "zip":
+        buf = io.BytesIO()
+        with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as z:
+            z.writestr(f"{name}.xml", xml_bytes)
+        return f"{name}.zip", buf.getvalue()
+    if compression != "none":
+        raise ValueError(f"Unknown compression: {compression}")
+    return f"{name}.xml", xml_bytes
+
+
+def generate_reports(
+    count: int,
+    records_per_report: int,
+    orgs: Optional[List[Tuple[str, str]]] = None,
+    compression: str = "none",
+    policy_domain: str = "example.com",
+    seed: int = 0,
+    senders: int = 200,
+    start: int = 1700006400,
+) -> Iterator[Dict]:
+    """
+    Yields synthetic reports as dicts with filename, payload and metadata.
+    compression may be 'none', 'gz', 'zip' or 'mixed' (round-robin).
+    """
+    rng = random.Random(seed)
+    orgs = orgs or DEFAULT_ORGS
+    pool = sender_pool(senders, seed)
+
+    for i in range(count):
+        org_domain, org_name = orgs[i % len(orgs)]
+        begin = start + (i // len(orgs)) * DAY
+        report_id = f"{seed}-{i:08d}"
+        xml_bytes = build_report(
+            org_name,
+            org_domain,
+            report_id,
+            policy_domain,
+            begin,
+            records_per_report,
+            rng,
+            pool,
+        )
+        method = compression
+        if compression == "mixed":
+            method = COMPRESSIONS[i % len(COMPRESSIONS)]
+        name = f"{org_domain}!{policy_domain}!{begin}!{begin + DAY - 1}!{i}"
+        filename, payload = compress(xml_bytes, name, method)
+        yield {
+            "filename": filename,
+            "payload": payload,
+            "org_name": org_name,
+            "org_domain": org_domain,
+            "report_id": report_id,
+            "policy_domain": policy_domain,
+            "begin": begin,
+            "records": records_per_report,
+        }
+
+
+TLS_RESULT_TYPES = (
+    "certificate-expired",
+    "certificate-host-mismatch",
+    "starttls-not-supported",
+    "sts-policy-fetch-error",
+    "validation-failure",
+)
+
+
+def build_tls_report(
+    org_name: str,
+    org_domain: str,
+    report_id: str,
+    policy_domain: str,
+    begin: int,
+    failures: int,
+    rng: random.Random,
+    senders: List[str],
+) -> bytes:
+    """Builds one SMTP TLS report (RFC 8460 section 4.8 layout) as bytes."""
+    details: List[Dict[str, Any]] = []
+    for _ in range(failures):
+        mx = rng.randint(1, 3)
+        details.append(
+            {
+                "result-type": rng.choice(TLS_RESULT_TYPES),
+                "sending-mta-ip": rng.choice(senders),
+                "receiving-mx-hostname": f"mx{mx}.{policy_domain}",
+                "receiving-ip": f"192.0.2.{mx}",
+                "failed-session-count": rng.randint(1, 50),
+            }
+        )
+
+    def stamp(ts: int) -> str:
+        return datetime.fromtimestamp(ts, timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+    report = {
+        "organization-name": org_name,
+        "date-range": {
+            "start-datetime": stamp(begin),
+            "end-datetime": stamp(begin + DAY - 1),
+        },
+        "contact-info": f"smtp-tls-reporting@{org_domain}",
+        "report-id": report_id,
+        "policies": [
+            {
+                "policy": {
+                    "policy-type": "sts",
+                    "policy-string": ["version: STSv1", "mode: enforce"],
+                    "policy-domain": policy_domain,
+                    "mx-host": [f"*.{policy_domain}"],
+                },
+                "summary": {
+                    "total-successful-session-count": rng.randint(100, 10000),
+                    "total-failure-session-count": sum(
+                        d["failed-session-count"] for d in details
+                    ),
+                },
+                "failure-details": details,
+            }
+        ],
+    }
+    return json.dumps(report, indent=2).encode("utf-8")
+
+
+def generate_tls_reports(
+    count: int,
+    failures_per_report: int,
+    orgs: Optional[List[Tuple[str, str]]] = None,
+    gzipped: bool = True,
+    policy_domain: str = "example.com",
+    seed: int = 0,
+    senders: int = 200,
+    start: int = 1700006400,
+) -> Iterator[Dict]:
+    """Yields synthetic TLS reports in the same shape as generate_reports()."""
+    rng = random.Random(seed)
+    orgs = orgs or DEFAULT_ORGS
+    pool = sender_pool(senders, seed)
+
+    for i in range(count):
+        org_domain, org_name = orgs[i % len(orgs)]
+        begin = start + (i // len(orgs)) * DAY
+        report_id = f"tls-{seed}-{i:08d}"
+        payload = build_tls_report(
+            org_name,
+            org_domain,
+            report_id,
+            policy_domain,
+            begin,
+            failures_per_report,
+            rng,
+            pool,
+        )
+        # RFC 8460 section 5.1 file naming
+        filename = f"{org_domain}!{policy_domain}!{begin}!{begin + DAY - 1}!{i}.json"
+        if gzipped:
+            filename, payload = filename + ".gz", gzip.compress(payload)
+        yield {
+            "filename": filename,
+            "payload": payload,
+            "org_name": org_name,
+            "org_domain": org_domain,
+            "report_id": report_id,
+            "policy_domain": policy_domain,
+            "begin": begin,
+            "records": failures_per_report + 1,
+        }
+
+
+def write_corpus(directory: str, reports=None, **kwargs) -> List[str]:
+    """
+    Writes generated reports (generate_reports(**kwargs) unless given) to a
+    directory and returns the file paths.
+    """
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for report in reports if reports is not None else generate_reports(**kwargs):
+        path = os.path.join(directory, report["filename"])
+        with open(path, "wb") as f:
+            f.write(report["payload"])
+        paths.append(path)
+    return paths
+
+
+def build_message(report: Dict) -> bytes:
+    """Wraps a generated report in the email a receiver would send."""
+    filename = report["filename"]
+    tls = ".json" in filename
+    msg = MIMEMultipart()
+    msg["From"] = f"noreply-dmarc@{report['org_domain']}"
+    msg["To"] = f"dmarc@{report['policy_domain']}"
+    msg["Subject"] = (
+        f"Report Domain: {report['policy_domain']} "
+        f"Submitter: {report['org_domain']} Report-ID: {report['report_id']}"
+    )
+    if tls:
+        msg["TLS-Report-Domain"] = report["policy_domain"]
+        msg["TLS-Report-Submitter"] = report["org_name"]
+    sent = datetime.fromtimestamp(report["begin"] + DAY + 3600, tz=timezone.utc)
+    msg["Date"] = format_datetime(sent)
+    msg.attach(MIMEText("This is an aggregate report.", "plain"))
+
+    if tls:
+        subtype = "tlsrpt+gzip" if filename.endswith(".gz") else "tlsrpt+json"
+    elif filename.endswith(".gz"):
+        subtype = "gzip"
+    elif filename.endswith(".zip"):
+        subtype = "zip"
+    else:
+        subtype = "xml"
+    part = MIMEApplication(report["payload"], _subtype=subtype)
+    part.add_header("Content-Disposition", "attachment", filename=filename)
+    msg.attach(part)
+    return msg.as_bytes()
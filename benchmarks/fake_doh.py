@@ -0,0 +1,136 @@
+# benchmarks/fake_doh.py
+"""
+A local stand-in for Google's JSON DNS-over-HTTPS API (/resolve).
+
+Answers come from an in-memory zone; `latency` adds a fixed delay to every
+request so lookups behave like a real round trip without touching the
+network; names in a zone listed in `failing` get SERVFAIL. Point mailops
+at it with `doh.DOH_URL = server.url`.
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+RTYPES = {"A": 1, "NS": 2, "CNAME": 5, "MX": 15, "TXT": 16, "AAAA": 28}
+
+Zone = Dict[Tuple[str, str], List[str]]
+
+
+def default_zone(domain: str = "example.com", listed_ips=()) -> Zone:
+    """Builds a zone with SPF/A records for a domain and RBL hits for IPs."""
+    zone: Zone = {
+        (domain, "TXT"): [
+            '"v=spf1 include:_spf.google.com ip4:192.0.2.0/24 ~all"',
+            '"google-site-verification=benchmark"',
+        ],
+        (domain, "A"): ["192.0.2.10"],
+    }
+    for ip in listed_ips:
+        reversed_ip = ".".join(reversed(ip.split(".")))
+        zone[(f"{reversed_ip}.zen.spamhaus.org", "A")] = ["127.0.0.2"]
+    return zone
+
+
+def audit_zone(domains, selectors=("default",)) -> Zone:
+    """Builds a zone where every domain passes the dns_audit checks."""
+    key = "MIIBIjANBgkqhkiG9w0BAQEFAAOCAQ8A" + "A" * 360
+    zone: Zone = {}
+    for domain in domains:
+        zone.update(default_zone(domain))
+        zone[(f"_dmarc.{domain}", "TXT")] = [
+            f'"v=DMARC1; p=reject; rua=mailto:dmarc@{domain}"'
+        ]
+        for selector in selectors:
+            zone[(f"{selector}._domainkey.{domain}", "TXT")] = [
+                f'"v=DKIM1; k=rsa; p={key}"'
+            ]
+        zone[(f"_mta-sts.{domain}", "TXT")] = ['"v=STSv1; id=20250101T000000"']
+        zone[(f"_smtp._tls.{domain}", "TXT")] = [
+            f'"v=TLSRPTv1; rua=mailto:tlsrpt@{domain}"'
+        ]
+        zone[(f"default._bimi.{domain}", "TXT")] = [
+            f'"v=BIMI1; l=https://{domain}/logo.svg; a=https://{domain}/vmc.pem"'
+        ]
+    return zone
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: "FakeDoHServer"
+
+    def do_GET(self) -> None:
+        url = urlparse(self.path)
+        params = parse_qs(url.query)
+        name = params.get("name", [""])[0].rstrip(".").lower()
+        rtype = params.get("type", ["A"])[0].upper()
+
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        self.server.queries.append((name, rtype))
+
+        answers = self.server.zone.get((name, rtype))
+        status = 0 if answers else 3
+        if any(
+            name == zone or name.endswith("." + zone) for zone in self.server.failing
+        ):
+            answers, status = None, 2
+        body: Dict = {"Status": status, "Question": [{"name": name}]}
+        if answers:
+            body["Answer"] = [
+                {"name": name, "type": RTYPES.get(rtype, 0), "TTL": 300, "data": a}
+                for a in answers
+            ]
+
+        payload = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/dns-json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args) -> None:
+        pass
+
+
+class FakeDoHServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128  # concurrent resolvers open many connections
+
+    def __init__(
+        self,
+        zone: Optional[Zone] = None,
+        latency: float = 0.0,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        failing=(),
+    ):
+        super().__init__((host, port), _Handler)
+        self.zone = zone if zone is not None else default_zone()
+        self.latency = latency
+        self.failing = set(failing)
+        self.queries: List[Tuple[str, str]] = []
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[0], self.server_address[1]
+        if isinstance(host, bytes):
+            host = host.decode()
+        return f"http://{host}:{port}/resolve"
+
+    def start(self) -> "FakeDoHServer":
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self) -> "FakeDoHServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
@@ -0,0 +1,293 @@
+# benchmarks/fake_imap.py
+"""
+A tiny in-process IMAP4rev1 server for benchmarks and tests.
+
+It speaks just enough of RFC 3501 for imaplib: LOGIN, SELECT, SEARCH,
+FETCH, UID SEARCH/FETCH, CLOSE and LOGOUT over plain TCP. Messages live in
+memory; optional per-command latency simulates a remote provider.
+"""
+import email
+import re
+import socketserver
+import threading
+import time
+from datetime import date
+from email.utils import parsedate_to_datetime
+from typing import List, Optional
+
+_MONTHS = [
+    "Jan",
+    "Feb",
+    "Mar",
+    "Apr",
+    "May",
+    "Jun",
+    "Jul",
+    "Aug",
+    "Sep",
+    "Oct",
+    "Nov",
+    "Dec",
+]
+
+_TOKEN_RE = re.compile(r'\(|\)|"(?:[^"\\]|\\.)*"|[^\s()]+')
+
+
+class FakeMessage:
+    def __init__(self, uid: int, raw: bytes):
+        self.uid = uid
+        self.raw = raw
+        msg = email.message_from_bytes(raw)
+        self.subject = str(msg.get("Subject", ""))
+        self.headers = {k.lower(): str(v) for k, v in msg.items()}
+        try:
+            self.date: Optional[date] = parsedate_to_datetime(msg["Date"]).date()
+        except Exception:
+            self.date = None
+
+
+def _parse_imap_date(value: str) -> date:
+    day, month, year = value.strip('"').split("-")
+    return date(int(year), _MONTHS.index(month.title()) + 1, int(day))
+
+
+def _in_set(value: int, spec: str, highest: int) -> bool:
+    """Checks a value against an IMAP sequence set such as '1:5,9,12:*'."""
+    for part in spec.split(","):
+        if ":" in part:
+            lo_s, hi_s = part.split(":", 1)
+            lo = highest if lo_s == "*" else int(lo_s)
+            hi = highest if hi_s == "*" else int(hi_s)
+            if min(lo, hi) <= value <= max(lo, hi):
+                return True
+        elif (highest if part == "*" else int(part)) == value:
+            return True
+    return False
+
+
+class _Search:
+    """Evaluates the subset of SEARCH keys that mailops sends."""
+
+    def __init__(self, tokens: List[str], messages: List[FakeMessage]):
+        self.tokens = tokens
+        self.pos = 0
+        self.max_uid = max((m.uid for m in messages), default=0)
+
+    def _next(self) -> str:
+        token = self.tokens[self.pos]
+        self.pos += 1
+        return token
+
+    def matcher(self):
+        checks = []
+        while self.pos < len(self.tokens) and self.tokens[self.pos] != ")":
+            checks.append(self._key())
+        return lambda m, seq: all(check(m, seq) for check in checks)
+
+    def _key(self):
+        token = self._next()
+        key = token.upper()
+        if token == "(":
+            inner = self.matcher()
+            self._next()  # closing paren
+            return inner
+        if key == "ALL":
+            return lambda m, seq: True
+        if key == "OR":
+            left, right = self._key(), self._key()
+            return lambda m, seq: left(m, seq) or right(m, seq)
+        if key == "NOT":
+            inner = self._key()
+            return lambda m, seq: not inner(m, seq)
+        if key == "SUBJECT":
+            needle = self._next().strip('"').lower()
+            return lambda m, seq: needle in m.subject.lower()
+        if key == "HEADER":
+            field = self._next().strip('"').lower()
+            needle = self._next().strip('"').lower()
+            return lambda m, seq: (
+                field in m.headers and needle in m.headers[field].lower()
+            )
+        if key in ("SINCE", "SENTSINCE"):
+            since = _parse_imap_date(self._next())
+            return lambda m, seq: m.date is not None and m.date >= since
+        if key in ("BEFORE", "SENTBEFORE"):
+            before = _parse_imap_date(self._next())
+            return lambda m, seq: m.date is not None and m.date < before
+        if key == "UID":
+            spec = self._next()
+            return lambda m, seq: _in_set(m.uid, spec, self.max_uid)
+        # Bare sequence set
+        return lambda m, seq: _in_set(seq, token, self.max_uid)
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    server: "FakeIMAPServer"
+
+    # Buffer each response and flush once per command, like a real server
+    wbufsize = 65536
+    disable_nagle_algorithm = True
+
+    def send(self, line: str) -> None:
+        self.wfile.write(line.encode("utf-8") + b"\r\n")
+
+    def handle(self) -> None:
+        srv = self.server
+        with srv.lock:
+            srv.active += 1
+            srv.peak = max(srv.peak, srv.active)
+        try:
+            self.serve()
+        finally:
+            with srv.lock:
+                srv.active -= 1
+
+    def serve(self) -> None:
+        self.selected = False
+        self.send("* OK [CAPABILITY IMAP4rev1 UIDPLUS] mailops fake IMAP ready")
+        self.wfile.flush()
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            if self.server.latency:
+                time.sleep(self.server.latency)
+            tag, _, rest = line.decode("utf-8", "replace").strip().partition(" ")
+            command, _, args = rest.partition(" ")
+            self.server.commands.append(command.upper())
+            keep_open = self.dispatch(tag, command.upper(), args)
+            self.wfile.flush()
+            if not keep_open:
+                return
+
+    def dispatch(self, tag: str, command: str, args: str) -> bool:
+        srv = self.server
+        if srv.drop_after is not None and len(srv.commands) > srv.drop_after:
+            srv.drop_after = None
+            return False  # simulate a dropped connection
+
+        if command == "CAPABILITY":
+            self.send("* CAPABILITY IMAP4rev1 UIDPLUS")
+        elif command == "NOOP":
+            pass
+        elif command == "LOGIN":
+            user, password = [t.strip('"') for t in _TOKEN_RE.findall(args)][:2]
+            if (user, password) != (srv.username, srv.password):
+                self.send(f"{tag} NO [AUTHENTICATIONFAILED] Invalid credentials")
+                return True
+            if srv.max_connections and srv.active > srv.max_connections:
+                self.send(f"{tag} NO [LIMIT] Too many simultaneous connections")
+                return True
+        elif command in ("SELECT", "EXAMINE"):
+            self.selected = True
+            self.send(f"* {len(srv.messages)} EXISTS")
+            self.send("* 0 RECENT")
+            self.send(f"* OK [UIDVALIDITY {srv.uidvalidity}] UIDs valid")
+            self.send(f"* OK [UIDNEXT {srv.uidnext}] Predicted next UID")
+            self.send(f"{tag} OK [READ-WRITE] {command} completed")
+            return True
+        elif command == "SEARCH":
+            self.search(args, use_uid=False)
+        elif command == "FETCH":
+            self.fetch(args, use_uid=False)
+        elif command == "UID":
+            sub, _, sub_args = args.partition(" ")
+            if sub.upper() == "SEARCH":
+                self.search(sub_args, use_uid=True)
+            elif sub.upper() == "FETCH":
+                self.fetch(sub_args, use_uid=True)
+            else:
+                self.send(f"{tag} BAD Unsupported UID command")
+                return True
+        elif command == "CLOSE":
+            self.selected = False
+        elif command == "LOGOUT":
+            self.send("* BYE logging out")
+            self.send(f"{tag} OK LOGOUT completed")
+            return False
+        else:
+            self.send(f"{tag} BAD Unknown command {command}")
+            return True
+
+        self.send(f"{tag} OK {command} completed")
+        return True
+
+    def search(self, args: str, use_uid: bool) -> None:
+        tokens = _TOKEN_RE.findall(args)
+        if tokens and tokens[0].upper() == "CHARSET":
+            tokens = tokens[2:]
+        match = _Search(tokens, self.server.messages).matcher()
+        hits = [
+            str(m.uid if use_uid else seq)
+            for seq, m in enumerate(self.server.messages, 1)
+            if match(m, seq)
+        ]
+        self.send("* SEARCH" + ("" if not hits else " " + " ".join(hits)))
+
+    def fetch(self, args: str, use_uid: bool) -> None:
+        spec, _, items = args.partition(" ")
+        messages = self.server.messages
+        highest = messages[-1].uid if use_uid and messages else len(messages)
+        for seq, m in enumerate(messages, 1):
+            if not _in_set(m.uid if use_uid else seq, spec, highest):
+                continue
+            head = f"* {seq} FETCH (UID {m.uid} BODY[] {{{len(m.raw)}}}\r\n"
+            self.wfile.write(head.encode("ascii") + m.raw + b")\r\n")
+            self.server.bytes_sent += len(m.raw)
+
+
+class FakeIMAPServer(socketserver.ThreadingTCPServer):
+    """
+    Serves a fixed list of raw RFC 822 messages from a single mailbox.
+    Use as a context manager; `address` gives the (host, port) to connect to.
+    """
+
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(
+        self,
+        messages: List[bytes],
+        username: str = "user@example.com",
+        password: str = "secret",
+        latency: float = 0.0,
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ):
+        super().__init__((host, port), _Handler)
+        self.username = username
+        self.password = password
+        self.latency = latency
+        self.uidvalidity = 1
+        self.messages = [FakeMessage(i, raw) for i, raw in enumerate(messages, 1)]
+        self.uidnext = len(self.messages) + 1
+        self.commands: List[str] = []
+        self.bytes_sent = 0
+        # Close the connection once this many commands have been seen
+        self.drop_after: Optional[int] = None
+        # Refuse LOGIN beyond this many concurrent connections, like providers
+        self.max_connections: Optional[int] = None
+        self.active = 0
+        self.peak = 0  # most connections open at once
+        self.lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def address(self):
+        return self.server_address[0], self.server_address[1]
+
+    def start(self) -> "FakeIMAPServer":
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self) -> "FakeIMAPServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
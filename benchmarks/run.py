@@ -0,0 +1,432 @@
+# benchmarks/run.py
+"""
+Timed scenarios for the mailops hot paths.
+
+    python -m benchmarks                          # run everything
+    python -m benchmarks parse --records 500      # one scenario
+    python -m benchmarks --output bench.json      # save results
+    python -m benchmarks --compare bench.json     # fail on regressions
+
+Every scenario runs against local stand-ins (synthetic corpus, fake IMAP,
+fake DoH), so numbers are comparable between runs and releases.
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict
+
+from benchmarks import corpus
+from benchmarks.fake_doh import FakeDoHServer, audit_zone, default_zone
+from benchmarks.fake_imap import FakeIMAPServer
+from mailops import (
+    asn,
+    blacklist_monitor,
+    dmarc_parser,
+    dns_audit,
+    doh,
+    imap_fetcher,
+    scheduler,
+    spf_check,
+    tlsrpt,
+    ui,
+)
+
+SCENARIOS: Dict[str, Callable] = {}
+
+
+def scenario(name: str):
+    def register(fn: Callable) -> Callable:
+        SCENARIOS[name] = fn
+        return fn
+
+    return register
+
+
+@contextlib.contextmanager
+def quiet():
+    """Discards console output so terminal speed doesn't skew timings."""
+    with open(os.devnull, "w") as sink, contextlib.redirect_stdout(sink):
+        yield
+
+
+def best_of(repeat: int, run: Callable[[], int]):
+    """Runs a callable `repeat` times; returns (items, fastest seconds)."""
+    best = None
+    items = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        items = run()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return items, best or 0.0
+
+
+def warm_ptr_cache(args) -> None:
+    # parse_dmarc_xml does a PTR lookup per new IP; pre-seed the cache so the
+    # parse scenario measures parsing rather than the local resolver.
+    for ip in corpus.sender_pool(args.senders, args.seed):
+        dmarc_parser.IP_CACHE[ip] = f"bench-{ip.replace('.', '-')}.example.net"
+
+
+# --- Scenarios ---
+
+
+@scenario("parse")
+def bench_parse(args) -> Dict:
+    """parse_dmarc_xml over an on-disk corpus."""
+    warm_ptr_cache(args)
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = corpus.write_corpus(
+            tmp,
+            count=args.reports,
+            records_per_report=args.records,
+            compression=args.compression,
+            seed=args.seed,
+            senders=args.senders,
+        )
+
+        def run() -> int:
+            total = 0
+            for path in paths:
+                total += len(dmarc_parser.parse_dmarc_xml(path))
+            return total
+
+        with quiet():
+            items, seconds = best_of(args.repeat, run)
+    return {"items": items, "unit": "records", "seconds": seconds}
+
+
+@scenario("tlsrpt")
+def bench_tlsrpt(args) -> Dict:
+    """parse_tlsrpt over an on-disk corpus of gzipped TLS reports."""
+    with tempfile.TemporaryDirectory() as tmp:
+        reports = corpus.generate_tls_reports(
+            args.reports, args.records, seed=args.seed, senders=args.senders
+        )
+        paths = corpus.write_corpus(tmp, reports=reports)
+
+        def run() -> int:
+            total = 0
+            for path in paths:
+                total += len(tlsrpt.parse_tlsrpt(path))
+            return total
+
+        with quiet():
+            items, seconds = best_of(args.repeat, run)
+    return {"items": items, "unit": "records", "seconds": seconds}
+
+
+@scenario("fetch")
+def bench_fetch(args) -> Dict:
+    """fetch_reports against the fake IMAP server."""
+    messages = [
+        corpus.build_message(r)
+        for r in corpus.generate_reports(
+            count=args.messages,
+            records_per_report=args.records,
+            compression=args.compression,
+            seed=args.seed,
+            senders=args.senders,
+        )
+    ]
+    with FakeIMAPServer(messages, latency=args.imap_latency) as server:
+        host, port = server.address
+
+        def run() -> int:
+            with tempfile.TemporaryDirectory() as tmp:
+                imap_fetcher.fetch_reports(
+                    server.username,
+                    server.password,
+                    host,
+                    port=port,
+                    use_ssl=False,
+                    output_dir=tmp,
+                    connections=args.connections,
+                )
+            return len(messages)
+
+        with quiet():
+            items, seconds = best_of(args.repeat, run)
+    return {"items": items, "unit": "messages", "seconds": seconds}
+
+
+@scenario("blacklist")
+def bench_blacklist(args) -> Dict:
+    """run_check (all RBL providers) against the fake DoH endpoint."""
+    ips = corpus.sender_pool(args.lookups, args.seed)
+    zone = default_zone(listed_ips=ips[::10])
+    with FakeDoHServer(zone, latency=args.dns_latency) as server:
+        with _doh_endpoint(server.url, args.dns_rate), quiet():
+
+            def run() -> int:
+                for ip in ips:
+                    blacklist_monitor.run_check(ip)
+                return len(ips)
+
+            items, seconds = best_of(args.repeat, run)
+    return {"items": items, "unit": "checks", "seconds": seconds}
+
+
+@scenario("spf")
+def bench_spf(args) -> Dict:
+    """fetch_spf_record against the fake DoH endpoint."""
+    with FakeDoHServer(latency=args.dns_latency) as server:
+        with _doh_endpoint(server.url, args.dns_rate), quiet():
+
+            def run() -> int:
+                for _ in range(args.lookups):
+                    spf_check.fetch_spf_record("example.com")
+                return args.lookups
+
+            items, seconds = best_of(args.repeat, run)
+    return {"items": items, "unit": "lookups", "seconds": seconds}
+
+
+@scenario("audit")
+def bench_audit(args) -> Dict:
+    """dns_audit.audit over a portfolio of domains against the fake DoH endpoint."""
+    domains = [f"customer{i}.example" for i in range(args.domains)]
+    with FakeDoHServer(audit_zone(domains), latency=args.dns_latency) as server:
+        with _doh_endpoint(server.url, args.dns_rate), quiet():
+
+            def run() -> int:
+                dns_audit.audit(domains, selectors=["default"])
+                return len(domains)
+
+            items, seconds = best_of(args.repeat, run)
+    return {"items": items, "unit": "domains", "seconds": seconds}
+
+
+@scenario("render")
+def bench_render(args) -> Dict:
+    """Console table plus tsv/json/jsonl rendering of parsed records."""
+    rng = random.Random(args.seed)
+    ips = corpus.sender_pool(args.senders, args.seed)
+    statuses = [("OK", ui.Colors.GREEN), ("INVESTIGATE", ui.Colors.RED)]
+    rows = []
+    for i in range(args.rows):
+        status_msg, status_color = rng.choice(statuses)
+        rows.append(
+            {
+                "org_name": "google.com",
+                "date": "2024-01-01",
+                "source_ip": rng.choice(ips),
+                "hostname": f"mail-{i % 97}.example.net",
+                "count": str(rng.randint(1, 500)),
+                "spf": "pass",
+                "dkim": "fail",
+                "disposition": "none",
+                "status_msg": status_msg,
+                "status_color": status_color,
+                "file": f"report-{i // 500}.xml",
+            }
+        )
+
+    timings = {}
+    with open(os.devnull, "w") as sink:
+        for fmt in dmarc_parser.OUTPUT_FORMATS:
+            _, timings[fmt] = best_of(
+                args.repeat,
+                lambda: dmarc_parser.render_records(rows, fmt, sink) or len(rows),
+            )
+    return {
+        "items": len(rows),
+        "unit": "rows",
+        "seconds": timings["table"],
+        "formats": {fmt: len(rows) / t for fmt, t in timings.items() if t},
+    }
+
+
+@scenario("asn")
+def bench_asn(args) -> Dict:
+    """ASN lookups against a synthetic prefix dataset (cached index)."""
+    rng = random.Random(args.seed)
+    nets = [ip.rsplit(".", 1)[0] for ip in corpus.sender_pool(args.senders, args.seed)]
+    # Mostly distinct addresses, so the per-IP memo doesn't hide the search
+    ips = [f"{rng.choice(nets)}.{i % 250 + 1}" for i in range(args.rows)]
+    with tempfile.TemporaryDirectory() as tmp:
+        path = corpus.write_asn_dataset(
+            os.path.join(tmp, "asn.tsv"), args.prefixes, args.seed
+        )
+        start = time.perf_counter()
+        asn.AsnDatabase.open(path)  # builds the .idx cache
+        build_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        db = asn.AsnDatabase.open(path)
+        load_seconds = time.perf_counter() - start
+
+        def run() -> int:
+            db._cache.clear()
+            found = 0
+            for ip in ips:
+                if db.lookup(ip):
+                    found += 1
+            return found
+
+        items, seconds = best_of(args.repeat, run)
+    return {
+        "items": len(ips),
+        "unit": "lookups",
+        "seconds": seconds,
+        "matched": items,
+        "build_ms": build_seconds * 1000,
+        "load_ms": load_seconds * 1000,
+    }
+
+
+@scenario("startup")
+def bench_startup(args) -> Dict:
+    """Cold start of `python -m mailops --help` plus the import-time cost."""
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, PYTHONPATH=root, PYTHONDONTWRITEBYTECODE="")
+    command = [sys.executable, "-m", "mailops", "--help"]
+
+    def run() -> int:
+        for _ in range(args.starts):
+            subprocess.run(command, env=env, stdout=subprocess.DEVNULL, check=True)
+        return args.starts
+
+    items, seconds = best_of(args.repeat, run)
+    return {
+        "items": items,
+        "unit": "starts",
+        "seconds": seconds,
+        "import_ms": import_time_ms("mailops.cli", env),
+    }
+
+
+def import_time_ms(module: str, env: Dict) -> float:
+    """Cumulative import time of a module as reported by -X importtime."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    for line in proc.stderr.splitlines():
+        parts = [p.strip() for p in line.split("|")]
+        if len(parts) == 3 and parts[2] == module:
+            return int(parts[1]) / 1000
+    return 0.0
+
+
+@contextlib.contextmanager
+def _doh_endpoint(url: str, rate: float):
+    previous = doh.DOH_URL
+    doh.DOH_URL = url
+    scheduler.configure(rate=rate)
+    try:
+        yield
+    finally:
+        doh.DOH_URL = previous
+        scheduler.configure()
+
+
+# --- Reporting ---
+
+
+def compare(results: Dict, baseline_path: str, tolerance: float) -> int:
+    """Prints throughput deltas vs a saved run; returns the regression count."""
+    with open(baseline_path) as f:
+        baseline = json.load(f)["scenarios"]
+
+    regressions = 0
+    for name, current in results["scenarios"].items():
+        old = baseline.get(name)
+        if not old or not old.get("throughput"):
+            continue
+        change = current["throughput"] / old["throughput"] - 1
+        flag = ""
+        if change < -tolerance:
+            flag = "  <-- REGRESSION"
+            regressions += 1
+        print(f"{name:<12} {change:+7.1%} vs baseline{flag}", file=sys.stderr)
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the mailops hot paths.")
+    parser.add_argument(
+        "scenarios", nargs="*", help=f"One of {', '.join(SCENARIOS)} (default: all)"
+    )
+    parser.add_argument("--reports", type=int, default=50, help="Reports to parse")
+    parser.add_argument("--records", type=int, default=200, help="Records/report")
+    parser.add_argument("--messages", type=int, default=50, help="IMAP messages")
+    parser.add_argument("--lookups", type=int, default=50, help="DNS lookups/checks")
+    parser.add_argument(
+        "--compression", choices=corpus.COMPRESSIONS + ("mixed",), default="mixed"
+    )
+    parser.add_argument("--domains", type=int, default=20, help="Domains to audit")
+    parser.add_argument("--senders", type=int, default=200, help="Distinct IPs")
+    parser.add_argument("--rows", type=int, default=100000, help="Rows to render")
+    parser.add_argument("--starts", type=int, default=10, help="CLI cold starts")
+    parser.add_argument(
+        "--prefixes", type=int, default=200000, help="ASN dataset ranges"
+    )
+    parser.add_argument("--dns-latency", type=float, default=0.002, help="Seconds")
+    parser.add_argument(
+        "--dns-rate", type=float, default=0, help="DNS queries/s cap (0 = none)"
+    )
+    parser.add_argument("--imap-latency", type=float, default=0.0, help="Seconds")
+    parser.add_argument("--connections", type=int, default=1, help="IMAP connections")
+    parser.add_argument("--repeat", type=int, default=3, help="Best of N runs")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write results JSON to this file")
+    parser.add_argument("--compare", help="Baseline results JSON to compare with")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.15,
+        help="Allowed throughput drop vs baseline (default: 0.15 = 15%%)",
+    )
+    args = parser.parse_args(argv)
+    unknown = [name for name in args.scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenario: {', '.join(unknown)}")
+
+    results: Dict = {
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "params": {
+            k: v
+            for k, v in vars(args).items()
+            if k not in ("scenarios", "output", "compare")
+        },
+        "scenarios": {},
+    }
+
+    for name in args.scenarios or list(SCENARIOS):
+        result = SCENARIOS[name](args)
+        seconds = result["seconds"]
+        result["throughput"] = result["items"] / seconds if seconds else 0.0
+        results["scenarios"][name] = result
+        print(
+            f"{name:<12} {result['items']:>8} {result['unit']:<9} "
+            f"{seconds:8.3f}s  {result['throughput']:12.1f} {result['unit']}/s",
+            file=sys.stderr,
+        )
+
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    if args.compare:
+        return 1 if compare(results, args.compare, args.tolerance) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
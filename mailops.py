@@ -3,16 +3,11 @@ import configparser
 import getpass
 import os
 import sys
+from datetime import datetime
 
-# Import your tool modules
-from mailops import (
-    blacklist_monitor,
-    dkim_gen,
-    dmarc_parser,
-    imap_fetcher,
-    spf_check,
-    ui,
-)
+# Tool modules are imported inside each cmd_* handler so that lightweight
+# commands (and --help) don't pay for imaplib, xml, urllib, subprocess...
+from mailops import ui
 
 
 def load_config():
@@ -23,6 +18,8 @@ def load_config():
 
 def cmd_fetch(args, config):
     """Handles the IMAP fetching workflow."""
+    from mailops import archive, dmarc_parser, imap_fetcher, tlsrpt, trends
+
     email_addr = args.email or config.get("imap", "email", fallback=None)
     server = args.server or config.get("imap", "server", fallback="imap.mail.me.com")
 
@@ -45,11 +42,36 @@ def cmd_fetch(args, config):
         except KeyboardInterrupt:
             return
 
-    imap_fetcher.fetch_reports(email_addr, pwd, server)
+    report_filter = archive.ReportFilter.from_args(args)
+    if report_filter:
+        ui.print_info(f"Only fetching reports {report_filter.describe()}")
+
+    # New reports update the sender baselines (and metrics) as they arrive
+    output_dir = config.get("general", "download_dir", fallback="./dmarc_reports")
+    engine = trends.TrendEngine.for_archive(output_dir)
+    consumers = [trends.watcher(engine, args.metrics)]
+    tls_consumers = [tlsrpt.warn_failures]
+    if args.metrics:
+        consumers.append(args.metrics.record_report)
+        tls_consumers.append(args.metrics.record_tls_report)
+    connections = args.connections or config.getint("imap", "connections", fallback=1)
+    imap_fetcher.fetch_reports(
+        email_addr,
+        pwd,
+        server,
+        output_dir=output_dir,
+        on_saved=dmarc_parser.ingest_hook(*consumers, tls_consumers=tls_consumers),
+        report_filter=report_filter,
+        resume=not args.rescan,
+        connections=connections,
+    )
+    engine.save()
 
 
 def cmd_report(args, config):
     """Handles DMARC analysis."""
+    from mailops import archive, dedup, dmarc_parser
+
     target = args.path or config.get(
         "general", "download_dir", fallback="./dmarc_reports"
     )
@@ -59,65 +81,186 @@ def cmd_report(args, config):
         return
 
     ui.print_info(f"Analyzing reports in: {target}")
+    report_filter = archive.ReportFilter.from_args(args)
+    if report_filter:
+        ui.print_info(f"Filter: {report_filter.describe()}")
 
-    all_records = []
-    files = []
+    if args.reindex and os.path.isdir(target):
+        count = archive.ArchiveIndex(target).rebuild()
+        ui.print_info(f"Indexed {count} reports.")
 
-    if os.path.isfile(target):
-        files.append(target)
-    elif os.path.isdir(target):
-        for root, _, filenames in os.walk(target):
-            for f in filenames:
-                if f.lower().endswith((".xml", ".gz", ".zip")):
-                    files.append(os.path.join(root, f))
+    all_records = []
+    # From the archive index if there is one; otherwise date folders
+    # outside --since/--until are never listed
+    files = archive.find_report_files(target, report_filter)
 
     if not files:
         ui.print_warning("No DMARC files found.")
         return
 
+    # Same report archived twice (other mailbox, re-send): count it once
+    index = dedup.ReportIndex()
     for f in files:
-        records = dmarc_parser.parse_dmarc_xml(f)
+        records = dmarc_parser.parse_dmarc_xml(
+            f, index=index, report_filter=report_filter
+        )
         if records:
             all_records.extend(records)
+    if index.duplicates:
+        ui.print_info(f"Skipped {index.duplicates} duplicate reports.")
 
     if args.alerts:
         ui.print_warning("Filtering for failures/investigations only...")
         all_records = [r for r in all_records if r.get("status_msg", "OK") != "OK"]
 
     # Output Routing
-    if args.html:
+    if args.by_network:
+        rows = dmarc_parser.summarize_networks(all_records)
+        dmarc_parser.render_networks(rows, args.format)
+    elif args.html:
         pass
     elif args.csv:
         dmarc_parser.save_to_csv(all_records, args.csv)
     else:
-        dmarc_parser.print_to_console(all_records)
+        dmarc_parser.render_records(all_records, args.format)
+
+
+def cmd_tls(args, config):
+    """Summarizes SMTP TLS reports: failed sessions per receiving MTA."""
+    from mailops import archive, dedup, tlsrpt
+
+    target = args.path or config.get(
+        "general", "download_dir", fallback="./dmarc_reports"
+    )
+    if not os.path.exists(target):
+        ui.print_warning(f"Path not found: {target}")
+        return
+
+    report_filter = archive.ReportFilter.from_args(args)
+    files = archive.find_report_files(target, report_filter, kind="tlsrpt")
+    if not files:
+        ui.print_warning("No TLS reports found.")
+        return
+
+    index = dedup.ReportIndex()
+    records = []
+    for f in files:
+        records.extend(
+            tlsrpt.parse_tlsrpt(f, index=index, report_filter=report_filter)
+        )
+    ok, failed = tlsrpt.totals(records)
+    reports = len({r["file"] for r in records})
+    ui.print_info(f"{reports} TLS reports: {ok} successful, {failed} failed sessions.")
+    tlsrpt.render_mtas(tlsrpt.summarize_mtas(records), args.format)
+
+
+def cmd_trends(args, config):
+    """Shows recent anomalies, or seeds the baselines from stored reports."""
+    from mailops import archive, dmarc_parser, trends
+
+    target = config.get("general", "download_dir", fallback="./dmarc_reports")
+    engine = trends.TrendEngine.for_archive(target)
+
+    if args.ingest:
+        # Oldest first, so the baselines evolve as they would have live
+        files = archive.find_report_files(args.ingest)
+        begins = {}
+        for f in files:
+            meta = dmarc_parser.read_report_metadata(f) or {}
+            begins[f] = int(meta.get("begin") or 0)
+        files.sort(key=begins.get)
+        raised = 0
+        for f in files:
+            records = dmarc_parser.parse_dmarc_xml(f, resolve_hosts=False)
+            raised += len(engine.ingest(records))
+        engine.save()
+        ui.print_success(
+            f"Ingested {len(files)} reports: {len(engine.senders)} senders tracked, "
+            f"{raised} anomalies."
+        )
+        return
+
+    alerts = engine.alerts[-args.last :]
+    if not alerts:
+        ui.print_info("No anomalies recorded.")
+        return
+    ui.print_header(f"ANOMALIES (last {len(alerts)})")
+    for a in alerts:
+        print(trends.describe(a))
 
 
 def cmd_check(args, config):
-    """Runs a health check (SPF + Blacklist)."""
-    domain = args.domain or config.get("monitor", "domain", fallback=None)
-    if not domain:
+    """Runs a health check (mail DNS audit + Blacklist)."""
+    from mailops import blacklist_monitor, dkim_gen, dns_audit
+
+    domains = args.domain
+    if not domains:
+        configured = config.get("monitor", "domain", fallback="")
+        domains = [d.strip() for d in configured.split(",") if d.strip()]
+    if not domains:
         ui.print_error("Domain not set in config.ini or argument.")
         return
 
-    ui.print_header(f"HEALTH CHECK: {domain}")
+    ui.print_header(f"HEALTH CHECK: {', '.join(domains)}")
 
-    ui.print_info("Checking SPF Record...")
-    record = spf_check.fetch_spf_record(domain)
-    if record:
-        spf_check.analyze_spf(record)
+    # DKIM selectors default to the keys created by `mailops.py dkim`
+    selectors = args.selector or dkim_gen.find_selectors(args.keys_dir)
+    ui.print_info("Checking SPF, DMARC, DKIM, MTA-STS, TLS-RPT and BIMI...")
+    findings = dns_audit.audit(domains, selectors, key_dir=args.keys_dir)
+    dns_audit.print_findings(findings)
+    if args.metrics:
+        args.metrics.record_audit(findings)
 
-    print("")  # Spacer
     ui.print_info("Checking Blacklist Status...")
-    blacklist_monitor.run_check(domain)
+    for result in blacklist_monitor.check_many(domains):
+        print("")  # Spacer
+        blacklist_monitor.print_result(result)
+        if result.ip and args.metrics:
+            args.metrics.record_blacklist(result.ip, result.results)
 
 
 def cmd_dkim(args, config):
     """Generates DKIM keys."""
+    from mailops import dkim_gen
+
     domain = args.domain or config.get("monitor", "domain", fallback="example.com")
     dkim_gen.generate_and_print(args.selector, domain)
 
 
+def cmd_metrics(args, config):
+    """Prints or serves the Prometheus metrics collected by earlier runs."""
+    from mailops import metrics
+
+    if not args.metrics:
+        ui.print_error("Set --metrics-file or [metrics] textfile in config.ini.")
+        return
+    if args.listen:
+        host, _, port = args.listen.rpartition(":")
+        metrics.serve(args.metrics.textfile, host or "127.0.0.1", int(port))
+    else:
+        print(args.metrics.render(), end="")
+
+
+def _day(text):
+    try:
+        return datetime.strptime(text, "%Y-%m-%d").date()
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected YYYY-MM-DD, got {text!r}")
+
+
+def add_filter_args(subparser):
+    """--since/--until/--domain/--org, shared by fetch and report."""
+    day = {"metavar": "YYYY-MM-DD", "type": _day}
+    subparser.add_argument("--since", help="Reports covering this day or later", **day)
+    subparser.add_argument("--until", help="Reports up to this day", **day)
+    subparser.add_argument(
+        "--domain", action="append", help="Policy domain (repeatable)"
+    )
+    subparser.add_argument(
+        "--org", action="append", help="Reporting org, e.g. google (repeatable)"
+    )
+
+
 def main():
     # --- Custom Help Text with Examples ---
     epilog_text = f"""
@@ -131,10 +274,13 @@ def main():
   {ui.Colors.BOLD}3. Show ONLY failures (Investigate/Blocked):{ui.Colors.RESET}
      python mailops.py report --alerts
 
-  {ui.Colors.BOLD}4. Check your Domain Health (SPF + Blacklists):{ui.Colors.RESET}
-     python mailops.py check beaubremer.com
+  {ui.Colors.BOLD}4. One customer's reports for a month:{ui.Colors.RESET}
+     python mailops.py report --domain example.com --since 2025-11-01 --until 2025-11-30
+
+  {ui.Colors.BOLD}5. Check your Domain Health (mail DNS + Blacklists):{ui.Colors.RESET}
+     python mailops.py check beaubremer.com example.org
 
-  {ui.Colors.BOLD}5. Fetch new reports from email:{ui.Colors.RESET}
+  {ui.Colors.BOLD}6. Fetch new reports from email:{ui.Colors.RESET}
      python mailops.py fetch
 
 {ui.Colors.HEADER}LEGEND (for Report):{ui.Colors.RESET}
@@ -149,12 +295,51 @@ def main():
         epilog=epilog_text,
     )
 
+    parser.add_argument(
+        "--profile", action="store_true", help="Print a timing breakdown to stderr"
+    )
+    parser.add_argument(
+        "--profile-json", metavar="FILE", help="Write the timing breakdown as JSON"
+    )
+    parser.add_argument(
+        "--metrics-file",
+        metavar="FILE",
+        help="Update a Prometheus textfile-collector file (e.g. mailops.prom)",
+    )
+    parser.add_argument(
+        "--no-color", action="store_true", help="Disable ANSI colors in output"
+    )
+    parser.add_argument(
+        "--asn-db",
+        metavar="FILE",
+        help="Offline IP-to-ASN dataset (iptoasn/CIDR/pfx2as) for enrichment",
+    )
+    parser.add_argument(
+        "--dns-rate",
+        type=float,
+        metavar="QPS",
+        help="Cap DNS queries per second for each resolver (0 = no cap)",
+    )
+
     subparsers = parser.add_subparsers(dest="command", help="Command to run")
 
     # 1. Fetch
     fetch_p = subparsers.add_parser("fetch", help="Download reports from email")
     fetch_p.add_argument("--email", help="Override configured email")
     fetch_p.add_argument("--server", help="Override IMAP server")
+    fetch_p.add_argument("--days", type=int, help="Only the last N days")
+    fetch_p.add_argument(
+        "--rescan",
+        action="store_true",
+        help="Search the whole folder, ignoring where the last fetch stopped",
+    )
+    fetch_p.add_argument(
+        "--connections",
+        type=int,
+        metavar="N",
+        help="Parallel IMAP connections for large backfills (default: 1)",
+    )
+    add_filter_args(fetch_p)
 
     # 2. Report
     report_p = subparsers.add_parser("report", help="Analyze DMARC data")
@@ -164,30 +349,129 @@ def main():
     report_p.add_argument("--csv", help="Export to CSV")
     report_p.add_argument("--html", help="Export to HTML Dashboard")
     report_p.add_argument("--alerts", action="store_true", help="Show failures only")
+    report_p.add_argument(
+        "--by-network", action="store_true", help="Summarize messages per ASN"
+    )
+    report_p.add_argument(
+        "--reindex",
+        action="store_true",
+        help="Rebuild the archive index (after adding or removing files by hand)",
+    )
+    report_p.add_argument(
+        "--format",
+        choices=["table", "tsv", "json", "jsonl"],
+        default="table",
+        help="Output format (default: table)",
+    )
+    add_filter_args(report_p)
 
     # 3. Check (Health)
-    check_p = subparsers.add_parser("check", help="Run SPF & Blacklist audit")
-    check_p.add_argument("domain", nargs="?", help="Domain to audit")
+    check_p = subparsers.add_parser("check", help="Run mail DNS & Blacklist audit")
+    check_p.add_argument("domain", nargs="*", help="Domains to audit")
+    check_p.add_argument(
+        "--selector",
+        action="append",
+        help="DKIM selector to check (repeatable; default: *.private in --keys-dir)",
+    )
+    check_p.add_argument(
+        "--keys-dir", default=".", help="Where dkim keys were generated (default: .)"
+    )
 
     # 4. DKIM
     dkim_p = subparsers.add_parser("dkim", help="Generate DKIM keys")
     dkim_p.add_argument("selector", help="Selector name (e.g. mail, k1)")
     dkim_p.add_argument("--domain", help="Override domain")
 
+    # 5. Trends
+    trends_p = subparsers.add_parser("trends", help="Show sender anomalies")
+    trends_p.add_argument(
+        "--ingest", metavar="PATH", help="Seed baselines from stored reports"
+    )
+    trends_p.add_argument(
+        "--last", type=int, default=50, help="Anomalies to show (default: 50)"
+    )
+
+    # 6. TLS reports
+    tls_p = subparsers.add_parser("tls", help="Summarize SMTP TLS (TLS-RPT) reports")
+    tls_p.add_argument(
+        "path", nargs="?", help="Path to reports (default: ./dmarc_reports)"
+    )
+    tls_p.add_argument(
+        "--format",
+        choices=["table", "tsv", "json", "jsonl"],
+        default="table",
+        help="Output format (default: table)",
+    )
+    add_filter_args(tls_p)
+
+    # 7. Metrics
+    metrics_p = subparsers.add_parser("metrics", help="Show or serve metrics")
+    metrics_p.add_argument(
+        "--listen", metavar="HOST:PORT", help="Serve /metrics over HTTP"
+    )
+
     args = parser.parse_args()
     config = load_config()
 
-    if args.command == "fetch":
-        cmd_fetch(args, config)
-    elif args.command == "report":
-        cmd_report(args, config)
-    elif args.command == "check":
-        cmd_check(args, config)
-    elif args.command == "dkim":
-        cmd_dkim(args, config)
-    else:
-        # Print help if no command is provided
-        parser.print_help()
+    if args.no_color:
+        ui.set_color(False)
+    if getattr(args, "format", "table") != "table":
+        # Keep stdout clean for tsv/json consumers
+        ui.set_status_stream(sys.stderr)
+
+    asn_db = args.asn_db or config.get("enrichment", "asn_db", fallback=None)
+    if asn_db:
+        from mailops import asn
+
+        asn.configure(asn_db)
+
+    dns_rate = args.dns_rate
+    if dns_rate is None:
+        dns_rate = config.getfloat("dns", "rate", fallback=None)
+    if dns_rate is not None:
+        from mailops import scheduler
+
+        burst = config.getint("dns", "burst", fallback=None)
+        scheduler.configure(rate=dns_rate, burst=burst)
+
+    args.metrics = None
+    textfile = args.metrics_file or config.get("metrics", "textfile", fallback=None)
+    if textfile:
+        from mailops import metrics
+
+        args.metrics = metrics.open_textfile(textfile)
+
+    # Stage latencies are also exported, so collect them whenever metrics are on
+    exporting = args.metrics is not None and args.command not in (None, "metrics")
+    show_profile = bool(args.command and (args.profile or args.profile_json))
+    if show_profile or exporting:
+        from mailops import profiling
+
+        profiling.enable()
+
+    try:
+        if args.command == "fetch":
+            cmd_fetch(args, config)
+        elif args.command == "report":
+            cmd_report(args, config)
+        elif args.command == "check":
+            cmd_check(args, config)
+        elif args.command == "dkim":
+            cmd_dkim(args, config)
+        elif args.command == "trends":
+            cmd_trends(args, config)
+        elif args.command == "tls":
+            cmd_tls(args, config)
+        elif args.command == "metrics":
+            cmd_metrics(args, config)
+        else:
+            # Print help if no command is provided
+            parser.print_help()
+    finally:
+        if show_profile:
+            profiling.finish(args.profile_json)
+        if exporting:
+            metrics.finish_run(args.metrics, args.command)
 
 
 if __name__ == "__main__":
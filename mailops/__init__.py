@@ -0,0 +1 @@
+"""MailOps - Email Operations Toolkit."""
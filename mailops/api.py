@@ -0,0 +1,172 @@
+# mailops/api.py
+"""
+Library interface for services that import mailops instead of running the
+CLI. Nothing here prints: every call returns result objects (SPFResult,
+BlacklistResult, DKIMKey, ParsedReport, FetchResult) and takes a batch of
+inputs (a single string counts as a batch of one), whose DNS and key
+generation work runs concurrently.
+
+DNS queries go through the process-wide scheduler (see scheduler.py). A
+single domain or IP is looked up in the interactive lane; larger batches
+wait in the bulk lane, behind any interactive lookups. Pass `lane` to
+choose.
+
+The *_async variants run the same calls on the event loop's default
+executor, so asyncio callers don't block their loop:
+
+    results = await api.check_spf_async(["example.com", "example.org"])
+"""
+
+import asyncio
+import collections
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from . import (
+    archive,
+    blacklist_monitor,
+    dedup,
+    dkim_gen,
+    dmarc_parser,
+    dns_audit,
+    imap_fetcher,
+    scheduler,
+    spf_check,
+)
+from .blacklist_monitor import BlacklistResult
+from .dkim_gen import DKIMKey
+from .imap_fetcher import FetchError, FetchResult
+from .spf_check import SPFResult
+
+# openssl processes run at once by generate_dkim_keys
+MAX_KEYGEN_WORKERS = 4
+
+
+class ParsedReport(collections.namedtuple("ParsedReport", "path records error")):
+    """
+    Records of one aggregate report file (dicts, see dmarc_parser), or the
+    error that stopped it from being read. Filtered and duplicate reports
+    have no records and no error.
+    """
+
+    __slots__ = ()
+
+
+def _batch(items):
+    if isinstance(items, (str, bytes, os.PathLike)):
+        return [items]
+    return list(items)
+
+
+def _lane(items, lane):
+    if lane is not None:
+        return lane
+    return scheduler.INTERACTIVE if len(items) <= 1 else scheduler.BULK
+
+
+def check_spf(domains, resolver=None, lane=None):
+    """Looks up and evaluates SPF for every domain in one DNS batch."""
+    domains = _batch(domains)
+    resolver = resolver or dns_audit.Resolver(lane=_lane(domains, lane))
+    answers = resolver.resolve_many((d, "TXT", d) for d in domains)
+    return [spf_check.check_spf(d, answers[(d, "TXT", d)]) for d in domains]
+
+
+def check_blacklists(targets, providers=None, resolver=None, lane=None):
+    """RBL status of every IP or domain; see blacklist_monitor.check_many."""
+    targets = _batch(targets)
+    lane = _lane(targets, lane)
+    return blacklist_monitor.check_many(targets, providers, resolver, lane)
+
+
+def audit_dns(domains, selectors=(), key_dir=None, resolver=None, lane=None):
+    """Mail DNS audit findings for every domain; see dns_audit.audit."""
+    domains = _batch(domains)
+    resolver = resolver or dns_audit.Resolver(lane=_lane(domains, lane))
+    return dns_audit.audit(domains, selectors, key_dir, resolver)
+
+
+def generate_dkim_keys(selectors, domain=None, output_dir="."):
+    """Creates <selector>.private in output_dir for every selector."""
+    selectors = _batch(selectors)
+    if not selectors:
+        return []
+    create = functools.partial(
+        dkim_gen.create_key, domain=domain, output_dir=output_dir
+    )
+    with ThreadPoolExecutor(min(MAX_KEYGEN_WORKERS, len(selectors))) as pool:
+        return list(pool.map(create, selectors))
+
+
+def parse_reports(paths, resolve_hosts=False, report_filter=None, dedupe=True):
+    """
+    Parses DMARC report files; directories are searched for reports (see
+    archive.find_report_files). Copies of the same report are read once
+    unless dedupe is False. PTR lookups for source IPs are off by default.
+    """
+    files = []
+    for path in _batch(paths):
+        if os.path.isdir(path):
+            files.extend(archive.find_report_files(path, report_filter))
+        else:
+            files.append(path)
+    index = dedup.ReportIndex() if dedupe else None
+    reports = []
+    for path in files:
+        try:
+            records = dmarc_parser.read_records(
+                path, resolve_hosts, index, report_filter
+            )
+            reports.append(ParsedReport(path, records, None))
+        except Exception as e:
+            reports.append(ParsedReport(path, [], str(e)))
+    return reports
+
+
+def fetch_reports(username, password, server, **options):
+    """
+    Downloads new reports into the archive (options as for
+    imap_fetcher.download_reports) and returns a FetchResult. Raises
+    FetchError when login or the mailbox search fails. Pass
+    progress=callback(level, message) to follow along.
+    """
+    return imap_fetcher.download_reports(username, password, server, **options)
+
+
+# --- asyncio ---
+
+
+async def _in_executor(func, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, functools.partial(func, *args, **kwargs))
+
+
+async def check_spf_async(domains, resolver=None, lane=None):
+    return await _in_executor(check_spf, domains, resolver, lane)
+
+
+async def check_blacklists_async(targets, providers=None, resolver=None, lane=None):
+    return await _in_executor(check_blacklists, targets, providers, resolver, lane)
+
+
+async def audit_dns_async(
+    domains, selectors=(), key_dir=None, resolver=None, lane=None
+):
+    return await _in_executor(audit_dns, domains, selectors, key_dir, resolver, lane)
+
+
+async def generate_dkim_keys_async(selectors, domain=None, output_dir="."):
+    return await _in_executor(generate_dkim_keys, selectors, domain, output_dir)
+
+
+async def parse_reports_async(
+    paths, resolve_hosts=False, report_filter=None, dedupe=True
+):
+    return await _in_executor(
+        parse_reports, paths, resolve_hosts, report_filter, dedupe
+    )
+
+
+async def fetch_reports_async(username, password, server, **options):
+    return await _in_executor(fetch_reports, username, password, server, **options)
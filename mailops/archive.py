@@ -0,0 +1,406 @@
+# mailops/archive.py
+"""
+Report archive layout and selection.
+
+Reports are stored as dmarc_reports/<policy domain>/<YYYY-MM>/<file>, the
+month being the start of the report's date range. Each partition keeps a
+sidecar index (.index.tsv: file, domain, org, report_id, begin, end) so
+reports can be selected without opening them. Archives written before the
+partitioned layout (dmarc_reports/<YYYY-MM-DD>/, named after the email
+Date) are still read. SMTP TLS reports (RFC 8460, .json/.json.gz) share
+the layout and the sidecar index; report_kind() tells them apart.
+
+ReportFilter carries the --since/--until/--domain/--org selection and is
+applied as early as each stage allows: IMAP SEARCH terms when fetching,
+whole partitions (or date folders) when walking the archive, the sidecar
+index, and finally the report header (see dmarc_parser.read_header)
+before any record is parsed.
+
+Archives that fetch writes to also keep an archive-wide index
+(.archive_index.tsv at the top, see ArchiveIndex) listing every saved
+report with its header fields. find_report_files() answers from it
+without listing a single directory, which matters on network
+filesystems holding hundreds of thousands of reports.
+"""
+
+import functools
+import os
+import re
+from datetime import date, datetime, timedelta, timezone
+
+from . import atomic
+
+REPORT_EXTENSIONS = (".xml", ".gz", ".zip", ".json")
+TLSRPT_EXTENSIONS = (".json", ".json.gz")
+
+PARTITION_INDEX = ".index.tsv"
+ARCHIVE_INDEX = ".archive_index.tsv"
+INDEX_FIELDS = ("file", "domain", "org_name", "report_id", "begin", "end")
+# Partition for reports whose header could not be read
+UNKNOWN = "_unknown"
+
+_DAY_RE = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+_MONTH_RE = re.compile(r"^\d{4}-\d{2}$")
+
+# Reports arrive after the period they cover: usually within a day, but
+# some receivers batch them. Folders (named after the email Date) and IMAP
+# dates are only pruned beyond this margin past --until.
+DELIVERY_GRACE_DAYS = 3
+
+# IMAP dates always use English month names, whatever the locale
+_IMAP_MONTHS = (
+    "Jan",
+    "Feb",
+    "Mar",
+    "Apr",
+    "May",
+    "Jun",
+    "Jul",
+    "Aug",
+    "Sep",
+    "Oct",
+    "Nov",
+    "Dec",
+)
+
+
+def parse_day(text):
+    """Parses YYYY-MM-DD into a date (ValueError on bad input)."""
+    return datetime.strptime(text, "%Y-%m-%d").date()
+
+
+def imap_date(day):
+    return f"{day.day:02d}-{_IMAP_MONTHS[day.month - 1]}-{day.year}"
+
+
+def _epoch(day):
+    return datetime(day.year, day.month, day.day, tzinfo=timezone.utc).timestamp()
+
+
+def _month_bounds(name):
+    """First and last day of a YYYY-MM partition."""
+    first = datetime.strptime(name, "%Y-%m").date()
+    following = (first.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return first, following - timedelta(days=1)
+
+
+class ReportFilter:
+    """
+    Selects reports whose date_range overlaps [since, until] (whole UTC
+    days, both inclusive), whose policy domain is one of `domains` and
+    whose reporting org contains one of `orgs` (case-insensitive).
+    `days` records that `since` is the start of a rolling --days window.
+    """
+
+    def __init__(self, since=None, until=None, domains=None, orgs=None, days=None):
+        self.since = since
+        self.until = until
+        self.days = days
+        self.domains = {d.strip().lower().rstrip(".") for d in domains or ()}
+        self.orgs = [o.strip().lower() for o in orgs or ()]
+
+    @classmethod
+    def from_args(cls, args):
+        """Builds a filter from --since/--until/--days/--domain/--org flags."""
+        since = getattr(args, "since", None)
+        until = getattr(args, "until", None)
+        if isinstance(since, str):
+            since = parse_day(since)
+        if isinstance(until, str):
+            until = parse_day(until)
+        days = getattr(args, "days", None)
+        if since or not days:
+            days = None
+        else:
+            since = date.today() - timedelta(days=days)
+        return cls(
+            since,
+            until,
+            getattr(args, "domain", None) or (),
+            getattr(args, "org", None) or (),
+            days,
+        )
+
+    def __bool__(self):
+        return bool(self.since or self.until or self.domains or self.orgs)
+
+    def describe(self):
+        parts = []
+        if self.since:
+            parts.append(f"since {self.since}")
+        if self.until:
+            parts.append(f"until {self.until}")
+        if self.domains:
+            parts.append("domain " + ", ".join(sorted(self.domains)))
+        if self.orgs:
+            parts.append("org " + ", ".join(self.orgs))
+        return "; ".join(parts)
+
+    def selection(self):
+        """
+        describe(), but naming a --days window by its length: the text
+        stays the same from one day to the next, so fetch checkpoints
+        keyed on it still apply. Resuming is safe because the window only
+        drops old days, never adds any before the checkpoint.
+        """
+        if not self.days:
+            return self.describe()
+        rolling = ReportFilter(None, self.until, self.domains, self.orgs)
+        return "; ".join(filter(None, [f"last {self.days} days", rolling.describe()]))
+
+    # --- Pushdown targets ---
+
+    def imap_terms(self):
+        """SEARCH terms narrowing messages by internal date (may be empty)."""
+        terms = []
+        if self.since:
+            # One day of slack for senders in far-west timezones
+            terms.append(f"SINCE {imap_date(self.since - timedelta(days=1))}")
+        if self.until:
+            last = self.until + timedelta(days=DELIVERY_GRACE_DAYS + 1)
+            terms.append(f"BEFORE {imap_date(last)}")
+        return " ".join(terms)
+
+    def wants_folder(self, name, top=False):
+        """
+        Whether an archive folder can hold matching reports: a domain
+        partition (top level), a YYYY-MM month partition or a legacy
+        YYYY-MM-DD folder named after the email Date. Unreadable reports
+        (UNKNOWN) are always searched, as the index path does.
+        """
+        if _MONTH_RE.match(name):
+            if not (self.since or self.until):
+                return True
+            first, last = _month_bounds(name)
+            if self.since and last < self.since:
+                return False
+            return not (self.until and first > self.until)
+        if _DAY_RE.match(name):
+            if not (self.since or self.until):
+                return True
+            day = parse_day(name)
+            if self.since and day < self.since - timedelta(days=1):
+                return False
+            grace = timedelta(days=DELIVERY_GRACE_DAYS)
+            return not (self.until and day > self.until + grace)
+        if top and self.domains and name not in ("unknown_date", UNKNOWN):
+            return name.lower() in self.domains
+        return True
+
+    @functools.cached_property
+    def _window(self):
+        # [start, stop) in epoch seconds, computed once: matches() runs for
+        # every entry of an archive index
+        start = _epoch(self.since) if self.since else None
+        stop = _epoch(self.until + timedelta(days=1)) if self.until else None
+        return start, stop
+
+    def matches(self, meta):
+        """Checks report header metadata (see dmarc_parser.read_header)."""
+        if self.since or self.until:
+            start, stop = self._window
+            try:
+                begin = int(meta.get("begin") or 0)
+                end = int(meta.get("end") or begin)
+            except ValueError:
+                begin = end = 0
+            if start is not None and end < start:
+                return False
+            if stop is not None and begin >= stop:
+                return False
+        if self.domains and (meta.get("domain") or "") not in self.domains:
+            return False
+        if self.orgs:
+            org = (meta.get("org_name") or "").lower()
+            if not any(o in org for o in self.orgs):
+                return False
+        return True
+
+
+def report_kind(file_path):
+    """'tlsrpt' for SMTP TLS reports, 'dmarc' for everything else."""
+    if file_path.lower().endswith(TLSRPT_EXTENSIONS):
+        return "tlsrpt"
+    return "dmarc"
+
+
+# --- Partitioned layout ---
+
+
+def _clean_domain(domain):
+    domain = "".join(c for c in (domain or "").lower() if c.isalnum() or c in ".-")
+    # No "", "." or ".." path components
+    return domain.strip(".") or UNKNOWN
+
+
+def partition_dir(output_dir, meta, fallback_day=None):
+    """
+    Returns output_dir/<policy domain>/<YYYY-MM> for a report header.
+    fallback_day (YYYY-MM-DD, e.g. the email date) is used when the
+    report has no usable date range.
+    """
+    try:
+        begin = datetime.fromtimestamp(int(meta.get("begin")), tz=timezone.utc)
+        month = begin.strftime("%Y-%m")
+    except (TypeError, ValueError, OverflowError, OSError):
+        month = UNKNOWN
+        if fallback_day and _DAY_RE.match(fallback_day):
+            month = fallback_day[:7]
+    return os.path.join(output_dir, _clean_domain(meta.get("domain")), month)
+
+
+def _index_line(filename, meta):
+    row = [filename] + [str(meta.get(f) or "") for f in INDEX_FIELDS[1:]]
+    return "\t".join(v.replace("\t", " ").replace("\n", " ") for v in row) + "\n"
+
+
+def _read_rows(path):
+    """Rows of an index file; a torn last line (no newline) is skipped."""
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            values = line[:-1].split("\t")
+            if line[-1:] == "\n" and len(values) == len(INDEX_FIELDS):
+                yield dict(zip(INDEX_FIELDS, values))
+
+
+def add_to_index(partition, filename, meta):
+    """Appends a saved report to its partition's sidecar index."""
+    with open(os.path.join(partition, PARTITION_INDEX), "a", encoding="utf-8") as f:
+        f.write(_index_line(filename, meta))
+
+
+def read_index(partition):
+    """Returns {filename: metadata} from a partition's sidecar index."""
+    try:
+        rows = _read_rows(os.path.join(partition, PARTITION_INDEX))
+        return {row["file"]: row for row in rows}
+    except FileNotFoundError:
+        return {}
+
+
+class ArchiveIndex:
+    """
+    Every report saved into an archive, one INDEX_FIELDS row per file
+    ("file" being its path relative to the archive, with "/"), in
+    <archive>/.archive_index.tsv.
+
+    Entries are appended with a single write each, so readers never see
+    half an entry (a line torn by a crash is skipped and the next entry
+    starts on a fresh line). An archive without the file is listed by
+    walking it; rebuild() creates the index from the sidecars, reading
+    the headers of reports they don't describe.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.path = os.path.join(directory, ARCHIVE_INDEX)
+        self._files = None  # indexed relative paths, once __contains__ needs them
+
+    @classmethod
+    def for_archive(cls, directory):
+        """The archive's index, or None if it has none."""
+        index = cls(directory)
+        return index if os.path.exists(index.path) else None
+
+    def _relpath(self, path):
+        return os.path.relpath(path, self.directory).replace(os.sep, "/")
+
+    def __contains__(self, path):
+        """Whether a report saved at `path` is indexed."""
+        if self._files is None:
+            try:
+                self._files = {meta["file"] for meta in self.entries()}
+            except FileNotFoundError:
+                self._files = set()
+        return self._relpath(path) in self._files
+
+    def add(self, path, meta):
+        """Records a report saved at `path` (inside the archive)."""
+        relpath = self._relpath(path)
+        if self._files is not None:
+            self._files.add(relpath)
+        line = _index_line(relpath, meta).encode("utf-8")
+        # Append mode: the write lands at the end whatever was read before
+        with open(self.path, "a+b", buffering=0) as f:
+            end = f.seek(0, os.SEEK_END)
+            if end:
+                f.seek(end - 1)
+                if f.read(1) != b"\n":
+                    line = b"\n" + line
+            f.write(line)
+
+    def entries(self):
+        """Yields the metadata of every indexed report, oldest first."""
+        return _read_rows(self.path)
+
+    def find(self, report_filter=None, kind="dmarc"):
+        """Indexed report paths, sorted, as find_report_files() selects them."""
+        selected = set()
+        for meta in self.entries():
+            f = meta["file"]
+            if kind and report_kind(f) != kind:
+                continue
+            # Unreadable headers are left to the parser to judge
+            if report_filter and meta["begin"] and not report_filter.matches(meta):
+                continue
+            selected.add(f)
+        prefix = os.path.join(self.directory, "")
+        return [prefix + f.replace("/", os.sep) for f in sorted(selected)]
+
+    def rebuild(self):
+        """Re-creates the index from what is on disk, replacing it atomically."""
+        from . import dmarc_parser, tlsrpt
+
+        lines = []
+        for root, dirs, filenames in os.walk(self.directory):
+            dirs.sort()
+            indexed = read_index(root)
+            for f in sorted(filenames):
+                if f.startswith(".") or not f.lower().endswith(REPORT_EXTENSIONS):
+                    continue
+                path = os.path.join(root, f)
+                meta = indexed.get(f)
+                if meta is None:
+                    reader = tlsrpt if report_kind(f) == "tlsrpt" else dmarc_parser
+                    meta = reader.read_report_metadata(path) or {}
+                relpath = os.path.relpath(path, self.directory)
+                lines.append(_index_line(relpath.replace(os.sep, "/"), meta))
+
+        os.makedirs(self.directory, exist_ok=True)
+        with atomic.atomic_open(self.path, "w", encoding="utf-8") as f:
+            f.writelines(lines)
+        self._files = None
+        return len(lines)
+
+
+def find_report_files(target, report_filter=None, kind="dmarc"):
+    """
+    Lists report files of one kind (see report_kind; None for all) under a
+    directory, or the file itself. Archives with an ArchiveIndex are
+    answered from it alone. Otherwise partitions and date folders the
+    filter rules out are never listed, and files described by a sidecar
+    index are checked against it without being opened.
+    """
+    if os.path.isfile(target):
+        return [target]
+    index = ArchiveIndex.for_archive(target)
+    if index is not None:
+        return index.find(report_filter, kind)
+    files = []
+    for root, dirs, filenames in os.walk(target):
+        if report_filter:
+            top = root == target
+            dirs[:] = [d for d in dirs if report_filter.wants_folder(d, top)]
+        dirs.sort()
+        indexed = read_index(root) if report_filter else {}
+        for f in sorted(filenames):
+            # Dot-files are archive state (indexes, checkpoints, temp files)
+            if f.startswith(".") or not f.lower().endswith(REPORT_EXTENSIONS):
+                continue
+            if kind and report_kind(f) != kind:
+                continue
+            meta = indexed.get(f)
+            if meta is not None and not report_filter.matches(meta):
+                continue
+            files.append(os.path.join(root, f))
+    return files
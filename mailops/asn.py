@@ -0,0 +1,250 @@
+# mailops/asn.py
+"""
+Offline IP -> ASN / network owner lookups.
+
+Reads a local prefix dataset, optionally gzipped, in one of these layouts:
+iptoasn.com ranges (`first_ip  last_ip  asn  [country]  [description]`, tab
+separated), CIDR lines (`prefix/len  asn  [description]`) or CAIDA
+RouteViews pfx2as (`prefix  len  asn`). The data is flattened into
+non-overlapping ranges (more specific prefixes win) and stored in sorted
+arrays, so a lookup is one binary search.
+
+The compiled arrays are cached next to the dataset (<dataset>.idx) and
+memory-mapped on later runs: opening a multi-million-range database costs
+a few milliseconds instead of re-parsing the text file.
+"""
+
+import array
+import bisect
+import gzip
+import ipaddress
+import json
+import mmap
+import os
+import socket
+import struct
+import sys
+
+from . import atomic, ui
+
+# Dataset used when --asn-db / [enrichment] asn_db are not given
+DB_PATH = os.environ.get("MAILOPS_ASN_DB")
+
+_MAGIC = b"MOASN1" + (b"LE" if sys.byteorder == "little" else b"BE")
+_HEADER = struct.Struct("<8sQQQ")  # magic, v4 ranges, v6 ranges, names bytes
+
+_database = None
+_failed = False
+
+
+def _open_text(path):
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8", errors="replace")
+    return open(path, encoding="utf-8", errors="replace")
+
+
+def _parse_line(line):
+    """Returns (version, first, last, asn, name) or None for unusable lines."""
+    fields = line.rstrip("\r\n").split("\t")
+    if len(fields) == 1:
+        fields = line.split()
+    if len(fields) < 2 or fields[0].startswith("#"):
+        return None
+    try:
+        if "/" in fields[0]:
+            net = ipaddress.ip_network(fields[0], strict=False)
+            first, last = net.network_address, net.broadcast_address
+            asn, name = fields[1], fields[2] if len(fields) > 2 else ""
+        elif fields[1].isdigit():
+            net = ipaddress.ip_network(f"{fields[0]}/{fields[1]}", strict=False)
+            first, last = net.network_address, net.broadcast_address
+            # Multi-origin prefixes look like "64500_64501" or "64500,64501"
+            asn, name = fields[2].replace(",", "_").split("_")[0], ""
+        else:
+            first = ipaddress.ip_address(fields[0])
+            last = ipaddress.ip_address(fields[1])
+            asn = fields[2]
+            name = fields[-1] if len(fields) > 4 else ""
+        asn = int(asn.upper().lstrip("AS"))
+    except (ValueError, IndexError):
+        return None
+    if asn == 0 or first.version != last.version:
+        return None  # iptoasn marks unrouted space as AS0
+    return first.version, int(first), int(last), asn, name.strip()
+
+
+def _flatten(ranges):
+    """
+    Turns possibly nested ranges into sorted, non-overlapping ones where the
+    innermost (most specific) range wins.
+    """
+    out = []
+    stack = []  # (last, value) of the ranges enclosing the cursor
+    cursor = 0
+
+    def emit(first, last, value):
+        if first <= last:
+            out.append((first, last, value))
+
+    for first, last, value in sorted(ranges, key=lambda r: (r[0], -r[1])):
+        while stack and stack[-1][0] < first:
+            top_last, top_value = stack.pop()
+            emit(cursor, top_last, top_value)
+            cursor = top_last + 1
+        if stack:
+            emit(cursor, first - 1, stack[-1][1])
+        stack.append((last, value))
+        cursor = first
+    while stack:
+        top_last, top_value = stack.pop()
+        emit(cursor, top_last, top_value)
+        cursor = top_last + 1
+    return out
+
+
+class AsnDatabase:
+    """Sorted-array prefix index; see lookup()."""
+
+    def __init__(self, v4, v6, names):
+        # v4: (starts, ends, asns, name ids) as 32-bit sequences
+        # v6: (starts, ends, asns, name ids) as lists
+        self.v4 = v4
+        self.v6 = v6
+        self.names = names
+        self._cache = {}
+        self._mmap = None
+
+    def __len__(self):
+        return len(self.v4[0]) + len(self.v6[0])
+
+    @classmethod
+    def build(cls, path):
+        """Parses a text dataset into a database."""
+        names = {}
+        ranges = {4: [], 6: []}
+        with _open_text(path) as f:
+            for line in f:
+                parsed = _parse_line(line)
+                if parsed is None:
+                    continue
+                version, first, last, asn, name = parsed
+                name_id = names.setdefault(name, len(names))
+                ranges[version].append((first, last, (asn, name_id)))
+
+        def columns(version, typecode):
+            flat = _flatten(ranges[version])
+            cols = [
+                [r[0] for r in flat],
+                [r[1] for r in flat],
+                [r[2][0] for r in flat],
+                [r[2][1] for r in flat],
+            ]
+            return [array.array(typecode, c) for c in cols] if typecode else cols
+
+        return cls(columns(4, "I"), columns(6, None), list(names))
+
+    @classmethod
+    def open(cls, path):
+        """
+        Opens a dataset through its compiled cache, (re)building the cache
+        when it is missing or older than the dataset.
+        """
+        cache = path + ".idx"
+        try:
+            if os.path.getmtime(cache) >= os.path.getmtime(path):
+                return cls.load(cache)
+        except (OSError, ValueError):
+            pass
+        db = cls.build(path)
+        try:
+            db.save(cache)
+        except OSError:
+            pass  # read-only location: just don't cache
+        return db
+
+    def save(self, path):
+        names = json.dumps(self.names).encode("utf-8")
+        with atomic.atomic_open(path) as f:
+            f.write(_HEADER.pack(_MAGIC, len(self.v4[0]), len(self.v6[0]), len(names)))
+            for column in self.v4:
+                array.array("I", column).tofile(f)
+            for column in self.v6[:2]:
+                f.write(b"".join(n.to_bytes(16, "big") for n in column))
+            for column in self.v6[2:]:
+                array.array("I", column).tofile(f)
+            f.write(names)
+
+    @classmethod
+    def load(cls, path):
+        """Maps a compiled cache; IPv4 columns are used in place."""
+        with open(path, "rb") as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, n4, n6, names_len = _HEADER.unpack_from(mm, 0)
+        if magic != _MAGIC:
+            mm.close()
+            raise ValueError(f"{path}: not a mailops ASN index")
+        view = memoryview(mm)
+        offset = _HEADER.size
+
+        def take(size):
+            nonlocal offset
+            chunk = view[offset : offset + size]
+            offset += size
+            return chunk
+
+        v4 = [take(4 * n4).cast("I") for _ in range(4)]
+        v6 = []
+        for _ in range(2):
+            raw = take(16 * n6)
+            v6.append(
+                [int.from_bytes(raw[i : i + 16], "big") for i in range(0, len(raw), 16)]
+            )
+        for _ in range(2):
+            v6.append(list(take(4 * n6).cast("I")))
+        names = json.loads(bytes(take(names_len)).decode("utf-8"))
+        db = cls(v4, v6, names)
+        db._mmap = mm
+        return db
+
+    def lookup(self, ip):
+        """Returns (asn, network name) for an IP string, or None."""
+        try:
+            return self._cache[ip]
+        except KeyError:
+            pass
+        result = None
+        try:
+            value = int.from_bytes(socket.inet_pton(socket.AF_INET, ip), "big")
+            starts, ends, asns, name_ids = self.v4
+        except (OSError, TypeError):
+            try:
+                value = int.from_bytes(socket.inet_pton(socket.AF_INET6, ip), "big")
+                starts, ends, asns, name_ids = self.v6
+            except (OSError, TypeError):
+                starts = None
+        if starts is not None:
+            i = bisect.bisect_right(starts, value) - 1
+            if i >= 0 and value <= ends[i]:
+                result = (asns[i], self.names[name_ids[i]])
+        self._cache[ip] = result
+        return result
+
+
+def configure(path):
+    """Selects the dataset used by get_database() (None disables lookups)."""
+    global DB_PATH, _database, _failed
+    DB_PATH = path
+    _database = None
+    _failed = False
+
+
+def get_database():
+    """The configured database, opened on first use; None if unavailable."""
+    global _database, _failed
+    if _database is None and DB_PATH and not _failed:
+        try:
+            _database = AsnDatabase.open(DB_PATH)
+        except Exception as e:
+            ui.print_warning(f"ASN lookups disabled, cannot read {DB_PATH}: {e}")
+            _failed = True
+    return _database
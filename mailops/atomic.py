@@ -0,0 +1,43 @@
+# mailops/atomic.py
+"""
+Atomic file replacement for the state and report files mailops writes.
+
+Data goes to a hidden temp file in the target's directory, is flushed to
+disk and renamed over the target, so readers (and a crash) only ever see
+the old file or the new one, never half of either.
+"""
+
+import contextlib
+import os
+import threading
+
+
+@contextlib.contextmanager
+def atomic_open(path, mode="wb", encoding=None):
+    """
+    Opens a temp file next to path for writing. It replaces path when the
+    block exits normally and is removed if the block raises.
+    """
+    directory, name = os.path.split(path)
+    # Dotted, so archive walks skip it; one per thread and process
+    tmp = os.path.join(directory, f".{name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        with open(tmp, mode, encoding=encoding) as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+
+
+def write_atomic(path, data):
+    """Writes bytes, or text as UTF-8, to path atomically."""
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    with atomic_open(path) as f:
+        f.write(data)
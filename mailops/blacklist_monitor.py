@@ -1,14 +1,9 @@
-import os
-import sys
-
-sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 # mailops/blacklist_monitor.py
 import argparse
+import collections
 import ipaddress
-import json
-import urllib.request
 
-from . import ui  # Import the new UI module
+from . import doh, profiling, scheduler, ui  # Import the new UI module
 
 # Common RBLs
 RBL_PROVIDERS = [
@@ -20,18 +15,98 @@ RBL_PROVIDERS = [
 ]
 
 
+class BlacklistResult(collections.namedtuple("BlacklistResult", "target ip results")):
+    """
+    RBL status of one IP (or the IP a domain resolves to). `results` maps
+    each zone to None (clean), the listing answer, or "Error: ...".
+    `ip` is None when a domain didn't resolve.
+    """
+
+    __slots__ = ()
+
+    @property
+    def listed(self):
+        return [
+            rbl
+            for rbl, res in self.results.items()
+            if res is not None and not str(res).startswith("Error")
+        ]
+
+    @property
+    def errors(self):
+        return [
+            rbl for rbl, res in self.results.items() if str(res).startswith("Error")
+        ]
+
+
+def _first_a(response):
+    for answer in response.get("Answer", []):
+        if answer["type"] == 1:
+            return answer["data"]
+    return None
+
+
+def _listing(response):
+    if isinstance(response, Exception):
+        return f"Error: {response}"
+    if "Answer" in response:
+        return response["Answer"][0]["data"]
+    return None
+
+
+@profiling.timed("rbl.batch")
+def check_many(targets, providers=None, resolver=None, lane=scheduler.INTERACTIVE):
+    """
+    Checks IPs or domains against every RBL without printing anything.
+    Domains are resolved first; then all (IP, zone) questions go out in one
+    concurrent batch, in the given scheduler lane. Zones whose circuit
+    breaker is open report "Error: ..." without being queried.
+    Returns a BlacklistResult per target, in order.
+    """
+    from . import dns_audit
+
+    providers = RBL_PROVIDERS if providers is None else providers
+    resolver = resolver or dns_audit.Resolver(lane=lane)
+    ips = {}
+    names = []
+    for target in targets:
+        try:
+            ipaddress.ip_address(target)
+            ips[target] = target
+        except ValueError:
+            names.append(target)
+    for name, response in resolver.resolve_many((n, "A", n) for n in names).items():
+        if not isinstance(response, Exception):
+            ips[name[0]] = _first_a(response)
+
+    def question(ip, rbl):
+        return (".".join(reversed(ip.split("."))) + "." + rbl, "A", rbl)
+
+    checked = {ip for ip in ips.values() if ip}
+    answers = resolver.resolve_many(
+        question(ip, rbl) for ip in checked for rbl in providers
+    )
+    profiling.count("rbl.queries", len(checked) * len(providers))
+
+    results = []
+    for target in targets:
+        ip = ips.get(target)
+        status = {}
+        if ip:
+            status = {rbl: _listing(answers[question(ip, rbl)]) for rbl in providers}
+        result = BlacklistResult(target, ip, status)
+        profiling.count("rbl.listed", len(result.listed))
+        results.append(result)
+    return results
+
+
 def resolve_domain(domain):
     print(f"[*] Resolving IP for: {domain}...", end=" ", flush=True)
-    url = f"https://dns.google/resolve?name={domain}&type=A"
     try:
-        with urllib.request.urlopen(url) as response:
-            data = json.loads(response.read().decode())
-        if "Answer" in data:
-            for answer in data["Answer"]:
-                if answer["type"] == 1:
-                    ip = answer["data"]
-                    print(f"Found {ip}")
-                    return ip
+        ip = _first_a(doh.query(domain, "A", zone=domain))
+        if ip:
+            print(f"Found {ip}")
+            return ip
         print("\n[!] Error: No A record found.")
         return None
     except Exception as e:
@@ -39,13 +114,12 @@ def resolve_domain(domain):
         return None
 
 
+@profiling.timed("rbl.query")
 def check_rbl(ip_address, rbl_domain):
     try:
         reversed_ip = ".".join(reversed(ip_address.split(".")))
         query = f"{reversed_ip}.{rbl_domain}"
-        url = f"https://dns.google/resolve?name={query}&type=A"
-        with urllib.request.urlopen(url) as response:
-            data = json.loads(response.read().decode())
+        data = doh.query(query, "A", zone=rbl_domain)
         if "Answer" in data:
             return data["Answer"][0]["data"]
         return None
@@ -53,37 +127,42 @@ def check_rbl(ip_address, rbl_domain):
         return f"Error: {e}"
 
 
+@profiling.timed("rbl.check")
 def run_check(target_input):
-    """Orchestrates the check logic so other scripts can call it."""
-    target_ip = None
-    try:
-        ipaddress.ip_address(target_input)
-        target_ip = target_input
-    except ValueError:
-        target_ip = resolve_domain(target_input)
-        if not target_ip:
-            return
-
-    ui.print_sub_header(f"Blacklist Status for: {target_ip}")
+    """
+    Checks one IP or domain and prints the status table (see check_many
+    for the quiet version).
+    Returns {"ip": ..., "results": {rbl: None | answer | "Error: ..."}}.
+    """
+    result = check_many([target_input])[0]
+    print_result(result)
+    if not result.ip:
+        return None
+    return {"ip": result.ip, "results": result.results}
+
+
+def print_result(result):
+    """Console table for a check_many() result."""
+    if not result.ip:
+        ui.print_error(f"No A record found for {result.target}.")
+        return
+    ui.print_sub_header(f"Blacklist Status for: {result.ip}")
     print("-" * 60)
     print(f"{'RBL Provider':<30} | {'Status':<10}")
     print("-" * 60)
 
-    issues = 0
-    for rbl in RBL_PROVIDERS:
-        res = check_rbl(target_ip, rbl)
+    for rbl, res in result.results.items():
         if res is None:
             print(f"{rbl:<30} | ✅ Clean")
         elif str(res).startswith("Error"):
             print(f"{rbl:<30} | ⚠️  {res}")
         else:
             print(f"{rbl:<30} | ❌ LISTED ({res})")
-            issues += 1
     print("-" * 60)
-    if issues == 0:
+    if not result.listed:
         ui.print_success("Great! This IP is not listed on the checked RBLs.")
     else:
-        ui.print_warning(f"This IP is listed on {issues} blacklists.")
+        ui.print_warning(f"This IP is listed on {len(result.listed)} blacklists.")
 
 
 def main():
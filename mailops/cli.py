@@ -1,17 +1,26 @@
 #!/usr/bin/env python3
-"""MailOps CLI - Email Operations Toolkit"""
+"""
+MailOps CLI - Email Operations Toolkit
+
+Tool modules (imaplib, xml, urllib, subprocess...) are imported inside each
+command branch, so `mailops --help` or `mailops spf` only pay for what they
+actually run. Keep it that way: no tool imports at module level.
+"""
 
 import argparse
-import glob
 import os
 import sys
 
-sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if not __package__:
+    # Running as a plain script (python mailops/cli.py)
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
 
-from mailops.dkim_gen import generate_keys
-from mailops.dmarc_parser import parse_dmarc_xml
-from mailops.imap_fetcher import fetch_reports
-from mailops.spf_check import fetch_spf_record
+def add_filter_args(subparser: argparse.ArgumentParser) -> None:
+    subparser.add_argument("--since", metavar="YYYY-MM-DD", help="From this day")
+    subparser.add_argument("--until", metavar="YYYY-MM-DD", help="Up to this day")
+    subparser.add_argument("--domain", action="append", help="Policy domain")
+    subparser.add_argument("--org", action="append", help="Reporting org")
 
 
 def main() -> None:
@@ -27,6 +36,30 @@ def main() -> None:
         """,
     )
 
+    parser.add_argument(
+        "--profile", action="store_true", help="Print a timing breakdown to stderr"
+    )
+    parser.add_argument(
+        "--profile-json", metavar="FILE", help="Write the timing breakdown as JSON"
+    )
+    parser.add_argument(
+        "--metrics-file",
+        metavar="FILE",
+        help="Update a Prometheus textfile-collector file (e.g. mailops.prom)",
+    )
+    parser.add_argument(
+        "--no-color", action="store_true", help="Disable ANSI colors in output"
+    )
+    parser.add_argument(
+        "--asn-db", metavar="FILE", help="Offline IP-to-ASN dataset for enrichment"
+    )
+    parser.add_argument(
+        "--dns-rate",
+        type=float,
+        metavar="QPS",
+        help="Cap DNS queries per second for each resolver (0 = no cap)",
+    )
+
     subparsers = parser.add_subparsers(dest="command", help="Commands")
 
     # FETCH ⚡ REAL IMAP
@@ -37,6 +70,13 @@ def main() -> None:
         "--password", required=True, help="IMAP password"
     )  # FIXED!
     fetch_parser.add_argument("--server", default="imap.gmail.com", help="IMAP server")
+    fetch_parser.add_argument(
+        "--rescan", action="store_true", help="Ignore the resume checkpoint"
+    )
+    fetch_parser.add_argument(
+        "--connections", type=int, default=1, help="Parallel IMAP connections"
+    )
+    add_filter_args(fetch_parser)
 
     # REPORT
     report_parser = subparsers.add_parser("report", help="Analyze DMARC reports")
@@ -44,6 +84,20 @@ def main() -> None:
         "--alerts", action="store_true", help="Show only failures"
     )
     report_parser.add_argument("--csv", help="Export to CSV")
+    report_parser.add_argument(
+        "--by-network", action="store_true", help="Summarize messages per ASN"
+    )
+    report_parser.add_argument(
+        "--format",
+        choices=["table", "tsv", "json", "jsonl"],
+        default="table",
+        help="Output format (default: table)",
+    )
+    report_parser.add_argument(
+        "--path",
+        help="Report file or folder (default: dmarc_reports, reports and ./)",
+    )
+    add_filter_args(report_parser)
 
     # DKIM
     dkim_parser = subparsers.add_parser("dkim", help="Generate DKIM keys")
@@ -54,41 +108,152 @@ def main() -> None:
     spf_parser = subparsers.add_parser("spf", help="Check SPF records")
     spf_parser.add_argument("domain", help="Domain to check")
 
+    # METRICS
+    metrics_parser = subparsers.add_parser("metrics", help="Show or serve metrics")
+    metrics_parser.add_argument(
+        "--listen", metavar="HOST:PORT", help="Serve /metrics over HTTP"
+    )
+
     args = parser.parse_args()
 
     if not args.command:
         parser.print_help()
         return
 
+    if args.no_color:
+        from mailops import ui
+
+        ui.set_color(False)
+
+    if args.asn_db:
+        from mailops import asn
+
+        asn.configure(args.asn_db)
+
+    if args.dns_rate is not None:
+        from mailops import scheduler
+
+        scheduler.configure(rate=args.dns_rate)
+
+    store = None
+    if args.metrics_file:
+        from mailops import metrics
+
+        store = metrics.open_textfile(args.metrics_file)
+    # Stage latencies are also exported, so collect them whenever metrics are on
+    exporting = store is not None and args.command != "metrics"
+    profiled = args.profile or args.profile_json or exporting
+    if profiled:
+        from mailops import profiling
+
+        profiling.enable()
+
     try:
         if args.command == "fetch":
+            from mailops import tlsrpt, trends
+            from mailops.archive import ReportFilter
+            from mailops.dmarc_parser import ingest_hook
+            from mailops.imap_fetcher import fetch_reports
+
+            report_filter = ReportFilter.from_args(args)
             print(f"📥 Fetching REAL DMARC reports...")
-            print(f"   👤 {args.user} | 📧 {args.server} | 📅 {args.days} days")
-            fetch_reports(args.user, args.password, args.server)  # FIXED!
+            window = report_filter.describe()
+            print(f"   👤 {args.user} | 📧 {args.server} | 📅 {window}")
+            engine = trends.TrendEngine.for_archive("dmarc_reports")
+            consumers = [trends.watcher(engine, store)]
+            tls_consumers = [tlsrpt.warn_failures]
+            if store:
+                consumers.append(store.record_report)
+                tls_consumers.append(store.record_tls_report)
+            fetch_reports(
+                args.user,
+                args.password,
+                args.server,
+                on_saved=ingest_hook(*consumers, tls_consumers=tls_consumers),
+                report_filter=report_filter,
+                resume=not args.rescan,
+                connections=args.connections,
+            )
+            engine.save()
             print("✅ Reports downloaded! Run 'mailops report'")
 
         elif args.command == "report":
-            print("📊 Analyzing REAL DMARC reports...")
-            xml_files = glob.glob("*.xml") + glob.glob("reports/*.xml")
-            if xml_files:
-                print(f"Found {len(xml_files)} XML files:")
-                for xml_file in xml_files:
-                    print(f"  📄 {xml_file}")
-                    parse_dmarc_xml(xml_file)
+            from mailops import archive, dedup, dmarc_parser, ui
+
+            # tsv/json go to stdout alone; progress messages move to stderr
+            status = sys.stdout if args.format == "table" else sys.stderr
+            ui.set_status_stream(status)
+
+            print("📊 Analyzing REAL DMARC reports...", file=status)
+            report_filter = archive.ReportFilter.from_args(args)
+            if args.path:
+                report_files = archive.find_report_files(args.path, report_filter)
+            else:
+                # What `mailops fetch` archived, plus reports saved by hand
+                report_files = [
+                    f
+                    for f in sorted(os.listdir("."))
+                    if f.lower().endswith(archive.REPORT_EXTENSIONS)
+                    and archive.report_kind(f) == "dmarc"
+                ]
+                for folder in ("dmarc_reports", "reports"):
+                    if os.path.isdir(folder):
+                        report_files += archive.find_report_files(folder, report_filter)
+            if report_files:
+                print(f"Found {len(report_files)} report files:", file=status)
+                records = []
+                index = dedup.ReportIndex()
+                for report_file in report_files:
+                    print(f"  📄 {report_file}", file=status)
+                    records.extend(
+                        dmarc_parser.parse_dmarc_xml(
+                            report_file, index=index, report_filter=report_filter
+                        )
+                    )
+                if index.duplicates:
+                    print(f"Skipped {index.duplicates} duplicate reports", file=status)
+                if args.alerts:
+                    records = [r for r in records if r["status_msg"] != "OK"]
+                if args.by_network:
+                    rows = dmarc_parser.summarize_networks(records)
+                    dmarc_parser.render_networks(rows, args.format)
+                elif args.csv:
+                    dmarc_parser.save_to_csv(records, args.csv)
+                else:
+                    dmarc_parser.render_records(records, args.format)
             else:
-                print("❌ No XML files found. Run 'mailops fetch' first!")
+                print("❌ No reports found. Run 'mailops fetch' first!", file=status)
 
         elif args.command == "dkim":
+            from mailops import dkim_gen
+
             print(f"🔑 Generating DKIM keys for {args.domain}...")
-            generate_keys(args.selector)
-            print("✅ DKIM keys generated!")
+            key = dkim_gen.create_key(args.selector, args.domain)
+            print(f"✅ Saved private key to: {key.private_key}")
+            dkim_gen.print_record(key)
 
         elif args.command == "spf":
-            fetch_spf_record(args.domain)
+            from mailops import spf_check
+
+            spf_check.print_result(spf_check.check_spf(args.domain))
+
+        elif args.command == "metrics":
+            if not store:
+                print("❌ Pass --metrics-file to choose the metrics to show.")
+            elif args.listen:
+                host, _, port = args.listen.rpartition(":")
+                metrics.serve(store.textfile, host or "127.0.0.1", int(port))
+            else:
+                print(store.render(), end="")
 
     except Exception as e:
         print(f"❌ Error: {e}")
         sys.exit(1)
+    finally:
+        if args.profile or args.profile_json:
+            profiling.finish(args.profile_json)
+        if exporting:
+            metrics.finish_run(store, args.command)
 
 
 if __name__ == "__main__":
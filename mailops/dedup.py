@@ -0,0 +1,101 @@
+# mailops/dedup.py
+"""
+Report de-duplication by (org, report_id, date range).
+
+The same aggregate report often arrives more than once (several mailboxes,
+re-sends, different attachment names). ReportIndex keeps an 8-byte BLAKE2b
+fingerprint per report key in memory and, when given a path, appends new
+fingerprints to a flat binary file so the index survives between runs.
+"""
+
+import hashlib
+import os
+
+FINGERPRINT_SIZE = 8
+INDEX_FILENAME = ".report_index"
+
+
+def report_key(meta):
+    """
+    Builds the dedup key from report metadata, or None when the report has
+    no report_id (such reports are never treated as duplicates).
+    """
+    report_id = (meta.get("report_id") or "").strip()
+    if not report_id:
+        return None
+    org = (meta.get("org_name") or "").strip().lower()
+    return (org, report_id, meta.get("begin") or "", meta.get("end") or "")
+
+
+def fingerprint(key):
+    raw = "\x1f".join(str(part) for part in key).encode("utf-8")
+    return hashlib.blake2b(raw, digest_size=FINGERPRINT_SIZE).digest()
+
+
+class ReportIndex:
+    """Set of seen report keys, optionally persisted to an append-only file."""
+
+    def __init__(self, path=None):
+        self.path = path
+        self.duplicates = 0
+        self._seen = set()
+        self._fh = None
+        self._torn = False
+        if path and os.path.exists(path):
+            with open(path, "rb") as f:
+                data = f.read()
+            # A torn write at the end (crash mid-append) is simply ignored
+            # and cut off before the next append
+            usable = len(data) - len(data) % FINGERPRINT_SIZE
+            self._torn = usable != len(data)
+            self._seen = {
+                data[i : i + FINGERPRINT_SIZE]
+                for i in range(0, usable, FINGERPRINT_SIZE)
+            }
+
+    @classmethod
+    def for_archive(cls, directory):
+        """Opens the persistent index stored inside a report archive."""
+        os.makedirs(directory, exist_ok=True)
+        return cls(os.path.join(directory, INDEX_FILENAME))
+
+    def __len__(self):
+        return len(self._seen)
+
+    def __contains__(self, key):
+        return key is not None and fingerprint(key) in self._seen
+
+    def add(self, key):
+        """
+        Records a key. Returns False (and counts a duplicate) if it was
+        already present; keys of None are always accepted.
+        """
+        if key is None:
+            return True
+        fp = fingerprint(key)
+        if fp in self._seen:
+            self.duplicates += 1
+            return False
+        self._seen.add(fp)
+        if self.path:
+            if self._fh is None:
+                self._fh = open(self.path, "ab")
+                if self._torn:
+                    size = self._fh.seek(0, os.SEEK_END)
+                    self._fh.truncate(size - size % FINGERPRINT_SIZE)
+                    self._torn = False
+            self._fh.write(fp)
+            self._fh.flush()
+        return True
+
+    def close(self):
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
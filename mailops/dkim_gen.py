@@ -1,60 +1,103 @@
-import os
-import sys
-
-sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 import argparse
+import collections
 import os
 import shutil
 import subprocess
 import sys
 
 
+class DKIMKey(
+    collections.namedtuple("DKIMKey", "selector domain private_key public_key")
+):
+    """A generated key pair: private key path and base64 public key."""
+
+    __slots__ = ()
+
+    @property
+    def host(self):
+        return f"{self.selector}._domainkey"
+
+    @property
+    def record(self):
+        """TXT value to publish at host."""
+        return f"v=DKIM1; k=rsa; p={self.public_key}"
+
+
 def check_openssl():
     if not shutil.which("openssl"):
         print("Error: 'openssl' command not found.")
         sys.exit(1)
 
 
-def generate_keys(selector, output_dir="."):
-    priv_filename = os.path.join(output_dir, f"{selector}.private")
-    print(f"[*] Generating key for '{selector}'...")
+def public_key(priv_filename):
+    """Returns the base64 public key (DNS p= value) of a private key file."""
+    result = subprocess.run(
+        ["openssl", "rsa", "-in", priv_filename, "-pubout", "-outform", "PEM"],
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+    lines = result.stdout.splitlines()
+    return "".join(line for line in lines if "-----" not in line)
+
+
+def find_selectors(key_dir="."):
+    """Selectors with a generated <selector>.private key in key_dir."""
+    try:
+        names = os.listdir(key_dir)
+    except OSError:
+        return []
+    return sorted(n[: -len(".private")] for n in names if n.endswith(".private"))
+
 
+def create_key(selector, domain=None, output_dir="."):
+    """
+    Generates a 2048-bit RSA key as <output_dir>/<selector>.private and
+    returns a DKIMKey, without printing. Raises RuntimeError when openssl
+    is missing or fails.
+    """
+    if not shutil.which("openssl"):
+        raise RuntimeError("'openssl' command not found.")
+    priv_filename = os.path.join(output_dir, f"{selector}.private")
     try:
         subprocess.run(
             ["openssl", "genrsa", "-out", priv_filename, "2048"],
             check=True,
             stderr=subprocess.DEVNULL,
         )
-        result = subprocess.run(
-            ["openssl", "rsa", "-in", priv_filename, "-pubout", "-outform", "PEM"],
-            check=True,
-            capture_output=True,
-            text=True,
-        )
-        raw_key = result.stdout
+        clean_key = public_key(priv_filename)
     except subprocess.CalledProcessError as e:
-        print(f"OpenSSL Error: {e}")
-        sys.exit(1)
+        raise RuntimeError(f"OpenSSL Error: {e}") from e
+    return DKIMKey(selector, domain, priv_filename, clean_key)
 
-    lines = raw_key.splitlines()
-    clean_key = "".join(line for line in lines if "-----" not in line)
-    print(f"✅ Saved private key to: {priv_filename}")
-    return clean_key
 
+def generate_keys(selector, output_dir="."):
+    print(f"[*] Generating key for '{selector}'...")
+    try:
+        key = create_key(selector, output_dir=output_dir)
+    except RuntimeError as e:
+        print(e)
+        sys.exit(1)
 
-def generate_and_print(selector, domain):
-    check_openssl()
-    pub_key = generate_keys(selector)
-    record = f"v=DKIM1; k=rsa; p={pub_key}"
+    print(f"✅ Saved private key to: {key.private_key}")
+    return key.public_key
 
+
+def print_record(key):
     print("\n" + "=" * 60)
     print("DNS TXT RECORD TO ADD")
     print("=" * 60)
-    print(f"Host:   {selector}._domainkey")
-    print(f"Value:  {record}")
+    print(f"Host:   {key.host}")
+    print(f"Value:  {key.record}")
     print("=" * 60)
 
 
+def generate_and_print(selector, domain):
+    check_openssl()
+    pub_key = generate_keys(selector)
+    print_record(DKIMKey(selector, domain, f"{selector}.private", pub_key))
+
+
 def main():
     parser = argparse.ArgumentParser(description="Generate DKIM keys.")
     parser.add_argument("selector", help="DKIM selector")
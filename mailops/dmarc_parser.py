@@ -1,17 +1,22 @@
-import os
-import sys
-
-sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 # mailops/dmarc_parser.py
+import codecs
 import csv
+import functools
 import gzip
+import io
+import itertools
+import mmap
+import operator
 import os
+import re
 import socket
+import threading
+import time
 import xml.etree.ElementTree as ET
 import zipfile
 from datetime import datetime
 
-from . import ui  # Import the new UI module
+from . import asn, profiling, ui  # Import the new UI module
 
 IP_CACHE: dict[str, str] = {}
 
@@ -19,8 +24,11 @@ IP_CACHE: dict[str, str] = {}
 def resolve_ip(ip_address):
     """Resolves IP to Hostname with caching."""
     if ip_address in IP_CACHE:
+        profiling.count("ptr.cache_hit")
         return IP_CACHE[ip_address]
 
+    profiling.count("ptr.cache_miss")
+    start = time.perf_counter()
     try:
         socket.setdefaulttimeout(2)
         hostname, _, _ = socket.gethostbyaddr(ip_address)
@@ -30,6 +38,8 @@ def resolve_ip(ip_address):
         result = "Unknown"
         IP_CACHE[ip_address] = result
         return result
+    finally:
+        profiling.observe("dns.ptr", time.perf_counter() - start)
 
 
 def analyze_record(spf, dkim, disposition):
@@ -48,140 +58,702 @@ def analyze_record(spf, dkim, disposition):
 
 # --- Core Logic ---
 
+# Bytes fed to the XML pull parser per step
+CHUNK_SIZE = 1 << 16
+
+# report_metadata fields collected before the first <record>
+_METADATA_TAGS = {"org_name", "email", "report_id", "begin", "end"}
 
-def parse_dmarc_xml(file_path):
-    tree = None
-    filename = os.path.basename(file_path)
-    records_data = []
 
+def open_report(file_path, data=None):
+    """
+    Returns a binary stream of the report (XML, or JSON for TLS reports),
+    unpacking .gz/.zip on the fly, or None for a zip without XML. Pass
+    `data` to read an in-memory payload (file_path is then only used for
+    its extension). Plain XML files are memory-mapped, so reads come
+    straight from the page cache.
+    """
+    name = file_path.lower()
+    source = io.BytesIO(data) if data is not None else None
+    if name.endswith(".gz"):
+        return gzip.GzipFile(fileobj=source) if source else gzip.open(file_path)
+    if name.endswith(".zip"):
+        z = zipfile.ZipFile(source or file_path, "r")
+        xml_files = [n for n in z.namelist() if n.lower().endswith(".xml")]
+        if not xml_files:
+            z.close()
+            return None
+        return z.open(xml_files[0])
+    if source is None and name.endswith(".xml"):
+        return _map_file(file_path)
+    return source or open(file_path, "rb")
+
+
+def _map_file(file_path):
+    with open(file_path, "rb") as f:
+        try:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            # Empty file, or a filesystem that can't map it
+            return open(file_path, "rb")
+
+
+def read_report_bytes(file_path):
+    """Returns the raw XML of a report file, unpacking .gz/.zip as needed."""
+    stream = open_report(file_path)
+    if stream is None:
+        return None
+    with stream:
+        return stream.read()
+
+
+def iter_report_events(stream):
+    """
+    Feeds the stream to a pull parser chunk by chunk, yielding the element
+    of every end event (only completed elements are of interest).
+    """
+    parser = ET.XMLPullParser(events=("end",))
+    while True:
+        with profiling.stage("report.decompress"):
+            chunk = stream.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        profiling.count("report.bytes", len(chunk))
+        with profiling.stage("report.xml_parse"):
+            parser.feed(chunk)
+        for _, elem in parser.read_events():
+            yield elem
+    with profiling.stage("report.xml_parse"):
+        parser.close()
+    for _, elem in parser.read_events():
+        yield elem
+
+
+def read_header(elements):
+    """
+    Consumes elements up to the first complete <record> and returns
+    (metadata, record); record is None if the report has none. Metadata
+    holds org_name, email, report_id, begin, end and the policy domain.
+    """
+    meta = dict.fromkeys(_METADATA_TAGS | {"domain"})
+    for elem in elements:
+        tag = elem.tag
+        if tag == "record":
+            return meta, elem
+        if tag == "report_metadata":
+            for child in elem.iter():
+                if child.tag in _METADATA_TAGS:
+                    meta[child.tag] = (child.text or "").strip()
+        elif tag == "policy_published":
+            meta["domain"] = (elem.findtext("domain") or "").strip().lower()
+    return meta, None
+
+
+def read_report_metadata(file_path, data=None):
+    """Reads only the header of a report (see read_header); None if unreadable."""
     try:
-        if file_path.endswith(".gz"):
-            with gzip.open(file_path, "rb") as f:
-                tree = ET.parse(f)
-        elif file_path.endswith(".zip"):
-            with zipfile.ZipFile(file_path, "r") as z:
-                xml_files = [n for n in z.namelist() if n.lower().endswith(".xml")]
-                if not xml_files:
-                    return []
-                with z.open(xml_files[0]) as f:
-                    tree = ET.parse(f)
-        else:
-            tree = ET.parse(file_path)
-        root = tree.getroot()
-    except Exception as e:
-        ui.print_error(f"Processing '{filename}': {e}")
-        return []
+        stream = open_report(file_path, data)
+        if stream is None:
+            return None
+        with stream:
+            meta, _ = read_header(iter_report_events(stream))
+        return meta
+    except Exception:
+        return None
+
+
+def _format_day(timestamp):
+    if not timestamp:
+        return "Unknown"
+    return datetime.fromtimestamp(int(timestamp)).strftime("%Y-%m-%d")
+
+
+# --- Record extraction ---
+#
+# Reports are machine-generated: a reporter writes every record with the
+# same few element layouts. The first record of each layout is walked tag
+# by tag to compile a _Layout, a regex matching records of that shape and
+# capturing their leaves; later records are then read with a single match.
+# Layouts are cached across reports. Reports the regexes cannot read
+# (comments, CDATA, DTDs, namespaces, attributes, other encodings) go
+# through ElementTree instead, walking each <record> once. Both paths
+# dispatch on (parent tag, tag) through record_fields(). The fast path
+# only accepts what ElementTree would: tags that pair up, the five XML
+# entities and character references, and characters XML allows; anything
+# else is left to ElementTree to read or reject.
+
+# Leaves of <record> copied into its fields
+_RECORD_PATHS = {
+    ("row", "source_ip"): "source_ip",
+    ("row", "count"): "count",
+    ("policy_evaluated", "disposition"): "disposition",
+    ("identifiers", "header_from"): "header_from",
+    ("identifiers", "envelope_from"): "envelope_from",
+}
+# Leaves of an auth_results entry: [method, domain, selector/scope, result]
+_AUTH_SLOTS = {"domain": 1, "selector": 2, "scope": 2, "result": 3}
+
+_TAG_RE = re.compile(r"<(/?)([\w.-]+)\s*(/?)>")
+_ENCODING_RE = re.compile(r"""\s*<\?xml[^>]*?encoding=["']([\w.-]+)""")
+_UTF8 = {"utf-8", "utf8", "us-ascii", "ascii"}
+_ENTITY_RE = re.compile(r"&(#[0-9]+|#x[0-9a-fA-F]+|[\w.-]*)(;?)")
+_XML_ENTITIES = {"lt": "<", "gt": ">", "amp": "&", "quot": '"', "apos": "'"}
+# Characters XML 1.0 doesn't allow, even as references
+_INVALID = r"\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff"
+_INVALID_RE = re.compile(f"[{_INVALID}]")
+# Layout regexes: XML whitespace between tags, leaf text without markup
+_WS = r"[ \t\r\n]*"
+_LEAF = f"([^<{_INVALID}]*)"
+_TAIL_RE = re.compile(f"{_WS}</feedback>{_WS}")
+
+# Most recently used first
+_LAYOUTS: list = []
+MAX_LAYOUTS = 16
+_layouts_lock = threading.Lock()
+
+
+class _Unsupported(Exception):
+    """XML the fast path leaves to ElementTree."""
+
+
+def _entity(match):
+    name, semicolon = match.groups()
+    if not semicolon:
+        raise _Unsupported  # a bare "&"
+    if name in _XML_ENTITIES:
+        return _XML_ENTITIES[name]
+    if not name.startswith("#"):
+        raise _Unsupported  # undefined entity (e.g. HTML's &nbsp;)
+    try:
+        char = chr(int(name[2:], 16) if name[1] == "x" else int(name[1:]))
+    except (ValueError, OverflowError):
+        raise _Unsupported from None
+    if _INVALID_RE.match(char) or "\ud800" <= char <= "\udfff":
+        raise _Unsupported
+    return char
 
-    org_name = root.findtext(".//org_name") or "Unknown Org"
 
-    date_range = root.find(".//date_range")
-    if date_range is not None:
-        begin_ts = int(date_range.findtext("begin", 0))
-        end_ts = int(date_range.findtext("end", 0))
-        begin_date = datetime.fromtimestamp(begin_ts).strftime("%Y-%m-%d")
-        end_date = datetime.fromtimestamp(end_ts).strftime("%Y-%m-%d")
-    else:
-        begin_date = end_date = "Unknown"
+def _unescape(text):
+    """Decodes XML entity and character references in leaf text."""
+    return _ENTITY_RE.sub(_entity, text)
 
-    records = root.findall("record")
-    if not records:
-        return []
 
-    for record in records:
-        row = record.find("row")
-        source_ip = row.findtext("source_ip")
-        count = row.findtext("count")
-        disposition = row.find(".//policy_evaluated/disposition").text
-
-        spf = record.find(".//auth_results/spf/result")
-        spf_res = spf.text if spf is not None else "none"
-
-        dkim = record.find(".//auth_results/dkim/result")
-        dkim_res = dkim.text if dkim is not None else "none"
-
-        hostname = resolve_ip(source_ip)
-        status_msg, status_color = analyze_record(spf_res, dkim_res, disposition)
-
-        records_data.append(
-            {
-                "org_name": org_name,
-                "date": begin_date,
-                "source_ip": source_ip,
-                "hostname": hostname,
-                "count": count,
-                "spf": spf_res,
-                "dkim": dkim_res,
-                "disposition": disposition,
-                "status_msg": status_msg,
-                "status_color": status_color,
-                "file": filename,
-            }
-        )
+def record_fields(nodes):
+    """
+    Collects the fields of one <record> from its (parent tag, tag, text)
+    nodes in document order: the _RECORD_PATHS leaves, plus "auth" with
+    one (method, domain, selector or scope, result) per auth_results
+    entry (every DKIM signature, not just the first).
+    """
+    auth = []
+    fields = {"auth": auth}
+    for parent, tag, text in nodes:
+        field = _RECORD_PATHS.get((parent, tag))
+        if field is not None:
+            fields[field] = text
+        elif parent == "auth_results":
+            auth.append([tag, "", "", ""])
+        elif auth and parent == auth[-1][0]:
+            slot = _AUTH_SLOTS.get(tag)
+            if slot:
+                auth[-1][slot] = text
+    fields["auth"] = tuple(map(tuple, auth))
+    return fields
+
+
+def _tree_nodes(elem):
+    for child in elem:
+        yield elem.tag, child.tag, (child.text or "").strip()
+        yield from _tree_nodes(child)
+
+
+def _scan_tree(stream):
+    elements = iter_report_events(stream)
+    meta, first = read_header(elements)
+    if first is None:
+        return
+    yield meta
+    for record in itertools.chain((first,), elements):
+        if record.tag == "record":
+            yield record_fields(_tree_nodes(record))
+            # Finished records are not needed any more; keep memory flat
+            record.clear()
+
+
+class _Layout:
+    """
+    The element layout of a record: a regex matching the text of records
+    laid out the same way (up to whitespace and leaf text), with one group
+    per leaf, and which groups record_fields() reads.
+    """
+
+    def __init__(self, text):
+        tags = _TAG_RE.findall(text)
+        if not tags or tags[0] != ("", "record", ""):
+            raise _Unsupported
+        if any(tag == "record" for _, tag, _ in tags[1:]):
+            raise _Unsupported  # </record> written differently: not split
+        pattern = [_WS]
+        nodes = []  # (parent, tag, group index or -1)
+        stack = []
+        groups = 0
+        i = 0
+        while i < len(tags):
+            close, tag, empty = tags[i]
+            name = re.escape(tag)
+            parent = stack[-1] if stack else None
+            if close:
+                if not stack or stack.pop() != tag:
+                    raise _Unsupported  # mismatched tags: ElementTree rejects them
+                pattern.append(f"</{name}>")
+            elif empty:
+                pattern.append(f"<{name}{_WS}/>")
+                nodes.append((parent, tag, -1))
+            elif i + 1 < len(tags) and tags[i + 1] == ("/", tag, ""):
+                pattern.append(f"<{name}>{_LEAF}</{name}>")
+                nodes.append((parent, tag, groups))
+                groups += 1
+                i += 1
+            else:
+                pattern.append(f"<{name}>")
+                nodes.append((parent, tag, -1))
+                stack.append(tag)
+            pattern.append(_WS)
+            i += 1
+        if stack != ["record"]:
+            raise _Unsupported  # an element left open
+        self.regex = re.compile("".join(pattern))
+
+        # record_fields() on group numbers says where each field comes from
+        plan = record_fields(nodes)
+        self.auth = [
+            (entry[0], operator.itemgetter(*[-1 if g == "" else g for g in entry[1:]]))
+            for entry in plan.pop("auth")
+        ]
+        self.names = list(plan)
+        # The extra -1 keeps the result a tuple even for a single field
+        self.leaves = operator.itemgetter(*plan.values(), -1)
+
+    def read(self, match, entities=False):
+        """The record_fields() of a record matched by self.regex."""
+        values = match.groups()
+        if entities:
+            # Decoded first, like ElementTree: "&#32;pass" reads as "pass"
+            values = map(_unescape, values)
+        values = (*map(str.strip, values), "")  # [-1]: leaves without text
+        fields = dict(zip(self.names, self.leaves(values)))
+        auth = [(method, *slots(values)) for method, slots in self.auth]
+        fields["auth"] = tuple(auth)
+        return fields
+
+
+def _layout_fields(text):
+    """record_fields() for the text of a <record> (without </record>)."""
+    for layout in _LAYOUTS:
+        match = layout.regex.fullmatch(text)
+        if match:
+            if layout is not _LAYOUTS[0]:
+                with _layouts_lock:
+                    if layout in _LAYOUTS:
+                        _LAYOUTS.remove(layout)
+                    _LAYOUTS.insert(0, layout)
+            return layout.read(match, "&" in text)
+    layout = _Layout(text)
+    match = layout.regex.fullmatch(text)
+    if not match:
+        raise _Unsupported  # attributes, prefixes, mixed content...
+    profiling.count("report.layouts")
+    with _layouts_lock:
+        _LAYOUTS.insert(0, layout)
+        del _LAYOUTS[MAX_LAYOUTS:]
+    return layout.read(match, "&" in text)
+
+
+def _plain_header(text):
+    """read_header() for the text before the first <record>."""
+    declared = _ENCODING_RE.match(text)
+    if declared and declared.group(1).lower() not in _UTF8:
+        raise _Unsupported
+    if "<feedback>" not in text:
+        raise _Unsupported  # namespaced or prefixed root
+    parser = ET.XMLPullParser(events=("end",))
+    parser.feed(text)
+    meta, _ = read_header(elem for _, elem in parser.read_events())
+    return meta
+
+
+def _scan_fast(stream):
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    meta = None
+    header = False
+    buf = ""
+    read = 0
+    try:
+        while True:
+            with profiling.stage("report.decompress"):
+                chunk = stream.read(CHUNK_SIZE)
+            read += len(chunk)
+            try:
+                buf += decoder.decode(chunk, final=not chunk)
+            except UnicodeDecodeError:
+                raise _Unsupported from None
+            if "<!" in buf:
+                raise _Unsupported  # comments, CDATA, DTDs
+            if "]]>" in buf:
+                raise _Unsupported  # not allowed in text: ElementTree rejects it
+
+            with profiling.stage("report.xml_parse"):
+                if meta is None:
+                    first = buf.find("<record>")
+                    if first < 0 and chunk:
+                        continue
+                    if first < 0:
+                        if "record" in buf:
+                            raise _Unsupported
+                        return
+                    meta = _plain_header(buf[:first])
+                    buf = buf[first:]
+                    header = True
+                # The last part is an unfinished record (or the document end)
+                parts = buf.split("</record>")
+                buf = parts.pop()
+                records = [_layout_fields(part) for part in parts]
+
+            if header:
+                yield meta
+                header = False
+            yield from records
+            if not chunk:
+                break
+        if not _TAIL_RE.fullmatch(buf):
+            raise _Unsupported  # truncated or trailing data: ElementTree says why
+    except _Unsupported:
+        read = 0  # ElementTree reads the report again and counts it
+        raise
+    finally:
+        if read:
+            profiling.count("report.bytes", read)
+
+
+def iter_records(stream, fast=True):
+    """
+    Yields the report's metadata (see read_header), then the fields of
+    each <record> (see record_fields). Nothing is yielded for a report
+    without records. fast=False reads the report with ElementTree.
+    """
+    return _scan_fast(stream) if fast else _scan_tree(stream)
+
 
+@functools.lru_cache(maxsize=4096)
+def summarize_auth(auth):
+    """
+    Returns (spf, dkim, auth_results) for the "auth" entries of a record:
+    the overall SPF and DKIM results (pass if any entry passed, else the
+    first one, else "none") and every entry as text, e.g.
+    "dkim=pass example.com/selector1, dkim=fail esp.example, spf=pass ...".
+    Cached: the same few combinations repeat across a report's records.
+    """
+    overall = {}
+    parts = []
+    for method, domain, detail, result in auth:
+        result = result or "none"
+        if method not in overall or result == "pass":
+            overall[method] = result
+        if method == "dkim" and detail:
+            domain = f"{domain}/{detail}"
+        parts.append(f"{method}={result} {domain}")
+    spf = overall.get("spf", "none")
+    return spf, overall.get("dkim", "none"), ", ".join(parts)
+
+
+@profiling.timed("report.parse")
+def read_records(file_path, resolve_hosts=True, index=None, report_filter=None):
+    """
+    Streams one aggregate report and returns its records as dicts.
+    Reports rejected by an archive.ReportFilter, or whose (org, report_id,
+    date range) is already in a dedup.ReportIndex, are dropped right after
+    their header is read. Unreadable reports raise; see parse_dmarc_xml.
+    """
+    filename = os.path.basename(file_path)
+    admitted = False
+
+    # Layout regexes first; ElementTree if the report needs it
+    for fast in (True, False):
+        records_data = []
+        try:
+            stream = open_report(file_path)
+            if stream is None:
+                return []
+            with stream:
+                scan = iter_records(stream, fast)
+                meta = next(scan, None)
+                if meta is None:
+                    return []
+                if not admitted:
+                    if report_filter and not report_filter.matches(meta):
+                        profiling.count("report.filtered")
+                        return []
+                    if index is not None:
+                        from . import dedup
+
+                        if not index.add(dedup.report_key(meta)):
+                            profiling.count("report.duplicates")
+                            return []
+                    admitted = True
+
+                org_name = meta["org_name"] or "Unknown Org"
+                asn_db = asn.get_database()
+                begin_date = _format_day(meta["begin"])
+                report_id = meta["report_id"]
+                domain = meta["domain"]
+
+                for fields in scan:
+                    source_ip = fields.get("source_ip") or ""
+                    spf_res, dkim_res, auth_results = summarize_auth(fields["auth"])
+                    disposition = fields.get("disposition") or "none"
+
+                    hostname = ""
+                    if resolve_hosts and source_ip:
+                        hostname = resolve_ip(source_ip)
+                    network = asn_db.lookup(source_ip) if asn_db else None
+                    status_msg, status_color = analyze_record(
+                        spf_res, dkim_res, disposition
+                    )
+
+                    records_data.append(
+                        {
+                            "org_name": org_name,
+                            "date": begin_date,
+                            "source_ip": source_ip,
+                            "hostname": hostname,
+                            "count": fields.get("count"),
+                            "spf": spf_res,
+                            "dkim": dkim_res,
+                            "disposition": disposition,
+                            "status_msg": status_msg,
+                            "status_color": status_color,
+                            "file": filename,
+                            "report_id": report_id,
+                            "domain": domain,
+                            "header_from": fields.get("header_from") or "",
+                            "envelope_from": fields.get("envelope_from") or "",
+                            "auth_results": auth_results,
+                            "asn": network[0] if network else None,
+                            "as_org": network[1] if network else "",
+                        }
+                    )
+            break
+        except _Unsupported:
+            profiling.count("report.slow_path")
+
+    if records_data:
+        profiling.count("report.files")
+        profiling.count("report.records", len(records_data))
     return records_data
 
 
-def print_to_console(all_data):
+def parse_dmarc_xml(file_path, resolve_hosts=True, index=None, report_filter=None):
+    """
+    Like read_records, but prints an error and returns [] for a report
+    that can't be read.
+    """
+    try:
+        return read_records(file_path, resolve_hosts, index, report_filter)
+    except Exception as e:
+        ui.print_error(f"Processing '{os.path.basename(file_path)}': {e}")
+        return []
+
+
+def ingest_hook(*consumers, tls_consumers=()):
+    """
+    Returns an on_saved(filepath) hook for fetch_reports that parses each
+    new report once (without PTR lookups) and passes its records to every
+    consumer. SMTP TLS reports go to tls_consumers instead (records from
+    tlsrpt.parse_tlsrpt).
+    """
+    from . import archive
+
+    def on_saved(filepath):
+        if archive.report_kind(filepath) == "tlsrpt":
+            from . import tlsrpt
+
+            records = tlsrpt.parse_tlsrpt(filepath)
+            for consume in tls_consumers:
+                consume(records)
+            return
+        records = parse_dmarc_xml(filepath, resolve_hosts=False)
+        for consume in consumers:
+            consume(records)
+
+    return on_saved
+
+
+# Columns for CSV/TSV/JSON exports (status_color is console-only)
+EXPORT_FIELDS = [
+    "org_name",
+    "date",
+    "source_ip",
+    "hostname",
+    "count",
+    "spf",
+    "dkim",
+    "disposition",
+    "status_msg",
+    "header_from",
+    "envelope_from",
+    "auth_results",
+    "file",
+    "asn",
+    "as_org",
+]
+
+# Columns of the per-network failure summary
+NETWORK_FIELDS = ["asn", "as_org", "sources", "messages", "failed", "fail_rate"]
+
+OUTPUT_FORMATS = ["table"] + list(ui.RENDERERS)
+
+
+@profiling.timed("render.console")
+def print_to_console(all_data, stream=None):
     if not all_data:
         ui.print_warning("No records found.")
         return
 
     current_file = None
-    header_fmt = "{:<20} | {:<30} | {:<5} | {:<6} | {:<6} | {:<15}"
-    row_fmt = "{:<20} | {:<30} | {:<5} | {:<6} | {:<6} | {:<15}"
-
-    for row in all_data:
-        if row["file"] != current_file:
-            current_file = row["file"]
-            ui.print_sub_header(f"Report: {row['org_name']} ({row['date']})")
-            print("-" * 95)
-            print(
-                ui.Colors.HEADER
-                + header_fmt.format(
-                    "Source IP", "Hostname", "Cnt", "SPF", "DKIM", "Analysis"
+    # %-formatting is noticeably cheaper than str.format on large reports
+    row_fmt = "%s%-20s | %-30s | %-5s | %-6s | %-6s | %-15s%s"
+    rule = "-" * 95
+    reset = ui.Colors.RESET
+    header = row_fmt % (
+        ui.Colors.HEADER,
+        "Source IP",
+        "Hostname",
+        "Cnt",
+        "SPF",
+        "DKIM",
+        "Analysis",
+        reset,
+    )
+
+    with ui.BufferedOutput(stream) as out:
+        for row in all_data:
+            if row["file"] != current_file:
+                current_file = row["file"]
+                out.write_line(
+                    ui.format_sub_header(f"Report: {row['org_name']} ({row['date']})")
+                )
+                out.write_line(rule)
+                out.write_line(header)
+                out.write_line(rule)
+
+            hostname = row["hostname"]
+            host_display = (hostname[:27] + "..") if len(hostname) > 29 else hostname
+
+            out.write_line(
+                row_fmt
+                % (
+                    row["status_color"],
+                    row["source_ip"],
+                    host_display,
+                    row["count"],
+                    row["spf"],
+                    row["dkim"],
+                    row["status_msg"],
+                    reset,
                 )
-                + ui.Colors.RESET
             )
-            print("-" * 95)
 
-        host_display = (
-            (row["hostname"][:27] + "..")
-            if len(row["hostname"]) > 29
-            else row["hostname"]
-        )
 
-        line = row_fmt.format(
-            row["source_ip"],
-            host_display,
-            row["count"],
-            row["spf"],
-            row["dkim"],
-            row["status_msg"],
+@profiling.timed("render.export")
+def render_records(all_data, fmt="table", stream=None):
+    """Writes records as a console table or as tsv/json/jsonl."""
+    if fmt == "table":
+        print_to_console(all_data, stream)
+    else:
+        ui.get_renderer(fmt, EXPORT_FIELDS, stream).render(all_data)
+
+
+def summarize_networks(all_data):
+    """
+    Groups records by ASN (records without one fall back to their source
+    IP), most failing messages first.
+    """
+    groups = {}
+    for r in all_data:
+        key = r.get("asn") or r["source_ip"]
+        g = groups.get(key)
+        if g is None:
+            g = groups[key] = {
+                "asn": r.get("asn") or "",
+                "as_org": r.get("as_org") or r.get("hostname") or "",
+                "sources": set(),
+                "messages": 0,
+                "failed": 0,
+            }
+        try:
+            count = int(r["count"] or 0)
+        except ValueError:
+            count = 0
+        g["sources"].add(r["source_ip"])
+        g["messages"] += count
+        if r["status_msg"] != "OK":
+            g["failed"] += count
+
+    rows = []
+    for g in groups.values():
+        g["sources"] = len(g["sources"])
+        g["fail_rate"] = round(g["failed"] / g["messages"], 3) if g["messages"] else 0
+        rows.append(g)
+    rows.sort(key=lambda g: (-g["failed"], -g["messages"]))
+    return rows
+
+
+@profiling.timed("render.networks")
+def render_networks(rows, fmt="table", stream=None):
+    """Writes summarize_networks() rows as a table or as tsv/json/jsonl."""
+    if fmt != "table":
+        ui.get_renderer(fmt, NETWORK_FIELDS, stream).render(rows)
+        return
+    if not rows:
+        ui.print_warning("No records found.")
+        return
+    row_fmt = "%-10s | %-32s | %7s | %9s | %9s | %6s"
+    with ui.BufferedOutput(stream) as out:
+        out.write_line(ui.format_sub_header("Messages by network"))
+        out.write_line(
+            ui.Colors.HEADER
+            + row_fmt % ("ASN", "Network", "Sources", "Messages", "Failed", "Fail%")
+            + ui.Colors.RESET
         )
-        print(row["status_color"] + line + ui.Colors.RESET)
+        out.write_line("-" * 88)
+        for g in rows:
+            color = ui.Colors.RED if g["failed"] else ui.Colors.GREEN
+            out.write_line(
+                color
+                + row_fmt
+                % (
+                    f"AS{g['asn']}" if g["asn"] else "-",
+                    g["as_org"][:32],
+                    g["sources"],
+                    g["messages"],
+                    g["failed"],
+                    f"{g['fail_rate']:.0%}",
+                )
+                + ui.Colors.RESET
+            )
 
 
+@profiling.timed("render.csv")
 def save_to_csv(all_data, output_file):
     if not all_data:
         return
 
     clean_data = [{k: v for k, v in r.items() if k != "status_color"} for r in all_data]
-    headers = [
-        "org_name",
-        "date",
-        "source_ip",
-        "hostname",
-        "count",
-        "spf",
-        "dkim",
-        "disposition",
-        "status_msg",
-        "file",
-    ]
+    headers = EXPORT_FIELDS
 
     try:
         with open(output_file, "w", newline="") as f:
-            writer = csv.DictWriter(f, fieldnames=headers)
+            writer = csv.DictWriter(f, fieldnames=headers, extrasaction="ignore")
             writer.writeheader()
             writer.writerows(clean_data)
         ui.print_success(f"Exported to {output_file}")
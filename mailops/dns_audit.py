@@ -0,0 +1,291 @@
+# mailops/dns_audit.py
+"""
+Mail DNS posture audit: SPF, DMARC, DKIM, MTA-STS, TLS-RPT and BIMI.
+
+Every query needed for a domain (or a whole portfolio) is planned up front
+and resolved in one concurrent batch through a shared Resolver, so a full
+audit costs about one DNS round trip per batch instead of one per record.
+The checks then run on the collected answers without touching the network.
+"""
+
+import base64
+import binascii
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from . import doh, profiling, scheduler, spf_check, ui
+
+MAX_WORKERS = 32
+
+CHECKS = ("spf", "dmarc", "dkim", "mta-sts", "tls-rpt", "bimi")
+
+# Worst first, for sorting and summaries
+STATUSES = ("fail", "error", "warn", "info", "ok")
+
+
+class Resolver:
+    """
+    Resolves many (name, type) questions concurrently over DoH. Each
+    distinct question is sent once and its answer (or exception) cached, so
+    the same resolver can be shared by several audits. A question may name
+    the zone it is about as a third item, (name, type, zone): the RBL or
+    the audited domain, whose own circuit breaker its SERVFAILs count
+    against (see scheduler.py). `lane` is the
+    scheduler lane the queries wait in.
+    """
+
+    def __init__(self, max_workers=MAX_WORKERS, lane=scheduler.INTERACTIVE):
+        self.max_workers = max_workers
+        self.lane = lane
+        self._cache = {}
+
+    def resolve_many(self, questions):
+        questions = list(dict.fromkeys(questions))
+        todo = [q for q in questions if q not in self._cache]
+        if todo:
+            workers = min(self.max_workers, len(todo))
+            with profiling.stage("dns.batch"), ThreadPoolExecutor(workers) as pool:
+                for question, answer in zip(todo, pool.map(self._query, todo)):
+                    self._cache[question] = answer
+        return {q: self._cache[q] for q in questions}
+
+    def _query(self, question):
+        try:
+            return doh.query(*question, lane=self.lane)
+        except Exception as e:
+            return e
+
+
+def txt_strings(response):
+    """TXT answers of a DoH response as plain strings (quoted chunks joined)."""
+    if isinstance(response, Exception):
+        raise response
+    return [
+        answer["data"].strip('"').replace('" "', "")
+        for answer in response.get("Answer", [])
+        if answer.get("type", 16) == 16
+    ]
+
+
+def parse_tags(record):
+    """'v=DMARC1; p=reject' -> {'v': 'DMARC1', 'p': 'reject'}"""
+    tags = {}
+    for part in record.split(";"):
+        key, sep, value = part.partition("=")
+        if sep:
+            tags[key.strip().lower()] = value.strip()
+    return tags
+
+
+def plan(domain, selectors=()):
+    """Returns (check, selector, name, type) for every record to look up."""
+    queries = [
+        ("spf", None, domain, "TXT"),
+        ("dmarc", None, f"_dmarc.{domain}", "TXT"),
+    ]
+    queries += [("dkim", s, f"{s}._domainkey.{domain}", "TXT") for s in selectors]
+    queries += [
+        ("mta-sts", None, f"_mta-sts.{domain}", "TXT"),
+        ("tls-rpt", None, f"_smtp._tls.{domain}", "TXT"),
+        ("bimi", None, f"default._bimi.{domain}", "TXT"),
+    ]
+    return queries
+
+
+# --- Checks: (records, selector) -> [(status, message)] ---
+
+
+def _only(records, prefix):
+    prefix = prefix.lower()
+    return [r for r in records if r.lower().startswith(prefix)]
+
+
+def check_spf(records, selector=None):
+    found = _only(records, "v=spf1")
+    if not found:
+        return [("fail", "No SPF record")]
+    if len(found) > 1:
+        return [("fail", f"{len(found)} SPF records; only one is allowed")]
+    issues, warnings, lookups = spf_check.evaluate_spf(found[0])
+    results = [("fail", i) for i in issues] + [("warn", w) for w in warnings]
+    return results or [("ok", f"Valid ({lookups}/10 DNS lookups)")]
+
+
+def check_dmarc(records, selector=None):
+    found = _only(records, "v=DMARC1")
+    if not found:
+        return [("fail", "No DMARC record")]
+    if len(found) > 1:
+        return [("fail", f"{len(found)} DMARC records; receivers will ignore them")]
+    tags = parse_tags(found[0])
+    policy = tags.get("p", "").lower()
+    if policy not in ("none", "quarantine", "reject"):
+        return [("fail", f"Invalid or missing policy p={policy or '(none)'}")]
+    results = []
+    if policy == "none":
+        results.append(("warn", "p=none only monitors; spoofed mail is delivered"))
+    if tags.get("pct", "100") != "100":
+        results.append(("warn", f"Policy applies to pct={tags['pct']}% of mail"))
+    if tags.get("sp", "").lower() == "none" and policy != "none":
+        results.append(("warn", "Subdomains are unprotected (sp=none)"))
+    if not tags.get("rua"):
+        results.append(("warn", "No rua= tag, so no aggregate reports are sent"))
+    return results or [("ok", f"p={policy}, reports to {tags['rua']}")]
+
+
+def _published_key(records):
+    """Tags of the first DKIM key record (the one with p=), or None."""
+    for record in records:
+        tags = parse_tags(record)
+        if "p" in tags:
+            return tags
+    return None
+
+
+def check_dkim(records, selector=None):
+    tags = _published_key(records)
+    if tags is None:
+        return [("fail", f"No key published for selector '{selector}'")]
+    key = tags["p"].replace(" ", "")
+    if not key:
+        return [("fail", f"Key for selector '{selector}' is revoked (empty p=)")]
+    try:
+        der = base64.b64decode(key, validate=True)
+    except (binascii.Error, ValueError):
+        return [("fail", "Public key is not valid base64")]
+    kind = tags.get("k", "rsa").lower()
+    if kind == "rsa" and len(der) < 270:
+        # A 2048-bit RSA SubjectPublicKeyInfo is 294 bytes, 1024-bit is 162
+        return [("warn", "RSA key shorter than 2048 bits")]
+    if kind not in ("rsa", "ed25519"):
+        return [("warn", f"Unknown key type k={kind}")]
+    return [("ok", f"{kind} key published")]
+
+
+def check_mta_sts(records, selector=None):
+    found = _only(records, "v=STSv1")
+    if not found:
+        return [("warn", "MTA-STS not configured; inbound TLS can be downgraded")]
+    policy_id = parse_tags(found[0]).get("id")
+    if not policy_id:
+        return [("fail", "MTA-STS record has no id=")]
+    return [("ok", f"Policy id={policy_id}")]
+
+
+def check_tls_rpt(records, selector=None):
+    found = _only(records, "v=TLSRPTv1")
+    if not found:
+        return [("warn", "TLS-RPT not configured; TLS failures go unreported")]
+    rua = parse_tags(found[0]).get("rua")
+    if not rua:
+        return [("fail", "TLS-RPT record has no rua=")]
+    return [("ok", f"Reports to {rua}")]
+
+
+def check_bimi(records, selector=None):
+    found = _only(records, "v=BIMI1")
+    if not found:
+        return [("info", "No BIMI record (optional)")]
+    tags = parse_tags(found[0])
+    if not tags.get("l"):
+        return [("fail", "BIMI record has no logo URL (l=)")]
+    if not tags.get("a"):
+        return [("warn", "No certificate (a=); some mailboxes won't show the logo")]
+    return [("ok", "Logo and certificate published")]
+
+
+CHECKERS = {
+    "spf": check_spf,
+    "dmarc": check_dmarc,
+    "dkim": check_dkim,
+    "mta-sts": check_mta_sts,
+    "tls-rpt": check_tls_rpt,
+    "bimi": check_bimi,
+}
+
+
+def _local_keys(selectors, key_dir):
+    """Public keys of <selector>.private files created by dkim_gen."""
+    from . import dkim_gen
+
+    keys = {}
+    for selector in selectors:
+        path = os.path.join(key_dir, f"{selector}.private")
+        if os.path.exists(path):
+            try:
+                keys[selector] = dkim_gen.public_key(path)
+            except Exception:
+                pass  # no openssl: skip the comparison
+    return keys
+
+
+@profiling.timed("dns.audit")
+def audit(domains, selectors=(), key_dir=None, resolver=None):
+    """
+    Audits every domain in one batch of DNS queries. Returns findings as
+    dicts: domain, check, name, status (see STATUSES), message.
+    If key_dir is given, DKIM keys found there are compared with DNS.
+    """
+    resolver = resolver or Resolver()
+    plans = [(domain, q) for domain in domains for q in plan(domain, selectors)]
+    # Keyed on the audited domain, so one broken domain trips only its breaker
+    questions = [(name, rtype, domain) for domain, (_, _, name, rtype) in plans]
+    answers = resolver.resolve_many(questions)
+    local = _local_keys(selectors, key_dir) if key_dir else {}
+
+    findings = []
+    for domain, (check, selector, name, rtype) in plans:
+        try:
+            records = txt_strings(answers[(name, rtype, domain)])
+        except Exception as e:
+            records = None
+            results = [("error", f"Lookup failed: {e}")]
+        if records is not None:
+            results = CHECKERS[check](records, selector)
+            if check == "dkim" and selector in local and results[0][0] != "fail":
+                published = _published_key(records)["p"].replace(" ", "")
+                if published != local[selector]:
+                    mismatch = f"Published key doesn't match {selector}.private"
+                    results = [("fail", mismatch)]
+        for status, message in results:
+            findings.append(
+                {
+                    "domain": domain,
+                    "check": check,
+                    "name": name,
+                    "status": status,
+                    "message": message,
+                }
+            )
+    return findings
+
+
+def summarize(findings):
+    """Worst status per (domain, check)."""
+    worst = {}
+    for f in findings:
+        key = (f["domain"], f["check"])
+        current = worst.get(key)
+        if current is None or STATUSES.index(f["status"]) < STATUSES.index(current):
+            worst[key] = f["status"]
+    return worst
+
+
+def print_findings(findings):
+    colors = {
+        "ok": ui.Colors.GREEN,
+        "info": ui.Colors.BLUE,
+        "warn": ui.Colors.YELLOW,
+        "fail": ui.Colors.RED,
+        "error": ui.Colors.RED,
+    }
+    current = None
+    with ui.BufferedOutput() as out:
+        for f in findings:
+            if f["domain"] != current:
+                current = f["domain"]
+                out.write_line(ui.format_sub_header(f"DNS audit: {current}"))
+            out.write_line(
+                f"{colors[f['status']]}{f['status'].upper():<5}{ui.Colors.RESET} "
+                f"{f['check']:<8} {f['message']}"
+            )
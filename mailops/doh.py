@@ -0,0 +1,40 @@
+# mailops/doh.py
+import json
+import os
+import time
+import urllib.parse
+import urllib.request
+
+from . import profiling, scheduler
+
+# Google's JSON DNS-over-HTTPS API. Override with MAILOPS_DOH_URL to point
+# lookups at another resolver (e.g. a local stand-in for benchmarks).
+DOH_URL = os.environ.get("MAILOPS_DOH_URL", "https://dns.google/resolve")
+
+# DNS response code for a failing zone; worth retrying, unlike NXDOMAIN
+SERVFAIL = 2
+
+
+def query(name, rtype="TXT", zone=None, lane=scheduler.INTERACTIVE):
+    """
+    Runs a single DoH query and returns the decoded JSON response. The
+    query waits for its turn in the scheduler (see scheduler.py), which
+    also times it out, retries it and keeps track of failing zones: RBL
+    checks pass the RBL as `zone`, other lookups the domain they are for.
+    """
+    params = urllib.parse.urlencode({"name": name, "type": rtype})
+    url = f"{DOH_URL}?{params}"
+
+    def send(timeout):
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(url, timeout=timeout) as response:
+                data = json.loads(response.read().decode())
+        finally:
+            profiling.observe("dns.doh", time.perf_counter() - start)
+        if data.get("Status") == SERVFAIL:
+            raise scheduler.ServerFailure(f"SERVFAIL for {name} {rtype}")
+        return data
+
+    upstream = urllib.parse.urlsplit(url).netloc
+    return scheduler.get().run(send, upstream, zone, lane)
@@ -1,16 +1,26 @@
-import os
-import sys
-
-sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 import argparse
+import collections
 import email
 import getpass
 import imaplib
+import json
 import os
+import re
 import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from email.header import decode_header
 
-from . import ui  # Integrate with your new UI system
+from . import (  # Integrate with your new UI system
+    archive,
+    atomic,
+    dedup,
+    dmarc_parser,
+    profiling,
+    tlsrpt,
+    ui,
+)
 
 
 def clean_filename(filename):
@@ -64,110 +74,591 @@ def decode_header_safe(header_val):
         return str(header_val)
 
 
-def fetch_reports(username, password, server, folder="INBOX"):
-    ui.print_info(f"Connecting to {server}...")
-
-    try:
-        mail = imaplib.IMAP4_SSL(server)
-        mail.login(username, password)
-    except Exception as e:
-        ui.print_error(f"Login Failed: {e}")
-        return
+# Message UIDs fetched per round trip; progress is checkpointed per batch
+BATCH_SIZE = 50
+
+# After a dropped connection, reconnect up to MAX_RETRIES times, waiting
+# BACKOFF_BASE, 2 * BACKOFF_BASE, 4 * ... seconds (at most BACKOFF_MAX)
+MAX_RETRIES = 5
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 60.0
+
+# Upper bound for parallel connections per mailbox; providers throttle or
+# refuse logins beyond their own limit (Gmail allows 15 per account)
+MAX_CONNECTIONS = 8
+
+# Seconds without a server response before the link counts as dropped
+TIMEOUT = 120
+
+CHECKPOINT_FILENAME = ".fetch_state.json"
+
+# DMARC subjects; TLS-RPT mail carries a TLS-Report-Domain header and
+# usually the same "Report Domain: ..." subject (RFC 8460 section 5.3)
+SEARCH_CRITERIA = (
+    '(OR OR SUBJECT "Report Domain" SUBJECT "DMARC Aggregate Report" '
+    'HEADER "TLS-Report-Domain" "")'
+)
+
+# imaplib raises abort when the socket closes under it
+_CONNECTION_ERRORS = (imaplib.IMAP4.abort, OSError, EOFError)
+
+_UID_RE = re.compile(rb"\bUID (\d+)")
+
+
+def _silent(level, message):
+    pass
+
+
+def print_progress(level, message):
+    """
+    A progress callback for download_reports() that prints each message
+    as a ui status line; level is "info", "success", "warning" or "error".
+    """
+    printers = {
+        "info": ui.print_info,
+        "success": ui.print_success,
+        "warning": ui.print_warning,
+        "error": ui.print_error,
+    }
+    printers[level](message)
+
+
+def connect(server, port=None, use_ssl=True):
+    """Opens an IMAP connection (implicit TLS unless use_ssl is False)."""
+    if use_ssl:
+        mail = imaplib.IMAP4_SSL(server, port or imaplib.IMAP4_SSL_PORT)
+    else:
+        mail = imaplib.IMAP4(server, port or imaplib.IMAP4_PORT)
+    mail.sock.settimeout(TIMEOUT)
+    return mail
+
+
+class Checkpoint:
+    """
+    Highest message UID fully processed per mailbox and search, so an
+    interrupted fetch resumes where it stopped. Entries are tied to the
+    folder's UIDVALIDITY and ignored once the server renumbers it.
+    """
+
+    def __init__(self, path=None, progress=_silent):
+        self.path = path
+        self.state = {}
+        if path and os.path.exists(path):
+            try:
+                with open(path) as f:
+                    self.state = json.load(f)
+            except (OSError, ValueError) as e:
+                progress("warning", f"Ignoring unreadable fetch checkpoint {path}: {e}")
+
+    @classmethod
+    def for_archive(cls, directory, progress=_silent):
+        """Opens the checkpoint stored inside a report archive."""
+        return cls(os.path.join(directory, CHECKPOINT_FILENAME), progress)
+
+    def last_uid(self, key, uidvalidity):
+        entry = self.state.get(key)
+        if not entry or entry.get("uidvalidity") != uidvalidity:
+            return 0
+        return entry.get("last_uid", 0)
+
+    def commit(self, key, uidvalidity, uid):
+        self.state[key] = {"uidvalidity": uidvalidity, "last_uid": uid}
+        if self.path:
+            atomic.write_atomic(self.path, json.dumps(self.state, indent=1))
+
+
+class Session:
+    """
+    An IMAP connection with `folder` selected that reconnects on its own,
+    with exponential backoff, when the link drops (see run()).
+    """
+
+    def __init__(
+        self,
+        username,
+        password,
+        server,
+        folder="INBOX",
+        port=None,
+        use_ssl=True,
+        retries=MAX_RETRIES,
+        progress=_silent,
+    ):
+        self.username = username
+        self.password = password
+        self.server = server
+        self.folder = folder
+        self.port = port
+        self.use_ssl = use_ssl
+        self.retries = retries
+        self.progress = progress
+        self.uidvalidity = None
+        self.reconnects = 0
+        self.mail = None
+
+    def _open(self):
+        with profiling.stage("imap.login"):
+            mail = connect(self.server, self.port, self.use_ssl)
+            mail.login(self.username, self.password)
+            status, _ = mail.select(self.folder)
+        if status != "OK":
+            raise imaplib.IMAP4.error(f"Cannot select folder {self.folder}")
+        _, data = mail.response("UIDVALIDITY")
+        uidvalidity = int(data[0]) if data and data[0] else 0
+        if self.uidvalidity is not None and uidvalidity != self.uidvalidity:
+            raise imaplib.IMAP4.error(f"{self.folder} was renumbered (UIDVALIDITY)")
+        self.uidvalidity = uidvalidity
+        self.mail = mail
+
+    def run(self, operation):
+        """
+        Returns operation(mail), reconnecting and retrying it when the
+        connection is lost. Other errors (bad login...) are not retried,
+        nor is anything before the folder was first opened: an unknown
+        host or a refused connection there is a setup error, not a drop.
+        """
+        for attempt in range(self.retries + 1):
+            try:
+                if self.mail is None:
+                    self._open()
+                return operation(self.mail)
+            except _CONNECTION_ERRORS as e:
+                self._drop()
+                if attempt == self.retries or self.uidvalidity is None:
+                    raise
+                delay = min(BACKOFF_MAX, BACKOFF_BASE * 2**attempt)
+                self.progress(
+                    "warning", f"Connection lost ({e}); retrying in {delay:g}s..."
+                )
+                time.sleep(delay)
+                self.reconnects += 1
+                profiling.count("imap.reconnects")
+
+    def _drop(self):
+        if self.mail is not None:
+            try:
+                self.mail.shutdown()
+            except Exception:
+                pass
+            self.mail = None
+
+    def close(self):
+        if self.mail is not None:
+            try:
+                self.mail.close()
+                self.mail.logout()
+            except Exception:
+                pass
+            self.mail = None
+
+
+def save_reports(
+    raw_email,
+    output_dir,
+    index=None,
+    report_filter=None,
+    on_saved=None,
+    archive_index=None,
+    progress=None,
+):
+    """
+    Extracts the report attachments of one email into the archive.
+    Returns (saved, duplicates).
+    """
+    count = 0
+    duplicates = 0
+    profiling.count("imap.messages")
+    profiling.count("imap.bytes", len(raw_email))
+
+    # Parse email object
+    with profiling.stage("mime.parse"):
+        msg = email.message_from_bytes(raw_email)
+    folder_date = get_safe_date(msg)
+    subject = decode_header_safe(msg.get("Subject", "Unknown Subject"))
+
+    # Walk through email parts to find attachments
+    for part in msg.walk():
+        if part.get_content_maintype() == "multipart":
+            continue
 
-    ui.print_info("Login successful. Searching for DMARC reports...")
-    mail.select(folder)
+        # Check explicitly for attachments
+        content_disposition = part.get("Content-Disposition", "")
+        is_attachment = "attachment" in content_disposition.lower()
 
-    # Search for DMARC specific subjects
-    search_criteria = '(OR SUBJECT "Report Domain" SUBJECT "DMARC Aggregate Report")'
-    status, messages = mail.search(None, search_criteria)
+        filename = decode_header_safe(part.get_filename())
+        content_type = part.get_content_type()
 
-    if status != "OK" or not messages[0]:
-        ui.print_warning("No DMARC reports found in INBOX.")
-        return
+        # LOGIC: It must look like a report (XML/JSON, GZIP, ZIP)
+        valid_extension = filename and filename.lower().endswith(
+            archive.REPORT_EXTENSIONS
+        )
+        valid_mime = any(x in content_type for x in ["gzip", "zip", "xml", "json"])
 
-    email_ids = messages[0].split()
-    ui.print_info(f"Found {len(email_ids)} potential report emails. Processing...")
+        if not (is_attachment or valid_extension or valid_mime):
+            continue
+        # If no filename, generate one from subject
+        if not filename:
+            prefix, ext = "dmarc_report", ".xml"
+            if "tlsrpt" in content_type:
+                prefix, ext = "tls_report", ".json"
+            if "gzip" in content_type:
+                ext = ".json.gz" if ext == ".json" else ".gz"
+            elif "zip" in content_type:
+                ext = ".zip"
+
+            safe_subj = clean_filename(subject)
+            filename = f"{prefix}_{safe_subj}{ext}"
+
+        filename = clean_filename(filename)
+        if not filename:
+            continue
 
-    count = 0
+        with profiling.stage("mime.decode"):
+            payload = part.get_payload(decode=True)
+        if not payload:
+            continue
+        # Only the report header is read here
+        reader = dmarc_parser
+        if archive.report_kind(filename) == "tlsrpt":
+            reader = tlsrpt
+        with profiling.stage("fetch.peek"):
+            meta = reader.read_report_metadata(filename, payload)
+        meta = meta or {}
+        if report_filter and not report_filter.matches(meta):
+            profiling.count("fetch.filtered")
+            continue
+        key = dedup.report_key(meta)
+        if index is not None and key in index:
+            profiling.count("fetch.duplicates")
+            duplicates += 1
+            continue
 
-    for e_id in email_ids:
-        try:
-            # Fetch the email body
-            res, msg_data = mail.fetch(e_id, "(BODY[])")
-            if res != "OK":
+        # Save Logic: <policy domain>/<YYYY-MM>/<file>
+        save_dir = archive.partition_dir(output_dir, meta, folder_date)
+        filepath = os.path.join(save_dir, filename)
+        if os.path.exists(filepath):
+            # Written before a crash that lost its index entries
+            if filename not in archive.read_index(save_dir):
+                archive.add_to_index(save_dir, filename, meta)
+            if archive_index is not None and filepath not in archive_index:
+                archive_index.add(filepath, meta)
+            if index is not None:
+                index.add(key)
+            continue
+        os.makedirs(save_dir, exist_ok=True)
+        with profiling.stage("fetch.write"):
+            atomic.write_atomic(filepath, payload)
+            archive.add_to_index(save_dir, filename, meta)
+            if archive_index is not None:
+                archive_index.add(filepath, meta)
+        profiling.count("fetch.saved")
+        if progress:
+            relpath = os.path.relpath(filepath, output_dir)
+            progress("success", f"Saved: {relpath}")
+        count += 1
+        if index is not None:
+            index.add(key)
+        if on_saved:
+            on_saved(filepath)
+    return count, duplicates
+
+
+class Backfill:
+    """
+    Work shared by the fetch connections. The UIDs to fetch are split into
+    batches (contiguous shards of the UID space) that connections take
+    from a common queue, so a slow or throttled connection never holds up
+    the others. Fetching runs in parallel; saving runs one message at a
+    time under its own lock, so the archive, the dedup index and on_saved
+    consumers never see concurrent calls, while the other connections keep
+    taking batches.
+
+    The checkpoint is a low-water mark: it moves to the end of a batch
+    once that batch and every batch before it are done. A batch with a
+    message that failed to save is never done, so the next run retries it.
+    """
+
+    def __init__(self, batches, save, commit, progress=_silent):
+        self.batches = batches
+        self.save = save  # raw email -> (saved, duplicates)
+        self.commit = commit  # highest UID with everything below it done
+        self.progress = progress
+        self.queue = collections.deque(range(len(batches)))
+        self.done = [False] * len(batches)
+        self.committed = 0  # batches[:committed] are all done
+        self.saved = 0
+        self.duplicates = 0
+        self._lock = threading.Lock()  # queue, done and committed
+        self._save_lock = threading.Lock()
+
+    @property
+    def complete(self):
+        return self.committed == len(self.batches)
+
+    def _next(self):
+        with self._lock:
+            return self.queue.popleft() if self.queue else None
+
+    def work(self, session):
+        """Fetches batches over one session until the queue is empty."""
+        while True:
+            n = self._next()
+            if n is None:
+                return
+            batch = self.batches[n]
+            uid_set = ",".join(map(str, batch))
+            try:
+                with profiling.stage("imap.fetch"):
+                    res, msg_data = session.run(
+                        lambda mail: mail.uid("FETCH", uid_set, "(BODY[])")
+                    )
+                if res != "OK":
+                    raise imaplib.IMAP4.error(f"FETCH returned {res}")
+            except Exception as e:
+                # Leave the batch to the remaining connections
+                with self._lock:
+                    self.queue.appendleft(n)
+                self.progress(
+                    "warning",
+                    f"Fetching UIDs {batch[0]}-{batch[-1]}: {e}; "
+                    "continuing with fewer connections.",
+                )
+                return
+
+            with self._save_lock:
+                ok = self._save_batch(msg_data)
+            if not ok:
+                # Keep the checkpoint before it so the next run retries
+                self.progress(
+                    "warning",
+                    f"UIDs {batch[0]}-{batch[-1]} will be fetched again next run.",
+                )
                 continue
-
-            raw_email = None
-
-            # Standard IMAP extraction (Tuple usually contains the body)
-            for response_part in msg_data:
-                if isinstance(response_part, tuple):
-                    raw_email = response_part[1]
-                    break
-
-            if raw_email is None:
+            with self._lock:
+                self.done[n] = True
+                advanced = False
+                while self.committed < len(self.done) and self.done[self.committed]:
+                    self.committed += 1
+                    advanced = True
+                if advanced:
+                    self.commit(self.batches[self.committed - 1][-1])
+
+    def _save_batch(self, msg_data):
+        """Saves a FETCH response; False if any message failed to save."""
+        ok = True
+        # Responses are (header, body) tuples between b")" separators
+        for response_part in msg_data:
+            if not isinstance(response_part, tuple):
                 continue
+            match = _UID_RE.search(response_part[0])
+            e_id = match.group(1).decode() if match else "?"
+            try:
+                saved, skipped = self.save(response_part[1])
+                self.saved += saved
+                self.duplicates += skipped
+            except Exception as e:
+                self.progress("error", f"Processing email UID {e_id}: {e}")
+                ok = False
+        return ok
+
+
+class FetchError(Exception):
+    """Login or the mailbox search failed; nothing was fetched."""
+
+
+class FetchResult(
+    collections.namedtuple(
+        "FetchResult", "found saved duplicates reconnects complete output_dir"
+    )
+):
+    """
+    Outcome of a fetch: report emails found, reports written and skipped as
+    duplicates. complete is False when batches were left for the next run.
+    """
+
+    __slots__ = ()
+
+
+@profiling.timed("fetch.total")
+def download_reports(
+    username,
+    password,
+    server,
+    folder="INBOX",
+    port=None,
+    use_ssl=True,
+    output_dir="dmarc_reports",
+    on_saved=None,
+    skip_duplicates=True,
+    report_filter=None,
+    resume=True,
+    connections=1,
+    progress=None,
+):
+    """
+    Downloads DMARC aggregate and SMTP TLS (RFC 8460) report attachments
+    into output_dir/<policy domain>/<YYYY-MM>/ in a single pass over the
+    folder. on_saved(filepath) is called for every newly written file. Reports
+    already in the archive's dedup index (same org, report_id and date
+    range) are skipped unless skip_duplicates is False. An
+    archive.ReportFilter narrows the IMAP search by date and drops
+    reports whose header doesn't match before they are written.
+
+    Messages are fetched by UID in batches of BATCH_SIZE, over up to
+    `connections` parallel connections (capped at MAX_CONNECTIONS; see
+    Backfill). A dropped connection is re-opened with exponential backoff
+    and the batch retried. Progress is checkpointed per batch, so the next
+    run (with resume=True) only searches newer messages. Saved reports are
+    added to the archive's ArchiveIndex, which the first run creates.
+
+    Returns a FetchResult; raises FetchError if login or search fails.
+    Nothing is printed: progress messages go to progress(level, message)
+    if given (print_progress prints them; see fetch_reports).
+    """
+    say = progress or _silent
+    say("info", f"Connecting to {server}...")
+    session = Session(username, password, server, folder, port, use_ssl, progress=say)
+    try:
+        session.run(lambda mail: None)
+    except Exception as e:
+        raise FetchError(f"Login Failed: {e}") from e
+
+    say("info", "Login successful. Searching for DMARC and TLS reports...")
+    search_criteria = SEARCH_CRITERIA
+    if report_filter and report_filter.imap_terms():
+        search_criteria += " " + report_filter.imap_terms()
+
+    # One checkpoint per mailbox and selection: a narrower run must not
+    # hide messages from a later, broader one. The key names the selection
+    # rather than the SINCE date a --days window works out to today.
+    checkpoint = Checkpoint.for_archive(output_dir, say) if resume else Checkpoint()
+    host = f"{server}:{port}" if port else server
+    mailbox = f"{username}@{host}/{folder} {SEARCH_CRITERIA}"
+    if report_filter:
+        mailbox += f" [{report_filter.selection()}]"
+    last_uid = checkpoint.last_uid(mailbox, session.uidvalidity)
+    if last_uid:
+        search_criteria = f"UID {last_uid + 1}:* {search_criteria}"
 
-            # Parse email object
-            msg = email.message_from_bytes(raw_email)
-            folder_date = get_safe_date(msg)
-            subject = decode_header_safe(msg.get("Subject", "Unknown Subject"))
-
-            # Walk through email parts to find attachments
-            for part in msg.walk():
-                if part.get_content_maintype() == "multipart":
-                    continue
-
-                # Check explicitly for attachments
-                content_disposition = part.get("Content-Disposition", "")
-                is_attachment = "attachment" in content_disposition.lower()
+    try:
+        with profiling.stage("imap.search"):
+            status, messages = session.run(
+                lambda mail: mail.uid("SEARCH", None, search_criteria)
+            )
+    except Exception as e:
+        session.close()
+        raise FetchError(f"Search failed: {e}") from e
+
+    uids = []
+    if status == "OK" and messages and messages[0]:
+        # "UID n:*" also matches the newest message when nothing is newer
+        uids = [u for u in map(int, messages[0].split()) if u > last_uid]
+    if not uids:
+        if last_uid:
+            say("info", f"No new report emails since UID {last_uid}.")
+        else:
+            say("warning", "No DMARC or TLS reports found in INBOX.")
+        session.close()
+        return FetchResult(0, 0, 0, 0, True, output_dir)
+
+    if last_uid:
+        say("info", f"Resuming after UID {last_uid} (already processed).")
+    say("info", f"Found {len(uids)} potential report emails. Processing...")
+
+    batches = [uids[i : i + BATCH_SIZE] for i in range(0, len(uids), BATCH_SIZE)]
+    workers = max(1, min(connections, MAX_CONNECTIONS, len(batches)))
+    if workers > 1:
+        say("info", f"Fetching over {workers} parallel connections...")
+    index = dedup.ReportIndex.for_archive(output_dir) if skip_duplicates else None
+    archive_index = archive.ArchiveIndex(output_dir)
+    if not os.path.exists(archive_index.path):
+        say("info", "Indexing the reports already archived (first run only)...")
+        archive_index.rebuild()
+
+    def commit(uid):
+        checkpoint.commit(mailbox, session.uidvalidity, uid)
+
+    def save(raw_email):
+        return save_reports(
+            raw_email,
+            output_dir,
+            index,
+            report_filter,
+            on_saved,
+            archive_index,
+            progress,
+        )
+
+    backfill = Backfill(batches, save, commit, say)
+    sessions = [session]
+    for _ in range(workers - 1):
+        extra = Session(username, password, server, folder, port, use_ssl, progress=say)
+        extra.uidvalidity = session.uidvalidity  # same folder, same numbering
+        sessions.append(extra)
+
+    def drain(s):
+        # Log out as soon as the queue is empty, not after the slowest one
+        try:
+            backfill.work(s)
+        finally:
+            s.close()
 
-                filename = decode_header_safe(part.get_filename())
-                content_type = part.get_content_type()
+    try:
+        if workers == 1:
+            drain(session)
+        else:
+            with ThreadPoolExecutor(workers) as pool:
+                list(pool.map(drain, sessions))
+    finally:
+        if index is not None:
+            index.close()
+        for s in sessions:
+            s.close()
+
+    reconnects = sum(s.reconnects for s in sessions)
+    return FetchResult(
+        len(uids),
+        backfill.saved,
+        backfill.duplicates,
+        reconnects,
+        backfill.complete,
+        output_dir,
+    )
+
+
+def fetch_reports(username, password, server, *args, **kwargs):
+    """
+    download_reports() for the command line: prints progress and a summary,
+    and reports login/search failures instead of raising. Returns the
+    FetchResult, or None on failure.
+    """
+    kwargs.setdefault("progress", print_progress)
+    try:
+        result = download_reports(username, password, server, *args, **kwargs)
+    except FetchError as e:
+        ui.print_error(str(e))
+        return None
+    if result.found:
+        print_summary(result)
+    return result
 
-                # LOGIC: It must look like a DMARC report (XML, GZIP, ZIP)
-                valid_extension = filename and filename.lower().endswith(
-                    (".xml", ".gz", ".zip")
-                )
-                valid_mime = any(x in content_type for x in ["gzip", "zip", "xml"])
-
-                if is_attachment or valid_extension or valid_mime:
-                    # If no filename, generate one from subject
-                    if not filename:
-                        ext = ".xml"
-                        if "gzip" in content_type:
-                            ext = ".gz"
-                        elif "zip" in content_type:
-                            ext = ".zip"
-
-                        safe_subj = clean_filename(subject)
-                        filename = f"dmarc_report_{safe_subj}{ext}"
-
-                    filename = clean_filename(filename)
-
-                    if filename:
-                        # Save Logic
-                        save_dir = os.path.join("dmarc_reports", folder_date)
-                        os.makedirs(save_dir, exist_ok=True)
-                        filepath = os.path.join(save_dir, filename)
-
-                        if not os.path.exists(filepath):
-                            payload = part.get_payload(decode=True)
-                            if payload:
-                                with open(filepath, "wb") as f:
-                                    f.write(payload)
-                                ui.print_success(f"Saved: {folder_date}/{filename}")
-                                count += 1
-
-        except Exception as e:
-            ui.print_error(f"Processing email ID {e_id}: {e}")
-            continue
 
-    mail.close()
-    mail.logout()
+def print_summary(result):
     print("-" * 60)
-    ui.print_success(f"Download complete. Saved {count} new reports.")
-    ui.print_info(f"Location: {os.path.abspath('dmarc_reports')}")
+    if result.complete:
+        ui.print_success(f"Download complete. Saved {result.saved} new reports.")
+    else:
+        ui.print_warning(
+            f"Download interrupted. Saved {result.saved} new reports; "
+            "run fetch again to resume from the last checkpoint."
+        )
+    if result.reconnects:
+        ui.print_info(f"Reconnected {result.reconnects} times.")
+    if result.duplicates:
+        ui.print_info(
+            f"Skipped {result.duplicates} duplicate reports (already archived)."
+        )
+    ui.print_info(f"Location: {os.path.abspath(result.output_dir)}")
 
 
 def main():
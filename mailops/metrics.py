@@ -0,0 +1,261 @@
+# mailops/metrics.py
+"""
+Prometheus metrics for scheduled mailops runs.
+
+Counters live in a small JSON state file next to the exposition file and are
+bumped incrementally as reports are ingested, so nothing is recomputed from
+the archive. After each run the state is rendered in the Prometheus text
+format for node_exporter's textfile collector, or served over HTTP with
+`mailops metrics --listen`.
+"""
+
+import json
+import os
+import threading
+import time
+
+from . import atomic, profiling, ui
+
+# name -> (type, help)
+METRICS = {
+    "mailops_reports_ingested_total": (
+        "counter",
+        "DMARC aggregate reports saved by fetch.",
+    ),
+    "mailops_records_total": (
+        "counter",
+        "Report records ingested, by reporting org and disposition.",
+    ),
+    "mailops_messages_total": (
+        "counter",
+        "Messages covered by ingested records, by org and DMARC result.",
+    ),
+    "mailops_tls_sessions_total": (
+        "counter",
+        "SMTP TLS sessions in ingested TLS reports, by policy domain and result.",
+    ),
+    "mailops_rbl_listed": (
+        "gauge",
+        "1 if the IP was listed on the RBL zone at the last check, else 0.",
+    ),
+    "mailops_rbl_last_check_timestamp_seconds": (
+        "gauge",
+        "Unix time of the last blacklist check for an IP.",
+    ),
+    "mailops_dns_check_ok": (
+        "gauge",
+        "1 if the mail DNS check (spf, dmarc, dkim...) passed at the last audit.",
+    ),
+    "mailops_anomalies_total": (
+        "counter",
+        "Trend anomalies raised on ingest, by kind and policy domain.",
+    ),
+    "mailops_stage_seconds_total": (
+        "counter",
+        "Time spent per instrumented stage.",
+    ),
+    "mailops_stage_calls_total": (
+        "counter",
+        "Calls per instrumented stage.",
+    ),
+    "mailops_last_run_timestamp_seconds": (
+        "gauge",
+        "Unix time a command last finished.",
+    ),
+}
+
+
+def state_path_for(textfile):
+    """State lives beside the .prom file (the collector ignores .json)."""
+    return os.path.splitext(textfile)[0] + ".state.json"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value):
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class MetricsStore:
+    """Persistent counter/gauge values keyed by (metric name, labels)."""
+
+    def __init__(self, path, textfile=None):
+        self.path = path
+        self.textfile = textfile
+        self.values = {}
+        self._lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        self.values = {}
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path) as f:
+                for item in json.load(f):
+                    key = (item["name"], tuple(sorted(item["labels"].items())))
+                    self.values[key] = item["value"]
+        except (OSError, ValueError, KeyError) as e:
+            ui.print_warning(f"Ignoring unreadable metrics state {self.path}: {e}")
+
+    def save(self):
+        """Writes the state atomically so a crash never truncates it."""
+        with self._lock:
+            items = [
+                {"name": name, "labels": dict(labels), "value": value}
+                for (name, labels), value in sorted(self.values.items())
+            ]
+        _makedirs(self.path)
+        atomic.write_atomic(self.path, json.dumps(items, indent=1))
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def set(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.values[key] = value
+
+    # --- Ingest hooks ---
+
+    def record_report(self, records):
+        """Counts one freshly ingested report (records from parse_dmarc_xml)."""
+        if not records:
+            return
+        org = records[0]["org_name"]
+        self.inc("mailops_reports_ingested_total", org=org)
+        for r in records:
+            self.inc(
+                "mailops_records_total", org=org, disposition=r["disposition"] or ""
+            )
+            result = "pass" if r["status_msg"] == "OK" else "fail"
+            try:
+                messages = int(r["count"] or 0)
+            except ValueError:
+                messages = 0
+            self.inc("mailops_messages_total", messages, org=org, result=result)
+
+    def record_tls_report(self, records):
+        """Counts one ingested TLS report (records from tlsrpt.parse_tlsrpt)."""
+        for r in records:
+            self.inc(
+                "mailops_tls_sessions_total",
+                r["sessions"],
+                domain=r["domain"],
+                result=r["result_type"],
+            )
+
+    def record_anomalies(self, anomalies):
+        """Counts anomalies raised by trends.TrendEngine.ingest()."""
+        for a in anomalies:
+            self.inc("mailops_anomalies_total", kind=a["kind"], domain=a["domain"])
+
+    def record_blacklist(self, ip, results):
+        """Sets the listing gauges from a run_check() result mapping."""
+        for zone, res in results.items():
+            if res is not None and str(res).startswith("Error"):
+                continue  # keep the last known status
+            listed = 0 if res is None else 1
+            self.set("mailops_rbl_listed", listed, ip=ip, zone=zone)
+        self.set("mailops_rbl_last_check_timestamp_seconds", time.time(), ip=ip)
+
+    def record_audit(self, findings):
+        """Sets the DNS posture gauges from dns_audit.audit() findings."""
+        from .dns_audit import summarize
+
+        for (domain, check), status in summarize(findings).items():
+            if status == "error":
+                continue  # keep the last known status
+            ok = 0 if status in ("fail", "warn") else 1
+            self.set("mailops_dns_check_ok", ok, domain=domain, check=check)
+
+    def record_profile(self, data):
+        """Adds a profiling snapshot's stage timings to the running totals."""
+        for stage, s in data["stages"].items():
+            self.inc("mailops_stage_seconds_total", s["seconds"], stage=stage)
+            self.inc("mailops_stage_calls_total", s["calls"], stage=stage)
+
+    def record_run(self, command):
+        self.set("mailops_last_run_timestamp_seconds", time.time(), command=command)
+
+    # --- Exposition ---
+
+    def render(self):
+        """Returns the metrics in the Prometheus text exposition format."""
+        with self._lock:
+            values = sorted(self.values.items())
+
+        lines = []
+        current = None
+        for (name, labels), value in values:
+            if name != current:
+                current = name
+                kind, help_text = METRICS.get(name, ("untyped", name))
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+            if labels:
+                label_str = ",".join(f'{k}="{_escape(v)}"' for k, v in labels)
+                lines.append(f"{name}{{{label_str}}} {_format_value(value)}")
+            else:
+                lines.append(f"{name} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self, path):
+        _makedirs(path)
+        atomic.write_atomic(path, self.render())
+
+
+def open_textfile(textfile):
+    """Loads the state behind a textfile-collector .prom file."""
+    return MetricsStore(state_path_for(textfile), textfile)
+
+
+def finish_run(store, command):
+    """Folds in stage timings, then persists state and the .prom file."""
+    if profiling.ENABLED:
+        store.record_profile(profiling.snapshot())
+    store.record_run(command)
+    store.save()
+    if store.textfile:
+        store.write_textfile(store.textfile)
+
+
+def _makedirs(path):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+
+def serve(textfile, host="127.0.0.1", port=9108):
+    """Serves /metrics over HTTP, re-reading the state on every scrape."""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    state_path = state_path_for(textfile)
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] not in ("/", "/metrics"):
+                self.send_error(404)
+                return
+            body = MetricsStore(state_path).render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    ui.print_info(f"Serving metrics on http://{host}:{port}/metrics (Ctrl+C to stop)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
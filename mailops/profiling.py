@@ -0,0 +1,212 @@
+# mailops/profiling.py
+"""
+Lightweight hot-path instrumentation behind the `--profile` flag.
+
+Stages are timed with `stage("name")` (a context manager) or the `@timed`
+decorator; `count()` bumps counters and `observe()` records latency samples
+for percentiles. Everything is a no-op until `enable()` is called, so the
+cost with profiling off is a single flag check per call.
+"""
+
+import functools
+import json
+import math
+import sys
+import threading
+import time
+
+ENABLED = False
+
+_lock = threading.Lock()
+_started = 0.0
+_timers: dict = {}  # stage -> [calls, total_seconds]
+_counters: dict = {}  # name -> int
+_samples: dict = {}  # name -> [seconds, ...]
+
+
+def enable():
+    """Turns instrumentation on and starts the wall clock."""
+    global ENABLED, _started
+    reset()
+    _started = time.perf_counter()
+    ENABLED = True
+
+
+def disable():
+    global ENABLED
+    ENABLED = False
+
+
+def reset():
+    with _lock:
+        _timers.clear()
+        _counters.clear()
+        _samples.clear()
+
+
+def _add_time(name, seconds):
+    with _lock:
+        entry = _timers.get(name)
+        if entry is None:
+            _timers[name] = [1, seconds]
+        else:
+            entry[0] += 1
+            entry[1] += seconds
+
+
+class _Stage:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        _add_time(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class _NullStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+def stage(name):
+    """Times a block: `with profiling.stage("imap.fetch"): ...`"""
+    if not ENABLED:
+        return _NULL_STAGE
+    return _Stage(name)
+
+
+def timed(name):
+    """Decorator version of stage() for whole functions."""
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not ENABLED:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                _add_time(name, time.perf_counter() - start)
+
+        return wrapper
+
+    return decorator
+
+
+def count(name, amount=1):
+    """Adds to a counter (bytes fetched, records parsed, cache hits...)."""
+    if not ENABLED:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + amount
+
+
+def observe(name, seconds):
+    """Records one latency sample (percentiles) and adds it to stage `name`."""
+    if not ENABLED:
+        return
+    with _lock:
+        _samples.setdefault(name, []).append(seconds)
+    _add_time(name, seconds)
+
+
+# --- Reporting ---
+
+
+def _percentile(ordered, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not ordered:
+        return 0.0
+    rank = math.ceil(pct / 100 * len(ordered))
+    return ordered[max(0, min(len(ordered), rank) - 1)]
+
+
+def snapshot():
+    """Returns everything collected so far as a JSON-friendly dict."""
+    with _lock:
+        timers = {k: list(v) for k, v in _timers.items()}
+        counters = dict(_counters)
+        samples = {k: sorted(v) for k, v in _samples.items()}
+
+    return {
+        "wall_seconds": time.perf_counter() - _started if _started else 0.0,
+        "stages": {
+            name: {"calls": calls, "seconds": total}
+            for name, (calls, total) in sorted(timers.items())
+        },
+        "counters": dict(sorted(counters.items())),
+        "latency": {
+            name: {
+                "count": len(values),
+                "p50": _percentile(values, 50),
+                "p90": _percentile(values, 90),
+                "p99": _percentile(values, 99),
+                "max": values[-1],
+            }
+            for name, values in sorted(samples.items())
+        },
+    }
+
+
+def format_report(data):
+    """Renders a snapshot as a plain-text breakdown."""
+    wall = data["wall_seconds"] or 1e-9
+    lines = [f"=== Profile (wall {data['wall_seconds']:.3f}s) ==="]
+
+    lines.append(
+        f"{'Stage':<24} {'Calls':>8} {'Total (s)':>10} {'Mean (ms)':>10} {'%':>6}"
+    )
+    for name, s in sorted(
+        data["stages"].items(), key=lambda item: item[1]["seconds"], reverse=True
+    ):
+        mean_ms = s["seconds"] / s["calls"] * 1000 if s["calls"] else 0.0
+        lines.append(
+            f"{name:<24} {s['calls']:>8} {s['seconds']:>10.4f} "
+            f"{mean_ms:>10.3f} {s['seconds'] / wall * 100:>5.1f}%"
+        )
+
+    if data["counters"]:
+        lines.append("")
+        lines.append(f"{'Counter':<24} {'Value':>12}")
+        for name, value in data["counters"].items():
+            lines.append(f"{name:<24} {value:>12}")
+
+    if data["latency"]:
+        lines.append("")
+        lines.append(
+            f"{'Latency (ms)':<24} {'n':>8} "
+            f"{'p50':>8} {'p90':>8} {'p99':>8} {'max':>8}"
+        )
+        for name, lat in data["latency"].items():
+            lines.append(
+                f"{name:<24} {lat['count']:>8} {lat['p50'] * 1000:>8.2f} "
+                f"{lat['p90'] * 1000:>8.2f} {lat['p99'] * 1000:>8.2f} "
+                f"{lat['max'] * 1000:>8.2f}"
+            )
+    return "\n".join(lines)
+
+
+def finish(json_path=None, stream=None):
+    """Prints the breakdown to stderr, or writes it as JSON if a path is given."""
+    data = snapshot()
+    if json_path:
+        with open(json_path, "w") as f:
+            json.dump(data, f, indent=2)
+    else:
+        print(format_report(data), file=stream or sys.stderr)
+    return data
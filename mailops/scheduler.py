@@ -0,0 +1,285 @@
+# mailops/scheduler.py
+"""
+Central scheduler for outgoing DNS queries (DoH lookups and RBL checks).
+
+Every query names its upstream (the DoH host) and the zone it is about:
+the RBL for blacklist checks, the audited domain for other lookups. The
+scheduler then:
+
+- paces queries per upstream with a token bucket (LIMITS, in queries per
+  second and burst size), so bulk sweeps stay under the provider's rate
+  limit instead of running into it;
+- serves lanes in priority order: a BULK query only takes a token while
+  no INTERACTIVE query is waiting for one;
+- gives every request TIMEOUT seconds and retries transient failures
+  (timeouts, connection errors, SERVFAIL, HTTP 429/5xx) up to RETRIES
+  times, after exponential backoff with full jitter;
+- opens a circuit breaker after BREAKER_FAILURES failures in a row: its
+  queries then fail at once with CircuitOpen, until a single trial query
+  is let through after BREAKER_COOLDOWN seconds. SERVFAILs count against
+  the zone's breaker only; timeouts, connection and HTTP errors against
+  the upstream's, which stops every query to it.
+
+configure() sets the limits for the process; the maximum query rate is
+then a setting rather than whatever the thread pools happen to produce.
+"""
+
+import random
+import threading
+import time
+import urllib.error
+
+from . import profiling
+
+INTERACTIVE = 0
+BULK = 1
+LANES = {"interactive": INTERACTIVE, "bulk": BULK}
+
+# (queries per second, burst) per upstream host. Public resolvers throttle
+# well above these; RBL operators such as Spamhaus are stricter about
+# volume seen from a shared resolver, hence the conservative default.
+LIMITS = {
+    "dns.google": (50.0, 50),
+    "cloudflare-dns.com": (50.0, 50),
+}
+DEFAULT_LIMIT = (20.0, 20)
+
+TIMEOUT = 5.0
+RETRIES = 2
+BACKOFF_BASE = 0.25
+BACKOFF_MAX = 4.0
+
+BREAKER_FAILURES = 5
+BREAKER_COOLDOWN = 30.0
+# Healthy zone breakers are dropped once there are more than this many
+MAX_BREAKERS = 10000
+
+
+class CircuitOpen(Exception):
+    """The zone failed too often recently; the query was not sent."""
+
+
+class ServerFailure(Exception):
+    """The upstream answered SERVFAIL (the zone's servers are failing)."""
+
+
+def is_transient(error):
+    """
+    Errors worth retrying and counted against a breaker: SERVFAIL against
+    the zone's, transport and HTTP errors against the upstream's.
+    """
+    if isinstance(error, urllib.error.HTTPError):
+        return error.code == 429 or error.code >= 500
+    # URLError and socket timeouts are OSErrors too
+    return isinstance(error, (OSError, ServerFailure))
+
+
+class TokenBucket:
+    """
+    Hands out `rate` tokens per second, up to `burst` at once. Waiters in
+    a lower lane number go first; rate 0 means unlimited.
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self.waiting = [0] * len(LANES)
+        self._cond = threading.Condition()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, lane=INTERACTIVE):
+        """Blocks until this lane may take a token; returns the seconds waited."""
+        if not self.rate:
+            return 0.0
+        start = time.monotonic()
+        with self._cond:
+            self.waiting[lane] += 1
+            try:
+                while True:
+                    self._refill()
+                    ahead = sum(self.waiting[:lane])
+                    if self.tokens >= 1 and not ahead:
+                        self.tokens -= 1
+                        return time.monotonic() - start
+                    # Sleep until the next token, or until a waiter ahead leaves
+                    delay = (1 - self.tokens) / self.rate if self.tokens < 1 else None
+                    self._cond.wait(delay)
+            finally:
+                self.waiting[lane] -= 1
+                self._cond.notify_all()
+
+
+class Breaker:
+    """Consecutive-failure circuit breaker for one zone."""
+
+    def __init__(self, failures=BREAKER_FAILURES, cooldown=BREAKER_COOLDOWN):
+        self.threshold = failures
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self.trial = None  # thread sending the half-open trial query
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if self.trial is not None:
+                return False
+            if time.monotonic() - self.opened_at < self.cooldown:
+                return False
+            self.trial = threading.get_ident()  # half open: one query finds out
+            return True
+
+    def cancel(self):
+        """Gives back this thread's trial query, if it was not sent after all."""
+        with self._lock:
+            if self.trial == threading.get_ident():
+                self.trial = None
+
+    @property
+    def healthy(self):
+        return not self.failures and self.opened_at is None
+
+    def record(self, ok):
+        with self._lock:
+            self.trial = None
+            if ok:
+                self.failures = 0
+                self.opened_at = None
+            else:
+                self.failures += 1
+                if self.failures >= self.threshold:
+                    self.opened_at = time.monotonic()
+
+
+def _skip(key):
+    profiling.count("dns.circuit_open")
+    raise CircuitOpen(f"{key} is failing; query skipped")
+
+
+class Scheduler:
+    def __init__(
+        self,
+        limits=None,
+        default_limit=DEFAULT_LIMIT,
+        timeout=TIMEOUT,
+        retries=RETRIES,
+        backoff=BACKOFF_BASE,
+        breaker_failures=BREAKER_FAILURES,
+        breaker_cooldown=BREAKER_COOLDOWN,
+    ):
+        self.limits = dict(LIMITS if limits is None else limits)
+        self.default_limit = default_limit
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.breaker_failures = breaker_failures
+        self.breaker_cooldown = breaker_cooldown
+        self._buckets = {}
+        self._breakers = {}
+        self._lock = threading.Lock()
+
+    def bucket(self, upstream):
+        with self._lock:
+            if upstream not in self._buckets:
+                rate, burst = self.limits.get(upstream, self.default_limit)
+                self._buckets[upstream] = TokenBucket(rate, burst)
+            return self._buckets[upstream]
+
+    def breaker(self, key):
+        with self._lock:
+            if key not in self._breakers:
+                if len(self._breakers) >= MAX_BREAKERS:
+                    for old in [k for k, b in self._breakers.items() if b.healthy]:
+                        del self._breakers[old]
+                self._breakers[key] = Breaker(
+                    self.breaker_failures, self.breaker_cooldown
+                )
+            return self._breakers[key]
+
+    def run(self, call, upstream, zone=None, lane=INTERACTIVE):
+        """
+        Returns call(timeout) once `upstream` has capacity for the lane,
+        retrying transient failures. Raises CircuitOpen without calling
+        when the upstream's or the zone's breaker is open.
+        """
+        upstream_breaker = self.breaker(upstream)
+        zone_breaker = self.breaker(zone) if zone else None
+        if not upstream_breaker.allow():
+            _skip(upstream)
+        if zone_breaker and not zone_breaker.allow():
+            upstream_breaker.cancel()
+            _skip(zone)
+
+        def settle(upstream_ok, zone_ok):
+            upstream_breaker.record(upstream_ok)
+            if zone_breaker is None:
+                return
+            if zone_ok is None:
+                zone_breaker.cancel()  # the zone wasn't reached: no verdict
+            else:
+                zone_breaker.record(zone_ok)
+
+        bucket = self.bucket(upstream)
+        for attempt in range(self.retries + 1):
+            waited = bucket.acquire(lane)
+            if waited:
+                profiling.observe("dns.throttled", waited)
+            try:
+                result = call(self.timeout)
+            except Exception as e:
+                if not is_transient(e):
+                    settle(True, True)  # the zone answered; the query was bad
+                    raise
+                if attempt == self.retries:
+                    if isinstance(e, ServerFailure):
+                        settle(True, False)
+                    else:
+                        settle(False, None)
+                    raise
+                profiling.count("dns.retries")
+                delay = min(BACKOFF_MAX, self.backoff * 2**attempt)
+                time.sleep(random.uniform(0, delay))
+            else:
+                settle(True, True)
+                return result
+
+
+_default = None
+_default_lock = threading.Lock()
+_settings: dict = {}
+
+
+def configure(**settings):
+    """
+    Replaces the process-wide scheduler, e.g. configure(rate=10, burst=5)
+    to cap every upstream at 10 queries/s. Other keywords are Scheduler
+    arguments.
+    """
+    global _default
+    rate = settings.pop("rate", None)
+    burst = settings.pop("burst", None)
+    if rate is not None:
+        limit = (float(rate), int(burst or max(1, rate)))
+        settings["limits"] = {}
+        settings["default_limit"] = limit
+    with _default_lock:
+        _settings.clear()
+        _settings.update(settings)
+        _default = None
+
+
+def get():
+    """The process-wide scheduler every DoH query goes through."""
+    global _default
+    with _default_lock:
+        if _default is None:
+            _default = Scheduler(**_settings)
+        return _default
@@ -1,36 +1,75 @@
-import os
-import sys
-
-sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 # mailops/spf_check.py
-import argparse
-import json
-import urllib.request
+import collections
+
+from . import doh, profiling, ui  # Import the new UI module
+
+
+class SPFResult(
+    collections.namedtuple(
+        "SPFResult", "domain record records issues warnings lookups error"
+    )
+):
+    """
+    SPF lookup and evaluation for one domain. `record` is the first
+    v=spf1 record (None if there is none), `records` all of them; `error`
+    is set when the DNS lookup itself failed.
+    """
+
+    __slots__ = ()
+
+    @property
+    def ok(self):
+        return self.error is None and len(self.records) == 1 and not self.issues
 
-from . import ui  # Import the new UI module
 
+def spf_strings(response):
+    """The v=spf1 TXT strings of a DoH response."""
+    records = []
+    for answer in response.get("Answer", []):
+        txt_data = answer["data"].strip('"').replace('" "', "")
+        if txt_data.startswith("v=spf1"):
+            records.append(txt_data)
+    return records
 
+
+@profiling.timed("spf.check")
+def check_spf(domain, response=None):
+    """
+    Looks up and evaluates a domain's SPF record without printing anything.
+    Pass a DoH response (or the exception a lookup raised) to skip the query.
+    """
+    if response is None:
+        try:
+            response = doh.query(domain, "TXT", zone=domain)
+        except Exception as e:
+            response = e
+    if isinstance(response, Exception):
+        return SPFResult(domain, None, [], [], [], 0, f"Fetching DNS: {response}")
+
+    records = spf_strings(response)
+    if not records:
+        return SPFResult(domain, None, [], [], [], 0, None)
+    issues, warnings, lookups = evaluate_spf(records[0])
+    if len(records) > 1:
+        issues = ["Multiple SPF records found! This is invalid."] + issues
+    return SPFResult(domain, records[0], records, issues, warnings, lookups, None)
+
+
+@profiling.timed("spf.fetch")
 def fetch_spf_record(domain):
     """
     Fetches the SPF record for a domain using Google's DNS-over-HTTPS API.
     """
     ui.print_info(f"Fetching SPF record for '{domain}'...")
 
-    url = f"https://dns.google/resolve?name={domain}&type=TXT"
-
     try:
-        with urllib.request.urlopen(url) as response:
-            data = json.loads(response.read().decode())
+        data = doh.query(domain, "TXT", zone=domain)
 
         if "Answer" not in data:
             ui.print_warning(f"No TXT records found for {domain}.")
             return None
 
-        spf_records = []
-        for answer in data["Answer"]:
-            txt_data = answer["data"].strip('"').replace('" "', "")
-            if txt_data.startswith("v=spf1"):
-                spf_records.append(txt_data)
+        spf_records = spf_strings(data)
 
         if not spf_records:
             ui.print_warning(f"No SPF record found for {domain}.")
@@ -49,11 +88,11 @@ def fetch_spf_record(domain):
         return None
 
 
-def analyze_spf(spf_string):
+def evaluate_spf(spf_string):
     """
-    Analyzes the SPF string for syntax errors and security best practices.
+    Checks an SPF string for syntax errors and security best practices.
+    Returns (issues, warnings, lookup_count).
     """
-    ui.print_sub_header(f"Analysis for: {spf_string}")
     issues = []
     warnings = []
 
@@ -73,7 +112,6 @@ def analyze_spf(spf_string):
         if token == "a" or token == "mx":
             lookup_count += 1
 
-    print(f"[*] DNS Lookup Count (Approx): {lookup_count}/10")
     if lookup_count > 10:
         issues.append(f"Too many DNS lookups ({lookup_count}). Limit is 10 (RFC 7208).")
 
@@ -94,6 +132,24 @@ def analyze_spf(spf_string):
     if "ptr" in spf_string:
         warnings.append("The 'ptr' mechanism is deprecated and should not be used.")
 
+    return issues, warnings, lookup_count
+
+
+@profiling.timed("spf.analyze")
+def analyze_spf(spf_string):
+    """
+    Analyzes the SPF string for syntax errors and security best practices.
+    Prints the findings and returns them as (issues, warnings, lookup_count).
+    """
+    ui.print_sub_header(f"Analysis for: {spf_string}")
+    issues, warnings, lookup_count = evaluate_spf(spf_string)
+    print_analysis(issues, warnings, lookup_count)
+    return issues, warnings, lookup_count
+
+
+def print_analysis(issues, warnings, lookup_count):
+    print(f"[*] DNS Lookup Count (Approx): {lookup_count}/10")
+
     # Report
     if not issues and not warnings:
         ui.print_success("Status: Valid & Secure")
@@ -106,3 +162,14 @@ def analyze_spf(spf_string):
             print(f"{ui.Colors.YELLOW}⚠️  Warnings:{ui.Colors.RESET}")
             for w in warnings:
                 print(f"   - {w}")
+
+
+def print_result(result):
+    """Console rendering of a check_spf() result."""
+    if result.error:
+        ui.print_error(f"{result.domain}: {result.error}")
+    elif result.record is None:
+        ui.print_warning(f"No SPF record found for {result.domain}.")
+    else:
+        ui.print_sub_header(f"Analysis for: {result.record}")
+        print_analysis(result.issues, result.warnings, result.lookups)
@@ -0,0 +1,426 @@
+# mailops/tlsrpt.py
+"""
+SMTP TLS reports (RFC 8460): streaming parser and per-MTA aggregation.
+
+TLS-RPT reports are JSON documents, usually gzipped, delivered to the
+same mailbox as DMARC aggregates. They go through the same fetch
+pipeline, archive partitions and dedup index; only the parsing differs.
+
+The parser never loads a whole report: the top-level members are decoded
+one at a time, and each policy's "failure-details" one entry at a time, so
+parsing takes linear time and holds the records, not the JSON, however
+many failure details a receiver sends.
+"""
+
+import io
+import itertools
+import json
+import os
+import re
+from datetime import datetime
+
+from . import dmarc_parser, profiling, ui
+
+CHUNK_SIZE = dmarc_parser.CHUNK_SIZE
+
+# Header members needed before records can be emitted
+_HEADER_KEYS = {"organization-name", "date-range", "report-id"}
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+_decoder = json.JSONDecoder()
+
+
+class _Tokens:
+    """Pulls one JSON value at a time out of a chunked text stream."""
+
+    def __init__(self, stream):
+        self.text = io.TextIOWrapper(stream, encoding="utf-8-sig")
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self, size=None):
+        with profiling.stage("report.decompress"):
+            chunk = self.text.read(size or CHUNK_SIZE)
+        if not chunk:
+            self.eof = True
+            return False
+        profiling.count("report.bytes", len(chunk))
+        self.buf = self.buf[self.pos :] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """Next non-whitespace character, or "" at the end of input."""
+        while True:
+            self.pos = _WHITESPACE.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, char):
+        found = self.peek()
+        if found != char:
+            raise ValueError(f"Expected {char!r}, found {found or 'end of file'!r}")
+        self.pos += 1
+
+    def skip(self, char):
+        """Consumes char if it comes next; returns whether it did."""
+        if self.peek() == char:
+            self.pos += 1
+            return True
+        return False
+
+    def value(self):
+        self.peek()
+        # Each retry decodes from the start of the value again: reading
+        # twice as much each time keeps a large value linear, not quadratic
+        size = CHUNK_SIZE
+        while True:
+            try:
+                with profiling.stage("report.json_parse"):
+                    value, end = _decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                # Most likely cut off at the chunk boundary
+                if not self._fill(size):
+                    raise
+                size *= 2
+                continue
+            # A number ending the buffer may continue in the next chunk
+            if end == len(self.buf) and self._fill():
+                continue
+            self.pos = end
+            return value
+
+
+def _policy_items(tokens):
+    """
+    Yields ("policy", policy) for the policy object that comes next, then
+    ("failure", entry) for each of its failure-details. Details are only
+    streamed once the "policy" and "summary" members are known (RFC 8460
+    order); otherwise they stay in the policy, decoded as a whole.
+    """
+    policy = {}
+    streamed = False
+    tokens.expect("{")
+    if not tokens.skip("}"):
+        while True:
+            key = tokens.value()
+            tokens.expect(":")
+            if (
+                key == "failure-details"
+                and not streamed
+                and {"policy", "summary"} <= policy.keys()
+                and tokens.skip("[")
+            ):
+                streamed = True
+                yield "policy", policy
+                if not tokens.skip("]"):
+                    while True:
+                        yield "failure", tokens.value()
+                        if not tokens.skip(","):
+                            break
+                    tokens.expect("]")
+            else:
+                policy[key] = tokens.value()
+            if not tokens.skip(","):
+                break
+        tokens.expect("}")
+    if not streamed:
+        yield "policy", policy
+
+
+def iter_report_items(stream):
+    """
+    Yields (member, value) for the report's top-level members, except
+    that "policies" is yielded element by element (see _policy_items):
+    ("policy", policy) followed by ("failure", entry) per failure detail.
+    """
+    tokens = _Tokens(stream)
+    tokens.expect("{")
+    if tokens.skip("}"):
+        return
+    while True:
+        key = tokens.value()
+        tokens.expect(":")
+        if key == "policies" and tokens.skip("["):
+            if not tokens.skip("]"):
+                while True:
+                    yield from _policy_items(tokens)
+                    if not tokens.skip(","):
+                        break
+                tokens.expect("]")
+        else:
+            yield key, tokens.value()
+        if not tokens.skip(","):
+            break
+    tokens.expect("}")
+
+
+def _timestamp(value):
+    """RFC 3339 date-time -> epoch seconds as a string (like DMARC's <begin>)."""
+    try:
+        parsed = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    return str(int(parsed.timestamp()))
+
+
+def _policy_domain(policy):
+    return str(policy.get("policy", {}).get("policy-domain") or "").strip().lower()
+
+
+def read_header(items):
+    """
+    Consumes items until the header is known and returns (metadata,
+    policy and failure items read so far). Metadata has the same keys as
+    dmarc_parser.read_header: org_name, email, report_id, begin, end and
+    the policy domain (of the first policy).
+    """
+    meta = {"org_name": None, "email": None, "report_id": None, "domain": None}
+    meta["begin"] = meta["end"] = None
+    seen = set()
+    pending = []
+    for key, value in items:
+        if key == "failure":
+            pending.append((key, value))
+            continue
+        if key == "policy":
+            pending.append((key, value))
+            if meta["domain"] is None:
+                meta["domain"] = _policy_domain(value)
+            # Header members normally come first; only buffer if they don't
+            if _HEADER_KEYS <= seen:
+                break
+            continue
+        seen.add(key)
+        if key == "organization-name":
+            meta["org_name"] = str(value).strip()
+        elif key == "contact-info":
+            meta["email"] = str(value).strip()
+        elif key == "report-id":
+            meta["report_id"] = str(value).strip()
+        elif key == "date-range" and isinstance(value, dict):
+            meta["begin"] = _timestamp(value.get("start-datetime"))
+            meta["end"] = _timestamp(value.get("end-datetime"))
+    return meta, pending
+
+
+def read_report_metadata(file_path, data=None):
+    """Reads only the header of a report (see read_header); None if unreadable."""
+    try:
+        stream = dmarc_parser.open_report(file_path, data)
+        if stream is None:
+            return None
+        with stream:
+            meta, _ = read_header(iter_report_items(stream))
+        return meta
+    except Exception:
+        return None
+
+
+def _count(value):
+    try:
+        return int(value or 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+def policy_base(policy, base):
+    """base (report fields) plus the policy's domain and type."""
+    return dict(
+        base,
+        domain=_policy_domain(policy),
+        policy_type=policy.get("policy", {}).get("policy-type") or "",
+    )
+
+
+def failure_record(failure, base):
+    """The record of one failure-details entry (base from policy_base)."""
+    return dict(
+        base,
+        result_type=failure.get("result-type") or "unknown",
+        sessions=_count(failure.get("failed-session-count")),
+        sending_ip=failure.get("sending-mta-ip") or "",
+        receiving_mx=(failure.get("receiving-mx-hostname") or "").rstrip("."),
+        receiving_ip=failure.get("receiving-ip") or "",
+    )
+
+
+def policy_records(policy, base):
+    """
+    Flattens one policy into records: one for its successful sessions and
+    one per failure-details entry left in the policy (streamed entries
+    come separately; see iter_report_items).
+    """
+    base = policy_base(policy, base)
+    summary = policy.get("summary", {})
+    empty = {"sending_ip": "", "receiving_mx": "", "receiving_ip": ""}
+    records = [
+        dict(
+            base,
+            result_type="success",
+            sessions=_count(summary.get("total-successful-session-count")),
+            **empty,
+        )
+    ]
+    for failure in policy.get("failure-details") or ():
+        records.append(failure_record(failure, base))
+    return records
+
+
+@profiling.timed("report.parse")
+def parse_tlsrpt(file_path, index=None, report_filter=None):
+    """
+    Streams one TLS report and returns its records as dicts (see
+    policy_records). Filtering and de-duplication work as in
+    dmarc_parser.parse_dmarc_xml.
+    """
+    filename = os.path.basename(file_path)
+    records = []
+    try:
+        stream = dmarc_parser.open_report(file_path)
+        if stream is None:
+            return []
+        with stream:
+            items = iter_report_items(stream)
+            meta, pending = read_header(items)
+            if report_filter and not report_filter.matches(meta):
+                profiling.count("report.filtered")
+                return []
+            if index is not None:
+                from . import dedup
+
+                if not index.add(dedup.report_key(meta)):
+                    profiling.count("report.duplicates")
+                    return []
+
+            base = {
+                "org_name": meta["org_name"] or "Unknown Org",
+                "date": dmarc_parser._format_day(meta["begin"]),
+                "report_id": meta["report_id"],
+                "file": filename,
+            }
+            current = base
+            for key, value in itertools.chain(pending, items):
+                if key == "policy":
+                    records.extend(policy_records(value, base))
+                    current = policy_base(value, base)
+                elif key == "failure":
+                    records.append(failure_record(value, current))
+    except Exception as e:
+        ui.print_error(f"Processing '{filename}': {e}")
+        return []
+
+    if records:
+        profiling.count("report.files")
+        profiling.count("report.records", len(records))
+    return records
+
+
+# --- Aggregation ---
+
+EXPORT_FIELDS = [
+    "org_name",
+    "date",
+    "domain",
+    "policy_type",
+    "result_type",
+    "sessions",
+    "sending_ip",
+    "receiving_mx",
+    "receiving_ip",
+    "file",
+]
+
+# Columns of the per-MTA failure summary
+MTA_FIELDS = ["receiving_mx", "domains", "reporters", "failed", "result_types"]
+
+
+def totals(records):
+    """(successful sessions, failed sessions) over records."""
+    ok = sum(r["sessions"] for r in records if r["result_type"] == "success")
+    return ok, sum(r["sessions"] for r in records) - ok
+
+
+def summarize_mtas(records):
+    """
+    Groups failure records by receiving MTA (hostname, else IP), most
+    failed sessions first. result_types lists each failure kind with its
+    session count.
+    """
+    groups = {}
+    for r in records:
+        if r["result_type"] == "success":
+            continue
+        mta = r["receiving_mx"] or r["receiving_ip"] or "(unknown)"
+        g = groups.get(mta)
+        if g is None:
+            g = groups[mta] = {
+                "receiving_mx": mta,
+                "domains": set(),
+                "reporters": set(),
+                "failed": 0,
+                "result_types": {},
+            }
+        g["domains"].add(r["domain"])
+        g["reporters"].add(r["org_name"])
+        g["failed"] += r["sessions"]
+        kinds = g["result_types"]
+        kinds[r["result_type"]] = kinds.get(r["result_type"], 0) + r["sessions"]
+
+    rows = []
+    for g in groups.values():
+        g["domains"] = len(g["domains"])
+        g["reporters"] = len(g["reporters"])
+        kinds = sorted(g["result_types"].items(), key=lambda kv: -kv[1])
+        g["result_types"] = ", ".join(f"{kind} ({n})" for kind, n in kinds)
+        rows.append(g)
+    rows.sort(key=lambda g: (-g["failed"], g["receiving_mx"]))
+    return rows
+
+
+def warn_failures(records):
+    """Records consumer for fetch (see dmarc_parser.ingest_hook)."""
+    ok, failed = totals(records)
+    if failed:
+        worst = summarize_mtas(records)[0]
+        ui.print_warning(
+            f"{records[0]['date']} {records[0]['domain']} ({records[0]['org_name']}): "
+            f"{failed} of {ok + failed} TLS sessions failed, "
+            f"mostly at {worst['receiving_mx']}"
+        )
+
+
+@profiling.timed("render.mtas")
+def render_mtas(rows, fmt="table", stream=None):
+    """Writes summarize_mtas() rows as a table or as tsv/json/jsonl."""
+    if fmt != "table":
+        ui.get_renderer(fmt, MTA_FIELDS, stream).render(rows)
+        return
+    if not rows:
+        ui.print_success("No TLS failures reported.")
+        return
+    row_fmt = "%-36s | %7s | %9s | %8s | %s"
+    with ui.BufferedOutput(stream) as out:
+        out.write_line(ui.format_sub_header("TLS failures by receiving MTA"))
+        out.write_line(
+            ui.Colors.HEADER
+            + row_fmt % ("Receiving MTA", "Domains", "Reporters", "Failed", "Results")
+            + ui.Colors.RESET
+        )
+        out.write_line("-" * 88)
+        for g in rows:
+            out.write_line(
+                ui.Colors.RED
+                + row_fmt
+                % (
+                    g["receiving_mx"][:36],
+                    g["domains"],
+                    g["reporters"],
+                    g["failed"],
+                    g["result_types"],
+                )
+                + ui.Colors.RESET
+            )
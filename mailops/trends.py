@@ -0,0 +1,229 @@
+# mailops/trends.py
+"""
+Incremental sender baselines and anomaly detection.
+
+Every ingested report updates a few numbers per sender (policy domain +
+source IP) and reporting org: reports seen, an exponentially weighted
+moving average (EWMA) of messages per report and of the pass rate, and the
+last report date. New reports are compared against those baselines as they
+arrive, so nothing is ever rescanned and the state grows with the number of
+senders, not with the archive.
+
+Flags raised:
+  new_sender      first report for a sender, with mail failing both SPF and DKIM
+  pass_rate_drop  a known sender's pass rate fell well below its baseline
+  volume_spike    a known sender sent several times its usual volume
+"""
+
+import json
+import os
+import threading
+from datetime import date, timedelta
+
+from . import atomic, dedup, ui
+
+STATE_FILENAME = ".trends.json"
+
+ALPHA = 0.3  # EWMA weight of the newest report
+MIN_HISTORY = 3  # reports per sender/org before drops and spikes are judged
+NEW_SENDER_MIN_MESSAGES = 5
+PASS_RATE_DROP = 0.25
+SPIKE_FACTOR = 4.0
+SPIKE_MIN_MESSAGES = 50
+MAX_AGE_DAYS = 180  # senders unseen for longer are forgotten
+MAX_ALERTS = 500  # recent anomalies kept for `mailops trends`
+
+# Baseline slots: [reports, ewma messages, ewma pass rate, last report date]
+REPORTS, VOLUME, PASS_RATE, LAST_SEEN = range(4)
+
+
+def _messages(record):
+    try:
+        return int(record["count"] or 0)
+    except ValueError:
+        return 0
+
+
+def summarize(records):
+    """
+    Folds one report's records into per-sender totals:
+    {(domain, ip): [messages, passed, failed_both]}.
+    """
+    totals = {}
+    for r in records:
+        key = (r.get("domain") or "", r["source_ip"])
+        t = totals.setdefault(key, [0, 0, 0])
+        n = _messages(r)
+        t[0] += n
+        if r["spf"] == "pass" or r["dkim"] == "pass":
+            t[1] += n
+        else:
+            t[2] += n
+    return totals
+
+
+class TrendEngine:
+    """Per-sender rolling baselines persisted in a small JSON file."""
+
+    def __init__(self, path=None):
+        self.path = path
+        self.senders = {}
+        self.alerts = []
+        # Reports already folded in, kept next to the state (.trends.index)
+        self.reports = dedup.ReportIndex(
+            os.path.splitext(path)[0] + ".index" if path else None
+        )
+        self._lock = threading.Lock()
+        self.load()
+
+    @classmethod
+    def for_archive(cls, directory):
+        """Opens the baselines stored inside a report archive."""
+        return cls(os.path.join(directory, STATE_FILENAME))
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path) as f:
+                state = json.load(f)
+            self.senders = state["senders"]
+            self.alerts = state.get("alerts", [])
+        except (OSError, ValueError, KeyError) as e:
+            ui.print_warning(f"Ignoring unreadable trend state {self.path}: {e}")
+
+    def save(self):
+        """Prunes stale senders and writes the state atomically."""
+        if not self.path:
+            return
+        self.prune()
+        with self._lock:
+            text = json.dumps({"senders": self.senders, "alerts": self.alerts})
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        atomic.write_atomic(self.path, text)
+
+    def prune(self, max_age_days=MAX_AGE_DAYS):
+        """
+        Forgets sender/org baselines not seen within max_age_days of the
+        newest report (not of today, so replaying an old archive keeps them).
+        """
+        with self._lock:
+            seen = [
+                b[LAST_SEEN]
+                for sender in self.senders.values()
+                for b in sender["orgs"].values()
+                if b[LAST_SEEN][:1].isdigit()  # not "Unknown"
+            ]
+            if not seen:
+                return
+            newest = date.fromisoformat(max(seen))
+            cutoff = (newest - timedelta(days=max_age_days)).isoformat()
+            for key in list(self.senders):
+                orgs = self.senders[key]["orgs"]
+                for org in [o for o, b in orgs.items() if b[LAST_SEEN] < cutoff]:
+                    del orgs[org]
+                if not orgs:
+                    del self.senders[key]
+
+    # --- Ingest ---
+
+    def ingest(self, records):
+        """
+        Compares one report (records from parse_dmarc_xml) with the
+        baselines, then folds it in. Returns the anomalies it raised.
+        A report already folded in (same org and report_id) is skipped, so
+        replaying an archive that was also fed live counts it once.
+        """
+        if not records:
+            return []
+        org = records[0]["org_name"]
+        day = records[0]["date"]
+        anomalies = []
+        with self._lock:
+            if not self.reports.add(dedup.report_key(records[0])):
+                return []
+            for (domain, ip), totals in summarize(records).items():
+                messages, passed, failed = totals
+                if not messages:
+                    continue
+                sender = self.senders.setdefault(
+                    f"{domain}|{ip}", {"first_seen": day, "orgs": {}}
+                )
+                rate = passed / messages
+                base = sender["orgs"].get(org)
+                alert = {
+                    "date": day,
+                    "domain": domain,
+                    "source_ip": ip,
+                    "org_name": org,
+                    "messages": messages,
+                    "pass_rate": round(rate, 3),
+                }
+
+                if not sender["orgs"]:
+                    if failed >= NEW_SENDER_MIN_MESSAGES:
+                        anomalies.append(dict(alert, kind="new_sender", baseline=None))
+                elif base and base[REPORTS] >= MIN_HISTORY:
+                    if rate < base[PASS_RATE] - PASS_RATE_DROP:
+                        anomalies.append(
+                            dict(
+                                alert,
+                                kind="pass_rate_drop",
+                                baseline=round(base[PASS_RATE], 3),
+                            )
+                        )
+                    if (
+                        messages >= SPIKE_MIN_MESSAGES
+                        and messages > SPIKE_FACTOR * base[VOLUME]
+                    ):
+                        anomalies.append(
+                            dict(
+                                alert,
+                                kind="volume_spike",
+                                baseline=round(base[VOLUME], 1),
+                            )
+                        )
+
+                if base is None:
+                    sender["orgs"][org] = [1, float(messages), rate, day]
+                else:
+                    base[REPORTS] += 1
+                    base[VOLUME] += ALPHA * (messages - base[VOLUME])
+                    base[PASS_RATE] += ALPHA * (rate - base[PASS_RATE])
+                    base[LAST_SEEN] = max(base[LAST_SEEN], day)
+
+            self.alerts = (self.alerts + anomalies)[-MAX_ALERTS:]
+        return anomalies
+
+
+def describe(anomaly):
+    """One-line description of an anomaly for the console."""
+    who = f"{anomaly['source_ip']} -> {anomaly['domain']} ({anomaly['org_name']})"
+    kind = anomaly["kind"]
+    if kind == "new_sender":
+        detail = f"new sender, {anomaly['messages']} msgs failing SPF and DKIM"
+    elif kind == "pass_rate_drop":
+        detail = (
+            f"pass rate {anomaly['pass_rate']:.0%} "
+            f"(baseline {anomaly['baseline']:.0%})"
+        )
+    else:
+        detail = f"{anomaly['messages']} msgs (baseline {anomaly['baseline']:.0f})"
+    return f"{anomaly['date']} {who}: {detail}"
+
+
+def watcher(engine, store=None):
+    """
+    Returns a records consumer (see dmarc_parser.ingest_hook) that feeds
+    each new report to the engine and prints the anomalies it raises,
+    also counting them in a metrics.MetricsStore if given.
+    """
+
+    def check(records):
+        anomalies = engine.ingest(records)
+        for a in anomalies:
+            ui.print_warning(describe(a))
+        if store is not None:
+            store.record_anomalies(anomalies)
+
+    return check
@@ -1,9 +1,7 @@
+# mailops/ui.py
 import os
 import sys
 
-sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-# mailops/ui.py
-
 
 class Colors:
     HEADER = "\033[95m"
@@ -15,31 +13,173 @@ class Colors:
     BOLD = "\033[1m"
 
 
+_ANSI_CODES = {k: v for k, v in vars(Colors).items() if k.isupper()}
+
+
+def should_use_color(stream=None):
+    """Color only for terminals; NO_COLOR / FORCE_COLOR override detection."""
+    if os.environ.get("NO_COLOR"):
+        return False
+    if os.environ.get("FORCE_COLOR"):
+        return True
+    stream = stream or sys.stdout
+    return hasattr(stream, "isatty") and stream.isatty()
+
+
+def set_color(enabled):
+    """Switches every Colors code on or off (off = empty strings)."""
+    for name, code in _ANSI_CODES.items():
+        setattr(Colors, name, code if enabled else "")
+
+
+# Pipes and files get plain text without escape codes
+set_color(should_use_color())
+
+# Where print_* status messages go (None = stdout). Machine-readable output
+# formats move them to stderr so they don't corrupt the data stream.
+STATUS_STREAM = None
+
+
+def set_status_stream(stream):
+    global STATUS_STREAM
+    STATUS_STREAM = stream
+
+
+def format_sub_header(text):
+    return f"\n{Colors.BOLD}--- {text} ---{Colors.RESET}"
+
+
 def print_header(text):
     """Prints a bold, colorful header section."""
-    print(f"\n{Colors.HEADER}{Colors.BOLD}=== {text} ==={Colors.RESET}")
+    print(
+        f"\n{Colors.HEADER}{Colors.BOLD}=== {text} ==={Colors.RESET}",
+        file=STATUS_STREAM,
+    )
 
 
 def print_sub_header(text):
     """Prints a sub-header (e.g., for individual reports)."""
-    print(f"\n{Colors.BOLD}--- {text} ---{Colors.RESET}")
+    print(format_sub_header(text), file=STATUS_STREAM)
 
 
 def print_error(text):
     """Prints an error message in Red."""
-    print(f"{Colors.RED}[!] Error: {text}{Colors.RESET}")
+    print(f"{Colors.RED}[!] Error: {text}{Colors.RESET}", file=STATUS_STREAM)
 
 
 def print_warning(text):
     """Prints a warning in Yellow."""
-    print(f"{Colors.YELLOW}[!] Warning: {text}{Colors.RESET}")
+    print(f"{Colors.YELLOW}[!] Warning: {text}{Colors.RESET}", file=STATUS_STREAM)
 
 
 def print_success(text):
     """Prints a success message in Green."""
-    print(f"{Colors.GREEN}[+] {text}{Colors.RESET}")
+    print(f"{Colors.GREEN}[+] {text}{Colors.RESET}", file=STATUS_STREAM)
 
 
 def print_info(text):
     """Prints a general info message in Blue."""
-    print(f"{Colors.BLUE}[*] {text}{Colors.RESET}")
+    print(f"{Colors.BLUE}[*] {text}{Colors.RESET}", file=STATUS_STREAM)
+
+
+# --- Bulk Output ---
+
+
+class BufferedOutput:
+    """
+    Collects lines and writes them to the stream in large chunks, instead
+    of one print() (and often one syscall) per row.
+    """
+
+    def __init__(self, stream=None, limit=1 << 16):
+        self.stream = stream or sys.stdout
+        self.limit = limit
+        self._parts = []
+        self._size = 0
+
+    def write_line(self, text=""):
+        self._parts.append(text)
+        self._size += len(text) + 1
+        if self._size >= self.limit:
+            self.flush()
+
+    def write_lines(self, lines):
+        for line in lines:
+            self.write_line(line)
+
+    def flush(self):
+        if self._parts:
+            self.stream.write("\n".join(self._parts) + "\n")
+            self._parts = []
+            self._size = 0
+        self.stream.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.flush()
+        return False
+
+
+class Renderer:
+    """Writes a list of dict rows in a machine-readable format."""
+
+    def __init__(self, columns, stream=None):
+        self.columns = columns
+        self.stream = stream
+
+    def render(self, rows):
+        with BufferedOutput(self.stream) as out:
+            out.write_lines(self.lines(rows))
+
+    def lines(self, rows):
+        raise NotImplementedError
+
+
+def _tsv_cell(value):
+    text = "" if value is None else str(value)
+    return text.replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n")
+
+
+class TSVRenderer(Renderer):
+    def lines(self, rows):
+        columns = self.columns
+        yield "\t".join(columns)
+        for row in rows:
+            yield "\t".join([_tsv_cell(row.get(c)) for c in columns])
+
+
+class JSONLinesRenderer(Renderer):
+    """One JSON object per line; streams well into jq or log shippers."""
+
+    def lines(self, rows):
+        import json
+
+        dumps = json.JSONEncoder(ensure_ascii=False).encode
+        columns = self.columns
+        for row in rows:
+            yield dumps({c: row.get(c) for c in columns})
+
+
+class JSONRenderer(JSONLinesRenderer):
+    """A single JSON array, written incrementally."""
+
+    def lines(self, rows):
+        yield "["
+        first = True
+        for line in super().lines(rows):
+            yield ("  " if first else ", ") + line
+            first = False
+        yield "]"
+
+
+RENDERERS = {"tsv": TSVRenderer, "json": JSONRenderer, "jsonl": JSONLinesRenderer}
+
+
+def get_renderer(fmt, columns, stream=None):
+    """Returns the renderer for --format tsv/json/jsonl."""
+    try:
+        return RENDERERS[fmt](columns, stream)
+    except KeyError:
+        raise ValueError(f"Unknown output format: {fmt}") from None
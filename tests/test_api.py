@@ -0,0 +1,108 @@
+# tests/test_api.py
+import asyncio
+import gzip
+import shutil
+
+import pytest
+
+from benchmarks import corpus
+from benchmarks.fake_doh import FakeDoHServer, default_zone
+from benchmarks.fake_imap import FakeIMAPServer
+from mailops import api, doh
+
+
+@pytest.fixture
+def dns(monkeypatch):
+    """Starts a fake DoH server for a zone and points mailops at it."""
+    servers = []
+
+    def start(zone):
+        server = FakeDoHServer(zone).start()
+        servers.append(server)
+        monkeypatch.setattr(doh, "DOH_URL", server.url)
+        return server
+
+    yield start
+    for server in servers:
+        server.stop()
+
+
+def test_spf_batch_is_quiet(dns, capsys):
+    zone = default_zone("example.com")
+    zone[("open.example", "TXT")] = ['"v=spf1 +all"']
+    server = dns(zone)
+    ok, missing, open_relay = api.check_spf(
+        ["example.com", "missing.example", "open.example"]
+    )
+
+    assert ok.ok and ok.record.startswith("v=spf1") and ok.lookups == 1
+    assert missing.record is None and missing.error is None and not missing.ok
+    assert not open_relay.ok and "+all" in open_relay.issues[0]
+    assert len(server.queries) == 3
+    assert capsys.readouterr().out == ""
+
+
+def test_blacklists_for_ips_and_domains(dns, capsys):
+    dns(default_zone("example.com", listed_ips=["192.0.2.10"]))
+    ip, domain, unknown = api.check_blacklists(
+        ["198.51.100.1", "example.com", "missing.example"]
+    )
+
+    assert ip.ip == "198.51.100.1" and ip.listed == []
+    assert set(ip.results) == set(api.blacklist_monitor.RBL_PROVIDERS)
+    assert domain.ip == "192.0.2.10" and domain.listed == ["zen.spamhaus.org"]
+    assert unknown.ip is None and unknown.results == {}
+    assert capsys.readouterr().out == ""
+
+
+def test_async_variant(dns):
+    dns(default_zone("example.com"))
+    (result,) = asyncio.run(api.check_spf_async("example.com"))
+    assert result.ok
+
+
+def test_parse_reports_batch(tmp_path):
+    paths = corpus.write_corpus(
+        str(tmp_path), count=3, records_per_report=4, compression="gz"
+    )
+    shutil.copy(paths[0], tmp_path / "copy.xml.gz")
+    (tmp_path / "broken.xml.gz").write_bytes(gzip.compress(b"<feedback><record>"))
+
+    reports = api.parse_reports([str(tmp_path)])
+    by_name = {r.path.rsplit("/", 1)[-1]: r for r in reports}
+    assert by_name["broken.xml.gz"].error and not by_name["broken.xml.gz"].records
+    assert sum(len(r.records) for r in reports) == 12  # the copy is counted once
+    assert all(r["hostname"] == "" for r in reports[0].records)  # no PTR lookups
+
+
+def test_fetch_returns_result(tmp_path, capsys):
+    reports = list(corpus.generate_reports(count=3, records_per_report=2))
+    messages = [corpus.build_message(r) for r in reports]
+    with FakeIMAPServer(messages) as server:
+        host, port = server.address
+        options = dict(port=port, use_ssl=False, output_dir=str(tmp_path))
+        progress = []
+        result = api.fetch_reports(
+            server.username,
+            server.password,
+            host,
+            progress=lambda level, message: progress.append((level, message)),
+            **options,
+        )
+        again = api.fetch_reports(server.username, server.password, host, **options)
+        with pytest.raises(api.FetchError, match="Login Failed"):
+            api.fetch_reports(server.username, "wrong", host, **options)
+
+    assert (result.found, result.saved, result.complete) == (3, 3, True)
+    assert (again.found, again.saved) == (0, 0)
+    assert sum(level == "success" for level, _ in progress) == 3  # "Saved: ..."
+    assert capsys.readouterr().out == ""
+
+
+@pytest.mark.skipif(not shutil.which("openssl"), reason="needs openssl")
+def test_dkim_keys(tmp_path):
+    keys = api.generate_dkim_keys(["s1", "s2"], "example.com", str(tmp_path))
+    assert [k.selector for k in keys] == ["s1", "s2"]
+    assert keys[0].host == "s1._domainkey"
+    assert keys[0].record.startswith("v=DKIM1; k=rsa; p=MII")
+    assert (tmp_path / "s2.private").exists()
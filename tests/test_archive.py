@@ -0,0 +1,174 @@
+# tests/test_archive.py
+import mmap
+import os
+from datetime import date, datetime, timezone
+
+import pytest
+
+from benchmarks import corpus
+from benchmarks.fake_imap import FakeIMAPServer
+from mailops import archive, dmarc_parser, imap_fetcher
+
+ORGS = [("google.com", "google.com")]
+START = 1700006400  # 2023-11-15, one report per day from here
+
+
+@pytest.fixture(autouse=True)
+def no_ptr_lookups(monkeypatch):
+    monkeypatch.setattr(dmarc_parser, "resolve_ip", lambda ip: "host.example.net")
+
+
+def _ts(day):
+    return int(datetime(2023, 11, day, tzinfo=timezone.utc).timestamp())
+
+
+def test_filter_pushdown_targets():
+    f = archive.ReportFilter(date(2023, 11, 16), date(2023, 11, 17), ["Example.com"])
+    assert f.imap_terms() == "SINCE 15-Nov-2023 BEFORE 21-Nov-2023"
+    assert not f.wants_folder("2023-11-01")
+    assert f.wants_folder("2023-11-18") and f.wants_folder("unknown_date")
+    assert f.wants_folder(archive.UNKNOWN, top=True)
+    assert not f.wants_folder("other.org", top=True)
+    assert not f.wants_folder("2023-12-01")
+
+    meta = {"begin": str(_ts(16)), "end": str(_ts(17) - 1), "domain": "example.com"}
+    assert f.matches(meta)
+    assert not f.matches(dict(meta, domain="other.org"))
+    assert not f.matches(dict(meta, begin=str(_ts(18)), end=str(_ts(19) - 1)))
+    assert not archive.ReportFilter() and archive.ReportFilter().matches({})
+
+
+def test_report_walk_skips_folders_and_cuts_parsing_short(tmp_path):
+    for day, policy_domain in ((12, "example.com"), (16, "example.com"), (16, "b.org")):
+        corpus.write_corpus(
+            str(tmp_path / f"2023-11-{day + 1}"),
+            count=1,
+            records_per_report=3,
+            orgs=ORGS,
+            policy_domain=policy_domain,
+            start=_ts(day),
+        )
+    f = archive.ReportFilter(date(2023, 11, 16), domains=["example.com"])
+    files = archive.find_report_files(str(tmp_path), f)
+    assert all("2023-11-13" not in path for path in files) and len(files) == 2
+
+    records = []
+    for path in files:
+        records.extend(dmarc_parser.parse_dmarc_xml(path, report_filter=f))
+    assert len(records) == 3
+
+
+def test_fetch_searches_by_date_and_filters_by_domain(tmp_path, capsys):
+    reports = list(corpus.generate_reports(count=6, records_per_report=1, orgs=ORGS))
+    reports += list(
+        corpus.generate_reports(
+            count=6, records_per_report=1, orgs=ORGS, policy_domain="b.org", seed=1
+        )
+    )
+    f = archive.ReportFilter(since=date(2023, 11, 18), domains=["example.com"])
+    with FakeIMAPServer([corpus.build_message(r) for r in reports]) as server:
+        host, port = server.address
+        imap_fetcher.fetch_reports(
+            server.username,
+            server.password,
+            host,
+            port=port,
+            use_ssl=False,
+            output_dir=str(tmp_path),
+            report_filter=f,
+        )
+    # SINCE 17-Nov-2023 leaves 2 x 5 messages (sent the day after each period)
+    assert "Found 10 potential report emails" in capsys.readouterr().out
+    saved = [f for _, _, files in os.walk(tmp_path) for f in files if f[0] != "."]
+    # Reports covering Nov 18, 19 and 20 for example.com only
+    assert len(saved) == 3
+
+
+def test_partition_dir_uses_policy_domain_and_report_month():
+    meta = {"domain": "Example.COM", "begin": str(_ts(30))}
+    expected = os.path.join("r", "example.com", "2023-11")
+    assert archive.partition_dir("r", meta) == expected
+    unknown = archive.partition_dir("r", {"domain": ".."}, "2024-02-03")
+    assert unknown == os.path.join("r", archive.UNKNOWN, "2024-02")
+
+
+def test_fetch_partitions_by_domain_and_month(tmp_path):
+    reports = list(corpus.generate_reports(count=3, records_per_report=1, orgs=ORGS))
+    reports += list(
+        corpus.generate_reports(
+            count=3, records_per_report=1, policy_domain="b.org", seed=1
+        )
+    )
+    with FakeIMAPServer([corpus.build_message(r) for r in reports]) as server:
+        host, port = server.address
+        imap_fetcher.fetch_reports(
+            server.username,
+            server.password,
+            host,
+            port=port,
+            use_ssl=False,
+            output_dir=str(tmp_path),
+        )
+    partition = tmp_path / "example.com" / "2023-11"
+    index = archive.read_index(str(partition))
+    assert sorted(index) == sorted(os.listdir(partition))[1:]  # minus .index.tsv
+    assert {m["org_name"] for m in index.values()} == {"google.com"}
+
+    # A per-customer query only lists that customer's partition
+    f = archive.ReportFilter(domains=["example.com"])
+    files = archive.find_report_files(str(tmp_path), f)
+    assert len(files) == 3 and all("b.org" not in path for path in files)
+
+    # The sidecar index answers org filters without opening the reports
+    for name in index:
+        (partition / name).write_bytes(b"not xml")
+    f = archive.ReportFilter(domains=["example.com"], orgs=["yahoo"])
+    assert archive.find_report_files(str(tmp_path), f) == []
+
+
+def test_fetch_maintains_archive_index(tmp_path):
+    # An archive from before the index: a legacy date folder
+    corpus.write_corpus(
+        str(tmp_path / "2023-11-13"), count=1, records_per_report=1, orgs=ORGS
+    )
+    reports = list(
+        corpus.generate_reports(count=3, records_per_report=1, orgs=ORGS, seed=1)
+    )
+    with FakeIMAPServer([corpus.build_message(r) for r in reports]) as server:
+        host, port = server.address
+        imap_fetcher.fetch_reports(
+            server.username,
+            server.password,
+            host,
+            port=port,
+            use_ssl=False,
+            output_dir=str(tmp_path),
+        )
+    index = archive.ArchiveIndex.for_archive(str(tmp_path))
+    entries = list(index.entries())
+    assert len(entries) == 4 and entries[0]["file"].startswith("2023-11-13/")
+    assert all(e["begin"] for e in entries)  # legacy header read once
+
+    # Files are listed from the index alone
+    (tmp_path / "example.com" / "stray.xml").write_bytes(b"<feedback/>")
+    files = archive.find_report_files(str(tmp_path))
+    assert len(files) == 4 and files[0].endswith(".xml")
+    f = archive.ReportFilter(since=date(2023, 11, 16))
+    assert len(archive.find_report_files(str(tmp_path), f)) == 2
+
+    # A torn entry is skipped and doesn't swallow the next one
+    with open(index.path, "a") as torn:
+        torn.write("example.com/half")
+    index.add(str(tmp_path / "example.com" / "stray.xml"), {})
+    files = archive.find_report_files(str(tmp_path))
+    assert len(files) == 5 and files[-1] == str(tmp_path / "example.com" / "stray.xml")
+    assert index.rebuild() == 5
+
+
+def test_plain_xml_is_memory_mapped(tmp_path):
+    (path,) = corpus.write_corpus(str(tmp_path), count=1, records_per_report=2)
+    with dmarc_parser.open_report(path) as stream:
+        assert isinstance(stream, mmap.mmap)
+    (tmp_path / "empty.xml").write_bytes(b"")
+    assert len(dmarc_parser.parse_dmarc_xml(path)) == 2
+    assert dmarc_parser.parse_dmarc_xml(str(tmp_path / "empty.xml")) == []
@@ -0,0 +1,69 @@
+# tests/test_asn.py
+import gzip
+
+import pytest
+
+from benchmarks import corpus
+from mailops import asn, dmarc_parser
+
+DATASET = """\
+# first\tlast\tasn\tcountry\tdescription
+1.0.0.0\t1.0.0.255\t13335\tUS\tCLOUDFLARENET
+8.0.0.0\t8.255.255.255\t3356\tUS\tLEVEL3
+8.8.8.0\t8.8.8.255\t15169\tUS\tGOOGLE
+10.0.0.0\t10.255.255.255\t0\tNone\tNot routed
+2001:4860::\t2001:4860:ffff:ffff:ffff:ffff:ffff:ffff\t15169\tUS\tGOOGLE
+"""
+
+
+@pytest.fixture
+def dataset(tmp_path):
+    path = tmp_path / "ip2asn.tsv.gz"
+    with gzip.open(path, "wt") as f:
+        f.write(DATASET)
+    return str(path)
+
+
+def test_lookup_prefers_most_specific_range(dataset):
+    db = asn.AsnDatabase.build(dataset)
+    assert db.lookup("8.8.8.8") == (15169, "GOOGLE")
+    assert db.lookup("8.8.9.1") == (3356, "LEVEL3")
+    assert db.lookup("8.0.0.0") == (3356, "LEVEL3")
+    assert db.lookup("2001:4860::8888") == (15169, "GOOGLE")
+    assert db.lookup("10.1.1.1") is None  # AS0 = not routed
+    assert db.lookup("9.9.9.9") is None and db.lookup("not-an-ip") is None
+
+
+def test_cidr_and_pfx2as_lines(tmp_path):
+    path = tmp_path / "pfx.txt"
+    path.write_text(
+        "192.0.2.0/24\tAS64500\tEXAMPLE-NET\n198.51.100.0\t24\t64501_64502\n"
+    )
+    db = asn.AsnDatabase.build(str(path))
+    assert db.lookup("192.0.2.10") == (64500, "EXAMPLE-NET")
+    assert db.lookup("198.51.100.7") == (64501, "")
+
+
+def test_compiled_index_is_reused(dataset, tmp_path):
+    first = asn.AsnDatabase.open(dataset)
+    assert (tmp_path / "ip2asn.tsv.gz.idx").exists()
+    cached = asn.AsnDatabase.open(dataset)
+    assert isinstance(cached.v4[0], memoryview)
+    for ip in ("1.0.0.1", "8.8.8.8", "8.1.2.3", "2001:4860::1", "10.0.0.1"):
+        assert cached.lookup(ip) == first.lookup(ip)
+
+
+def test_records_are_enriched_and_grouped(tmp_path, monkeypatch):
+    monkeypatch.setattr(dmarc_parser, "resolve_ip", lambda ip: "Unknown")
+    dataset = corpus.write_asn_dataset(str(tmp_path / "asn.tsv"), prefixes=300)
+    (path,) = corpus.write_corpus(str(tmp_path), count=1, records_per_report=20)
+    asn.configure(dataset)
+    try:
+        records = dmarc_parser.parse_dmarc_xml(path)
+    finally:
+        asn.configure(None)
+    assert all(r["asn"] and r["as_org"].startswith("BENCH-NET") for r in records)
+
+    rows = dmarc_parser.summarize_networks(records)
+    assert sum(g["messages"] for g in rows) == sum(int(r["count"]) for r in records)
+    assert rows == sorted(rows, key=lambda g: -g["failed"])
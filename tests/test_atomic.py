@@ -0,0 +1,26 @@
+# tests/test_atomic.py
+import os
+
+import pytest
+
+from mailops import atomic
+
+
+def test_write_replaces_the_file(tmp_path):
+    target = tmp_path / "state.json"
+    target.write_text("old")
+    atomic.write_atomic(str(target), "new")
+    assert target.read_text() == "new"
+    assert os.listdir(tmp_path) == ["state.json"]
+
+
+def test_failed_write_leaves_no_temp_files(tmp_path, monkeypatch):
+    target = tmp_path / "report.xml"
+
+    def fail(*args):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(os, "replace", fail)
+    with pytest.raises(OSError):
+        atomic.write_atomic(str(target), b"<feedback/>")
+    assert os.listdir(tmp_path) == []
@@ -0,0 +1,60 @@
+# tests/test_benchmarks.py
+import os
+
+import pytest
+
+from benchmarks import corpus
+from benchmarks.fake_doh import FakeDoHServer
+from benchmarks.fake_imap import FakeIMAPServer
+from benchmarks.run import main as run_benchmarks
+from mailops import dmarc_parser, doh, imap_fetcher, spf_check
+
+
+@pytest.fixture(autouse=True)
+def no_ptr_lookups(monkeypatch):
+    """Keeps parser tests off the network."""
+    monkeypatch.setattr(dmarc_parser, "resolve_ip", lambda ip: "host.example.net")
+
+
+@pytest.mark.parametrize("compression", ["none", "gz", "zip"])
+def test_corpus_round_trips_through_parser(tmp_path, compression):
+    paths = corpus.write_corpus(
+        str(tmp_path), count=3, records_per_report=7, compression=compression
+    )
+    assert len(paths) == 3
+    for path in paths:
+        records = dmarc_parser.parse_dmarc_xml(path)
+        assert len(records) == 7
+        assert records[0]["org_name"] in [org for _, org in corpus.DEFAULT_ORGS]
+
+
+def test_fetch_reports_from_fake_imap(tmp_path):
+    reports = list(corpus.generate_reports(count=4, records_per_report=2))
+    messages = [corpus.build_message(r) for r in reports]
+    with FakeIMAPServer(messages) as server:
+        host, port = server.address
+        imap_fetcher.fetch_reports(
+            server.username,
+            server.password,
+            host,
+            port=port,
+            use_ssl=False,
+            output_dir=str(tmp_path),
+        )
+    saved = [f for _, _, files in os.walk(tmp_path) for f in files if f[0] != "."]
+    assert len(saved) == 4
+
+
+def test_spf_lookup_via_fake_doh(monkeypatch):
+    with FakeDoHServer(latency=0.001) as server:
+        monkeypatch.setattr(doh, "DOH_URL", server.url)
+        record = spf_check.fetch_spf_record("example.com")
+    assert record is not None and record.startswith("v=spf1")
+    assert server.queries == [("example.com", "TXT")]
+
+
+def test_runner_writes_json(tmp_path):
+    out = tmp_path / "bench.json"
+    args = ["parse", "--reports", "2", "--records", "5", "--repeat", "1"]
+    assert run_benchmarks(args + ["--output", str(out)]) == 0
+    assert run_benchmarks(args + ["--compare", str(out), "--tolerance", "1"]) == 0
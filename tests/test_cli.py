@@ -0,0 +1,36 @@
+# tests/test_cli.py
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY = ["imaplib", "xml.etree.ElementTree", "urllib.request", "subprocess", "csv"]
+
+
+def run_python(code):
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    return subprocess.run(
+        [sys.executable, "-c", code], env=env, capture_output=True, text=True
+    )
+
+
+def test_cli_import_is_lazy():
+    """Tool modules must only be imported once their command runs."""
+    proc = run_python(
+        "import sys, mailops.cli\n"
+        f"print([m for m in {HEAVY!r} if m in sys.modules])"
+    )
+    assert proc.returncode == 0, proc.stderr
+    assert proc.stdout.strip() == "[]"
+
+
+def test_help_runs():
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    proc = subprocess.run(
+        [sys.executable, "-m", "mailops", "--help"],
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    assert proc.returncode == 0
+    assert "fetch" in proc.stdout and "report" in proc.stdout
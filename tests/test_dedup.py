@@ -0,0 +1,71 @@
+# tests/test_dedup.py
+import os
+
+import pytest
+
+from benchmarks import corpus
+from benchmarks.fake_imap import FakeIMAPServer
+from mailops import dedup, dmarc_parser, imap_fetcher
+
+
+@pytest.fixture(autouse=True)
+def no_ptr_lookups(monkeypatch):
+    monkeypatch.setattr(dmarc_parser, "resolve_ip", lambda ip: "host.example.net")
+
+
+def _archived(directory):
+    return [f for _, _, files in os.walk(directory) for f in files if f[0] != "."]
+
+
+def test_index_persists_between_runs(tmp_path):
+    key = ("google.com", "123", "1700000000", "1700086399")
+    with dedup.ReportIndex.for_archive(str(tmp_path)) as index:
+        assert index.add(key)
+        assert not index.add(key)
+        assert index.duplicates == 1
+        assert dedup.report_key({"org_name": "Google.com"}) is None
+
+    reopened = dedup.ReportIndex.for_archive(str(tmp_path))
+    assert key in reopened and len(reopened) == 1
+    assert os.path.getsize(tmp_path / dedup.INDEX_FILENAME) == dedup.FINGERPRINT_SIZE
+
+
+def test_parser_drops_resent_reports(tmp_path):
+    # Same reports twice: once plain, once gzipped under another name
+    paths = corpus.write_corpus(str(tmp_path), count=3, records_per_report=4)
+    paths += corpus.write_corpus(
+        str(tmp_path), count=3, records_per_report=4, compression="gz"
+    )
+    index = dedup.ReportIndex()
+    records = []
+    for path in paths:
+        records.extend(dmarc_parser.parse_dmarc_xml(path, index=index))
+    assert len(records) == 12
+    assert index.duplicates == 3
+    assert records[0]["report_id"] == "0-00000000"
+
+
+def test_fetch_skips_reports_already_archived(tmp_path):
+    plain = list(corpus.generate_reports(count=3, records_per_report=2))
+    resent = list(
+        corpus.generate_reports(count=3, records_per_report=2, compression="gz")
+    )
+
+    def fetch(reports):
+        messages = [corpus.build_message(r) for r in reports]
+        with FakeIMAPServer(messages) as server:
+            host, port = server.address
+            imap_fetcher.fetch_reports(
+                server.username,
+                server.password,
+                host,
+                port=port,
+                use_ssl=False,
+                output_dir=str(tmp_path),
+            )
+
+    fetch(plain + resent)
+    assert len(_archived(tmp_path)) == 3
+    # A later run (other mailbox, re-send) finds nothing new
+    fetch(resent)
+    assert len(_archived(tmp_path)) == 3
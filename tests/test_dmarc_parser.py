@@ -0,0 +1,147 @@
+# tests/test_dmarc_parser.py
+import io
+import xml.etree.ElementTree as ET
+
+import pytest
+
+from benchmarks import corpus
+from mailops import dmarc_parser
+
+REPORT = """<?xml version="1.0" encoding="UTF-8"?>
+<feedback>
+  <report_metadata>
+    <org_name>Example ESP</org_name>
+    <email>dmarc@esp.example</email>
+    <report_id>r-1</report_id>
+    <date_range><begin>1700000000</begin><end>1700086399</end></date_range>
+  </report_metadata>
+  <policy_published><domain>Example.com</domain><p>reject</p></policy_published>
+  <record>
+    <row>
+      <source_ip>192.0.2.1</source_ip>
+      <count>3</count>
+      <policy_evaluated><dkim>pass</dkim><spf>fail</spf></policy_evaluated>
+    </row>
+    <identifiers>
+      <envelope_from>bounce&amp;1.esp.example</envelope_from>
+      <header_from>example.com</header_from>
+    </identifiers>
+    <auth_results>
+      <dkim><domain>esp.example</domain><selector>s1</selector>
+        <result>fail</result></dkim>
+      <dkim><domain>example.com</domain><selector>s2</selector>
+        <result>pass</result><human_result/></dkim>
+      <spf><domain>esp.example</domain><scope>mfrom</scope>
+        <result>softfail</result></spf>
+    </auth_results>
+  </record>
+  <record>
+    <row>
+      <source_ip>198.51.100.7</source_ip>
+      <count>1</count>
+      <policy_evaluated><disposition>reject</disposition></policy_evaluated>
+    </row>
+    <identifiers><header_from>example.com</header_from></identifiers>
+    <auth_results><spf><domain>spoof.example</domain><result>fail</result></spf>
+    </auth_results>
+  </record>
+</feedback>
+"""
+
+
+@pytest.fixture(autouse=True)
+def no_ptr_lookups(monkeypatch):
+    monkeypatch.setattr(dmarc_parser, "resolve_ip", lambda ip: "host.example.net")
+
+
+@pytest.mark.parametrize(
+    "xml",
+    [
+        REPORT,
+        # Comments are left to ElementTree
+        REPORT.replace("<record>", "<!-- next --><record>"),
+    ],
+)
+def test_every_auth_result_is_kept(tmp_path, xml):
+    path = tmp_path / "report.xml"
+    path.write_text(xml)
+    first, second = dmarc_parser.parse_dmarc_xml(str(path))
+
+    assert first["domain"] == "example.com"
+    assert first["envelope_from"] == "bounce&1.esp.example"
+    assert first["auth_results"] == (
+        "dkim=fail esp.example/s1, dkim=pass example.com/s2, spf=softfail esp.example"
+    )
+    assert (first["spf"], first["dkim"]) == ("softfail", "pass")
+    assert first["status_msg"] == "OK"
+    # No <disposition> in the first record, no DKIM signature in the second
+    assert first["disposition"] == "none"
+    assert (second["dkim"], second["disposition"]) == ("none", "reject")
+    assert second["status_msg"] == "BLOCKED (Spoofing)"
+
+
+def test_fast_path_matches_elementtree():
+    reports = corpus.generate_reports(count=5, records_per_report=20)
+    payloads = [r["payload"] for r in reports] + [REPORT.encode()]
+    for payload in payloads:
+        fast = list(dmarc_parser.iter_records(io.BytesIO(payload)))
+        tree = list(dmarc_parser.iter_records(io.BytesIO(payload), fast=False))
+        assert fast == tree and len(fast) > 1
+
+
+def test_truncated_report_is_an_error(tmp_path, capsys):
+    path = tmp_path / "report.xml"
+    path.write_text(REPORT[: REPORT.index("<identifiers>")])
+    assert dmarc_parser.parse_dmarc_xml(str(path)) == []
+    assert "Processing 'report.xml'" in capsys.readouterr().out
+
+
+def _scan(payload, fast):
+    try:
+        return list(dmarc_parser.iter_records(io.BytesIO(payload), fast))
+    except dmarc_parser._Unsupported:
+        return "fallback"
+    except ET.ParseError:
+        return "error"
+
+
+@pytest.mark.parametrize(
+    "old, new, valid",
+    [
+        ("</identifiers>", "</idents>", False),
+        ("<row>\n      <source_ip>192.0.2.1", "<source_ip>192.0.2.1", False),
+        ("<header_from>example.com", "<header_from>ex&nbsp;ample.com", False),
+        ("bounce&amp;1", "bounce&ampb1", False),
+        ("bounce&amp;1", "bounce&#0;1", False),
+        ("bounce&amp;1", "bounce & 1", False),
+        ("bounce&amp;1", "bounce\x011", False),
+        ("bounce&amp;1", "bounce&#x41;&lt;&quot;1", True),
+        ("bounce&amp;1", "bounce]]>1", False),
+        ("<result>pass", "<result>&#32;pass", True),
+        ("<result>pass", "<result>&#13;pass", True),
+        ("<result>pass", "<result>&#xa0;pass&#x9;", True),
+        ("<result>pass", "<result>\xa0pass", True),
+        ("</feedback>", "</feedback><junk/>", False),
+        ("<count>3</count>", "<count>3</count><extra/>", True),
+    ],
+)
+def test_fast_path_never_disagrees_with_elementtree(old, new, valid):
+    payload = REPORT.replace(old, new, 1).encode()
+    fast, tree = _scan(payload, True), _scan(payload, False)
+    if valid:
+        assert fast == tree and len(tree) == 3
+    else:
+        assert (fast, tree) == ("fallback", "error")
+
+
+def test_bytes_are_counted_once_after_a_fallback(tmp_path, monkeypatch):
+    counts = []
+    monkeypatch.setattr(
+        dmarc_parser.profiling,
+        "count",
+        lambda name, n=1: counts.append(n) if name == "report.bytes" else None,
+    )
+    path = tmp_path / "report.xml"
+    path.write_text(REPORT.replace("<record>", "<!-- next --><record>"))
+    assert len(dmarc_parser.read_records(str(path), resolve_hosts=False)) == 2
+    assert sum(counts) == path.stat().st_size
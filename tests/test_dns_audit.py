@@ -0,0 +1,83 @@
+# tests/test_dns_audit.py
+import pytest
+
+from benchmarks.fake_doh import FakeDoHServer, audit_zone
+from mailops import dns_audit, doh
+
+
+@pytest.fixture
+def resolve(monkeypatch):
+    """Runs an audit against a fake DoH zone; returns (findings, server)."""
+
+    def run(zone, domains, **kwargs):
+        with FakeDoHServer(zone) as server:
+            monkeypatch.setattr(doh, "DOH_URL", server.url)
+            findings = dns_audit.audit(domains, **kwargs)
+        return findings, server
+
+    return run
+
+
+def test_portfolio_is_resolved_in_one_batch(resolve):
+    domains = ["a.example", "b.example"]
+    findings, server = resolve(audit_zone(domains), domains, selectors=["default"])
+
+    # 6 records per domain, each asked exactly once
+    assert len(server.queries) == 12
+    assert len(set(server.queries)) == 12
+    worst = dns_audit.summarize(findings)
+    assert set(worst) == {(d, c) for d in domains for c in dns_audit.CHECKS}
+    assert set(worst.values()) == {"ok"}
+
+
+def test_missing_and_weak_records(resolve):
+    zone = audit_zone(["example.com"])
+    del zone[("_dmarc.example.com", "TXT")]
+    del zone[("default._bimi.example.com", "TXT")]
+    zone[("_mta-sts.example.com", "TXT")] = ['"v=STSv1"']
+    zone[("default._domainkey.example.com", "TXT")] = ['"v=DKIM1; k=rsa; p="']
+    findings, _ = resolve(zone, ["example.com"], selectors=["default"])
+
+    worst = dns_audit.summarize(findings)
+    assert worst[("example.com", "dmarc")] == "fail"
+    assert worst[("example.com", "dkim")] == "fail"  # revoked key
+    assert worst[("example.com", "mta-sts")] == "fail"  # no id=
+    assert worst[("example.com", "bimi")] == "info"  # optional
+    assert worst[("example.com", "spf")] == "ok"
+
+
+@pytest.mark.parametrize(
+    "record, status",
+    [
+        ("v=DMARC1; p=reject; rua=mailto:d@example.com", "ok"),
+        ("v=DMARC1; p=none; rua=mailto:d@example.com", "warn"),
+        ("v=DMARC1; p=quarantine", "warn"),
+        ("v=DMARC1; p=bogus", "fail"),
+    ],
+)
+def test_dmarc_policy(record, status):
+    results = dns_audit.check_dmarc([record])
+    assert min(dns_audit.STATUSES.index(s) for s, _ in results) == (
+        dns_audit.STATUSES.index(status)
+    )
+
+
+def test_local_key_mismatch(resolve, tmp_path, monkeypatch):
+    monkeypatch.setattr(dns_audit, "_local_keys", lambda s, d: {"default": "AAAA"})
+    findings, _ = resolve(
+        audit_zone(["example.com"]),
+        ["example.com"],
+        selectors=["default"],
+        key_dir=str(tmp_path),
+    )
+    dkim = [f for f in findings if f["check"] == "dkim"]
+    assert dkim[0]["status"] == "fail"
+    assert "default.private" in dkim[0]["message"]
+
+
+def test_dkim_key_type_comes_from_the_key_record():
+    key = "A" * 44  # a 32-byte ed25519 key
+    records = ["v=DKIM1; n=see p=1 of the docs", f"v=DKIM1; k=ed25519; p={key}"]
+    assert dns_audit.check_dkim(records, "default") == [
+        ("ok", "ed25519 key published")
+    ]
@@ -0,0 +1,199 @@
+# tests/test_imap_fetcher.py
+import os
+
+import pytest
+
+from benchmarks import corpus
+from benchmarks.fake_imap import FakeIMAPServer
+from mailops import archive, atomic, dedup, imap_fetcher
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(imap_fetcher, "BACKOFF_BASE", 0)
+
+
+def _messages(count):
+    reports = corpus.generate_reports(count=count, records_per_report=2)
+    return [corpus.build_message(r) for r in reports]
+
+
+def _fetch(server, output_dir, **kwargs):
+    host, port = server.address
+    imap_fetcher.fetch_reports(
+        server.username,
+        server.password,
+        host,
+        port=port,
+        use_ssl=False,
+        output_dir=str(output_dir),
+        **kwargs,
+    )
+
+
+def _saved(directory):
+    return [f for _, _, files in os.walk(directory) for f in files if f[0] != "."]
+
+
+def test_reconnects_after_dropped_connection(tmp_path, monkeypatch, capsys):
+    monkeypatch.setattr(imap_fetcher, "BATCH_SIZE", 3)
+    with FakeIMAPServer(_messages(10)) as server:
+        # LOGIN, SELECT, UID SEARCH, UID FETCH, then the link drops
+        server.drop_after = 5
+        _fetch(server, tmp_path)
+
+    assert len(_saved(tmp_path)) == 10
+    out = capsys.readouterr().out
+    assert "Connection lost" in out and "Download complete" in out
+    assert server.commands.count("LOGIN") == 2
+    checkpoint = imap_fetcher.Checkpoint.for_archive(str(tmp_path))
+    assert [e["last_uid"] for e in checkpoint.state.values()] == [10]
+
+
+def test_first_connection_errors_are_not_retried(tmp_path, monkeypatch):
+    with FakeIMAPServer([]) as server:
+        host, port = server.address
+    # Nothing listens on the port any more
+    connects = []
+    connect = imap_fetcher.connect
+
+    def counting_connect(*args):
+        connects.append(args)
+        return connect(*args)
+
+    monkeypatch.setattr(imap_fetcher, "connect", counting_connect)
+    progress = []
+    with pytest.raises(imap_fetcher.FetchError, match="Login Failed"):
+        imap_fetcher.download_reports(
+            "user",
+            "secret",
+            host,
+            port=port,
+            use_ssl=False,
+            output_dir=str(tmp_path),
+            progress=lambda level, message: progress.append(message),
+        )
+    assert len(connects) == 1
+    assert not any("retrying" in m for m in progress)
+
+
+def test_resumes_from_last_committed_batch(tmp_path, monkeypatch, capsys):
+    monkeypatch.setattr(imap_fetcher, "BATCH_SIZE", 2)
+    saved = []
+
+    def crash_on_third(path):
+        saved.append(path)
+        if len(saved) == 3:
+            raise KeyboardInterrupt  # killed while processing the 2nd batch
+
+    with FakeIMAPServer(_messages(6)) as server:
+        with pytest.raises(KeyboardInterrupt):
+            _fetch(server, tmp_path, on_saved=crash_on_third)
+        capsys.readouterr()
+        _fetch(server, tmp_path)
+
+    out = capsys.readouterr().out
+    assert "Resuming after UID 2" in out
+    assert "Found 4 potential report emails" in out
+    # The 3rd report was written before the crash; it is not saved twice
+    assert "Saved 3 new reports" in out
+    assert len(_saved(tmp_path)) == 6
+    index = dedup.ReportIndex.for_archive(str(tmp_path))
+    assert len(index) == 6
+
+
+def test_save_restores_index_entries_lost_in_a_crash(tmp_path):
+    raw = _messages(1)[0]
+    output_dir = str(tmp_path)
+    archive_index = archive.ArchiveIndex(output_dir)
+    assert imap_fetcher.save_reports(raw, output_dir, archive_index=archive_index)[0]
+    (path,) = archive_index.find()
+    partition = os.path.dirname(path)
+
+    # The report was written, then the process died before indexing it
+    os.remove(os.path.join(partition, archive.PARTITION_INDEX))
+    os.remove(archive_index.path)
+    for _ in range(2):
+        archive_index = archive.ArchiveIndex(output_dir)
+        index = dedup.ReportIndex()
+        saved = imap_fetcher.save_reports(
+            raw, output_dir, index, archive_index=archive_index
+        )
+        assert saved == (0, 0) and len(index) == 1
+
+    assert list(archive.read_index(partition)) == [os.path.basename(path)]
+    assert archive_index.find() == [path]
+
+
+def test_parallel_backfill(tmp_path, monkeypatch):
+    monkeypatch.setattr(imap_fetcher, "BATCH_SIZE", 2)
+    # Latency keeps one connection from draining the queue on its own
+    with FakeIMAPServer(_messages(12), latency=0.01) as server:
+        _fetch(server, tmp_path, connections=4)
+
+    assert len(_saved(tmp_path)) == 12
+    assert server.commands.count("LOGIN") == 4
+    assert server.peak == 4
+    assert len(dedup.ReportIndex.for_archive(str(tmp_path))) == 12
+    checkpoint = imap_fetcher.Checkpoint.for_archive(str(tmp_path))
+    assert [e["last_uid"] for e in checkpoint.state.values()] == [12]
+
+
+def test_backfill_within_provider_connection_limit(tmp_path, monkeypatch, capsys):
+    monkeypatch.setattr(imap_fetcher, "BATCH_SIZE", 2)
+    with FakeIMAPServer(_messages(12), latency=0.01) as server:
+        server.max_connections = 2
+        _fetch(server, tmp_path, connections=4)
+
+    # Refused connections leave their batches to the others
+    assert len(_saved(tmp_path)) == 12
+    out = capsys.readouterr().out
+    assert "continuing with fewer connections" in out
+    assert "Download complete" in out
+
+
+def test_failed_save_is_retried_next_run(tmp_path, monkeypatch, capsys):
+    monkeypatch.setattr(imap_fetcher, "BATCH_SIZE", 2)
+    write_atomic = atomic.write_atomic
+    writes = []
+
+    def disk_full_once(path, payload):
+        if os.path.basename(path)[0] != ".":  # reports, not the checkpoint
+            writes.append(path)
+            if len(writes) == 3:
+                raise OSError("No space left on device")
+        write_atomic(path, payload)
+
+    monkeypatch.setattr(atomic, "write_atomic", disk_full_once)
+    with FakeIMAPServer(_messages(6)) as server:
+        _fetch(server, tmp_path)
+        checkpoint = imap_fetcher.Checkpoint.for_archive(str(tmp_path))
+        assert [e["last_uid"] for e in checkpoint.state.values()] == [2]
+        assert "will be fetched again" in capsys.readouterr().out
+        _fetch(server, tmp_path)
+
+    assert "Saved 1 new reports" in capsys.readouterr().out
+    assert len(_saved(tmp_path)) == 6
+
+
+def test_days_window_keeps_its_checkpoint(tmp_path):
+    from datetime import date
+
+    from mailops.archive import ReportFilter
+
+    with FakeIMAPServer(_messages(4)) as server:
+        # The same --days 365 window, run on two consecutive days
+        _fetch(server, tmp_path, report_filter=ReportFilter(date(2023, 1, 1), days=365))
+        host, port = server.address
+        result = imap_fetcher.download_reports(
+            server.username,
+            server.password,
+            host,
+            port=port,
+            use_ssl=False,
+            output_dir=str(tmp_path),
+            report_filter=ReportFilter(date(2023, 1, 2), days=365),
+        )
+
+    assert result.found == 0 and result.complete
+    assert len(_saved(tmp_path)) == 4
@@ -0,0 +1,43 @@
+# tests/test_metrics.py
+from benchmarks import corpus
+from benchmarks.fake_imap import FakeIMAPServer
+from mailops import imap_fetcher, metrics
+from mailops.dmarc_parser import ingest_hook
+
+
+def test_fetch_updates_counters_incrementally(tmp_path):
+    reports = list(corpus.generate_reports(count=2, records_per_report=3))
+    textfile = str(tmp_path / "mailops.prom")
+
+    with FakeIMAPServer([corpus.build_message(r) for r in reports]) as server:
+        host, port = server.address
+        for _ in range(2):  # second run finds nothing new
+            store = metrics.open_textfile(textfile)
+            imap_fetcher.fetch_reports(
+                server.username,
+                server.password,
+                host,
+                port=port,
+                use_ssl=False,
+                output_dir=str(tmp_path / "reports"),
+                on_saved=ingest_hook(store.record_report),
+            )
+            metrics.finish_run(store, "fetch")
+
+    text = open(textfile).read()
+    assert "# TYPE mailops_reports_ingested_total counter" in text
+    assert 'mailops_reports_ingested_total{org="google.com"} 1' in text
+    assert 'mailops_reports_ingested_total{org="Yahoo"} 1' in text
+    records = metrics.open_textfile(textfile).values
+    total = sum(
+        v for (name, _), v in records.items() if name == "mailops_records_total"
+    )
+    assert total == 6
+
+
+def test_blacklist_gauges_keep_last_known_status(tmp_path):
+    store = metrics.MetricsStore(str(tmp_path / "state.json"))
+    store.record_blacklist("192.0.2.1", {"zen.spamhaus.org": "127.0.0.2"})
+    store.record_blacklist("192.0.2.1", {"zen.spamhaus.org": "Error: timeout"})
+    text = store.render()
+    assert 'mailops_rbl_listed{ip="192.0.2.1",zone="zen.spamhaus.org"} 1' in text
@@ -0,0 +1,38 @@
+# tests/test_profiling.py
+from mailops import profiling
+
+
+def test_disabled_profiler_records_nothing():
+    profiling.disable()
+    profiling.reset()
+    with profiling.stage("x"):
+        pass
+    profiling.count("c")
+    profiling.observe("lat", 0.5)
+    data = profiling.snapshot()
+    assert data["stages"] == {} and data["counters"] == {} and data["latency"] == {}
+
+
+def test_enabled_profiler_collects_stages_counters_and_percentiles(tmp_path):
+    @profiling.timed("work")
+    def work():
+        with profiling.stage("inner"):
+            profiling.count("items", 3)
+
+    profiling.enable()
+    try:
+        work()
+        work()
+        for ms in range(1, 101):
+            profiling.observe("dns", ms / 1000)
+        data = profiling.finish(str(tmp_path / "profile.json"))
+    finally:
+        profiling.disable()
+
+    assert data["stages"]["work"]["calls"] == 2
+    assert data["stages"]["inner"]["calls"] == 2
+    assert data["counters"]["items"] == 6
+    assert data["latency"]["dns"]["p50"] == 0.05
+    assert data["latency"]["dns"]["max"] == 0.1
+    assert (tmp_path / "profile.json").exists()
+    assert "work" in profiling.format_report(data)
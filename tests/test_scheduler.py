@@ -0,0 +1,146 @@
+# tests/test_scheduler.py
+import threading
+import time
+
+import pytest
+
+from benchmarks.fake_doh import FakeDoHServer, audit_zone, default_zone
+from mailops import blacklist_monitor, dns_audit, doh, scheduler
+
+
+@pytest.fixture(autouse=True)
+def fresh_scheduler():
+    scheduler.configure()
+    yield
+    scheduler.configure()
+
+
+def test_bucket_paces_after_the_burst():
+    bucket = scheduler.TokenBucket(rate=50, burst=2)
+    start = time.monotonic()
+    for _ in range(6):
+        bucket.acquire()
+    # 2 tokens up front, then 4 more at 50/s
+    assert time.monotonic() - start >= 0.07
+
+
+def test_interactive_lane_goes_first():
+    bucket = scheduler.TokenBucket(rate=20, burst=1)
+    bucket.acquire()  # empty the bucket
+    order = []
+
+    def take(lane, label):
+        bucket.acquire(lane)
+        order.append(label)
+
+    bulk = [
+        threading.Thread(target=take, args=(scheduler.BULK, f"bulk{i}"))
+        for i in range(3)
+    ]
+    for t in bulk:
+        t.start()
+    time.sleep(0.01)
+    interactive = threading.Thread(target=take, args=(scheduler.INTERACTIVE, "ui"))
+    interactive.start()
+    for t in bulk + [interactive]:
+        t.join()
+    assert order[0] == "ui"
+
+
+def test_transient_errors_are_retried():
+    sched = scheduler.Scheduler(default_limit=(0, 1), backoff=0.001)
+    calls = []
+
+    def flaky(timeout):
+        calls.append(timeout)
+        if len(calls) < 3:
+            raise scheduler.ServerFailure("SERVFAIL")
+        return "ok"
+
+    assert sched.run(flaky, "upstream") == "ok"
+    assert calls == [scheduler.TIMEOUT] * 3
+
+    def bad_query(timeout):
+        calls.append(timeout)
+        raise ValueError("not retried")
+
+    with pytest.raises(ValueError):
+        sched.run(bad_query, "upstream")
+    assert len(calls) == 4
+
+
+def _breaking_scheduler():
+    return scheduler.Scheduler(
+        default_limit=(0, 1),
+        retries=0,
+        breaker_failures=2,
+        breaker_cooldown=0.05,
+    )
+
+
+def _fail(error):
+    def call(timeout):
+        raise error
+
+    return call
+
+
+def test_breaker_opens_and_recovers():
+    sched = _breaking_scheduler()
+    servfail = _fail(scheduler.ServerFailure("SERVFAIL"))
+    for _ in range(2):
+        with pytest.raises(scheduler.ServerFailure):
+            sched.run(servfail, "upstream", "rbl.example")
+    with pytest.raises(scheduler.CircuitOpen, match="rbl.example"):
+        sched.run(servfail, "upstream", "rbl.example")
+    # Other zones on the same upstream are unaffected
+    assert sched.run(lambda timeout: "ok", "upstream", "other.example") == "ok"
+
+    time.sleep(0.06)
+    assert sched.run(lambda timeout: "ok", "upstream", "rbl.example") == "ok"
+    assert sched.breaker("rbl.example").opened_at is None
+
+
+def test_transport_errors_open_the_upstream_breaker():
+    sched = _breaking_scheduler()
+    for zone in ("a.example", "b.example"):
+        with pytest.raises(TimeoutError):
+            sched.run(_fail(TimeoutError("timed out")), "upstream", zone)
+    with pytest.raises(scheduler.CircuitOpen, match="upstream"):
+        sched.run(lambda timeout: "ok", "upstream", "c.example")
+    # SERVFAILs without a zone never do
+    for _ in range(3):
+        with pytest.raises(scheduler.ServerFailure):
+            sched.run(_fail(scheduler.ServerFailure("SERVFAIL")), "other")
+    assert sched.run(lambda timeout: "ok", "other") == "ok"
+
+
+def test_broken_domains_dont_block_the_audit(monkeypatch):
+    scheduler.configure(retries=0, breaker_failures=2)
+    broken = ["b1.example", "b2.example"]
+    zone = audit_zone(broken + ["good.example"], selectors=("s1", "s2"))
+    with FakeDoHServer(zone, failing=broken) as server:
+        monkeypatch.setattr(doh, "DOH_URL", server.url)
+        findings = dns_audit.audit(broken + ["good.example"], selectors=("s1", "s2"))
+
+    worst = dns_audit.summarize(findings)
+    assert {c for (d, c), s in worst.items() if s != "ok"} == set(dns_audit.CHECKS)
+    assert all(worst[("good.example", c)] == "ok" for c in dns_audit.CHECKS)
+
+
+def test_failing_rbl_zone_is_skipped(monkeypatch):
+    scheduler.configure(retries=0, backoff=0.001, breaker_failures=2)
+    zone = default_zone(listed_ips=["192.0.2.1"])
+    with FakeDoHServer(zone, failing=["bl.spamcop.net"]) as server:
+        monkeypatch.setattr(doh, "DOH_URL", server.url)
+        ips = ["192.0.2.1", "192.0.2.2", "192.0.2.3", "192.0.2.4"]
+        resolver = dns_audit.Resolver(max_workers=1)
+        results = blacklist_monitor.check_many(ips, resolver=resolver)
+
+    assert results[0].listed == ["zen.spamhaus.org"]
+    assert all(r.errors == ["bl.spamcop.net"] for r in results)
+    errors = [r.results["bl.spamcop.net"] for r in results]
+    assert sum("SERVFAIL" in e for e in errors) == 2
+    assert sum("query skipped" in e for e in errors) == 2
+    spamcop = [q for q in server.queries if q[0].endswith("bl.spamcop.net")]
+    assert len(spamcop) == 2  # the breaker stopped the rest
@@ -0,0 +1,162 @@
+# tests/test_tlsrpt.py
+import gzip
+import json
+import os
+
+import pytest
+
+from benchmarks import corpus
+from benchmarks.fake_imap import FakeIMAPServer
+from mailops import archive, dmarc_parser, imap_fetcher, tlsrpt
+
+# RFC 8460 section 4.8, trimmed
+REPORT = {
+    "organization-name": "Company-X",
+    "date-range": {
+        "start-datetime": "2016-04-01T00:00:00Z",
+        "end-datetime": "2016-04-01T23:59:59Z",
+    },
+    "contact-info": "sts-reporting@company-x.example",
+    "report-id": "5065427c-23d3-47ca-b6e0-946ea0e8c4be",
+    "policies": [
+        {
+            "policy": {
+                "policy-type": "sts",
+                "policy-string": ["version: STSv1", "mode: testing"],
+                "policy-domain": "company-y.example",
+                "mx-host": ["*.mail.company-y.example"],
+            },
+            "summary": {
+                "total-successful-session-count": 5326,
+                "total-failure-session-count": 303,
+            },
+            "failure-details": [
+                {
+                    "result-type": "certificate-expired",
+                    "sending-mta-ip": "2001:db8:abcd:0012::1",
+                    "receiving-mx-hostname": "mx1.mail.company-y.example",
+                    "failed-session-count": 100,
+                },
+                {
+                    "result-type": "starttls-not-supported",
+                    "sending-mta-ip": "2001:db8:abcd:0013::1",
+                    "receiving-mx-hostname": "mx2.mail.company-y.example",
+                    "receiving-ip": "203.0.113.56",
+                    "failed-session-count": 200,
+                },
+                {
+                    "result-type": "validation-failure",
+                    "sending-mta-ip": "198.51.100.62",
+                    "receiving-ip": "203.0.113.58",
+                    "receiving-mx-hostname": "mx-backup.mail.company-y.example",
+                    "failed-session-count": 3,
+                },
+            ],
+        }
+    ],
+}
+
+
+@pytest.mark.parametrize("chunk_size", [7, 1 << 16])
+def test_streaming_parse_of_rfc_example(tmp_path, monkeypatch, chunk_size):
+    monkeypatch.setattr(tlsrpt, "CHUNK_SIZE", chunk_size)
+    path = tmp_path / "company-x.example!company-y.example!1459468800.json.gz"
+    path.write_bytes(gzip.compress(json.dumps(REPORT, indent=2).encode()))
+
+    meta = tlsrpt.read_report_metadata(str(path))
+    assert meta["org_name"] == "Company-X"
+    assert meta["domain"] == "company-y.example"
+    assert (meta["begin"], meta["end"]) == ("1459468800", "1459555199")
+
+    records = tlsrpt.parse_tlsrpt(str(path))
+    assert tlsrpt.totals(records) == (5326, 303)
+    rows = tlsrpt.summarize_mtas(records)
+    assert [r["receiving_mx"] for r in rows] == [
+        "mx2.mail.company-y.example",
+        "mx1.mail.company-y.example",
+        "mx-backup.mail.company-y.example",
+    ]
+    assert rows[0]["result_types"] == "starttls-not-supported (200)"
+
+
+def test_header_after_policies(tmp_path):
+    report = {"policies": REPORT["policies"]}
+    report.update((k, v) for k, v in REPORT.items() if k != "policies")
+    path = tmp_path / "report.json"
+    path.write_text(json.dumps(report))
+
+    records = tlsrpt.parse_tlsrpt(str(path))
+    assert len(records) == 4
+    assert {r["org_name"] for r in records} == {"Company-X"}
+
+
+def test_one_pass_fetch_of_dmarc_and_tls_reports(tmp_path, monkeypatch):
+    monkeypatch.setattr(dmarc_parser, "resolve_ip", lambda ip: "host.example.net")
+    dmarc = list(corpus.generate_reports(count=3, records_per_report=2))
+    tls = list(corpus.generate_tls_reports(count=3, failures_per_report=4))
+    messages = [corpus.build_message(r) for r in dmarc + tls]
+
+    seen = {"dmarc": 0, "tls": []}
+
+    def count_dmarc(records):
+        seen["dmarc"] += 1
+
+    with FakeIMAPServer(messages) as server:
+        host, port = server.address
+        imap_fetcher.fetch_reports(
+            server.username,
+            server.password,
+            host,
+            port=port,
+            use_ssl=False,
+            output_dir=str(tmp_path),
+            on_saved=dmarc_parser.ingest_hook(
+                count_dmarc, tls_consumers=[seen["tls"].extend]
+            ),
+        )
+
+    assert seen["dmarc"] == 3
+    assert len(seen["tls"]) == 3 * 5  # one success row + 4 failures each
+    tls_files = archive.find_report_files(str(tmp_path), kind="tlsrpt")
+    dmarc_files = archive.find_report_files(str(tmp_path))
+    assert len(tls_files) == 3 and len(dmarc_files) == 3
+    # Same partitions and sidecar index as DMARC reports
+    partition = os.path.dirname(tls_files[0])
+    assert os.path.basename(tls_files[0]) in archive.read_index(partition)
+
+
+class _CountingDecoder:
+    """Counts the characters raw_decode scans (the work of parsing)."""
+
+    def __init__(self):
+        self.decoder = tlsrpt._decoder
+        self.scanned = 0
+
+    def raw_decode(self, s, idx):
+        try:
+            value, end = self.decoder.raw_decode(s, idx)
+        except json.JSONDecodeError:
+            self.scanned += len(s) - idx
+            raise
+        self.scanned += end - idx
+        return value, end
+
+
+@pytest.mark.parametrize("member", ["failure-details", "mx-host"])
+@pytest.mark.parametrize("copies", [200, 2000])
+def test_parse_work_scales_linearly(tmp_path, monkeypatch, member, copies):
+    monkeypatch.setattr(tlsrpt, "CHUNK_SIZE", 1024)
+    report = json.loads(json.dumps(REPORT))
+    policy = report["policies"][0]
+    if member == "failure-details":
+        policy["failure-details"] *= copies
+    else:  # one large value
+        policy["policy"]["mx-host"] *= copies
+    path = tmp_path / "report.json"
+    path.write_text(json.dumps(report))
+    decoder = _CountingDecoder()
+    monkeypatch.setattr(tlsrpt, "_decoder", decoder)
+
+    records = tlsrpt.parse_tlsrpt(str(path))
+    assert len(records) > 3
+    assert decoder.scanned < 4 * path.stat().st_size
@@ -0,0 +1,75 @@
+# tests/test_trends.py
+from mailops import trends
+
+
+def _report(day, rows, org="google.com", domain="example.com"):
+    """rows: (ip, count, spf, dkim)"""
+    return [
+        {
+            "org_name": org,
+            "date": day,
+            "domain": domain,
+            "source_ip": ip,
+            "count": str(count),
+            "spf": spf,
+            "dkim": dkim,
+        }
+        for ip, count, spf, dkim in rows
+    ]
+
+
+def test_new_failing_sender_is_flagged_once():
+    engine = trends.TrendEngine()
+    engine.ingest(_report("2025-01-01", [("192.0.2.1", 100, "pass", "pass")]))
+    anomalies = engine.ingest(
+        _report(
+            "2025-01-02",
+            [("192.0.2.1", 90, "pass", "pass"), ("203.0.113.9", 40, "fail", "fail")],
+        )
+    )
+    assert [(a["kind"], a["source_ip"]) for a in anomalies] == [
+        ("new_sender", "203.0.113.9")
+    ]
+    again = _report("2025-01-03", [("203.0.113.9", 40, "fail", "fail")])
+    assert engine.ingest(again) == []
+
+
+def test_pass_rate_drop_and_volume_spike_against_baseline():
+    engine = trends.TrendEngine()
+    for day in range(1, 6):
+        engine.ingest(_report(f"2025-01-0{day}", [("192.0.2.1", 100, "pass", "none")]))
+
+    drop = engine.ingest(_report("2025-01-06", [("192.0.2.1", 100, "fail", "fail")]))
+    assert [a["kind"] for a in drop] == ["pass_rate_drop"]
+    assert drop[0]["baseline"] == 1.0
+
+    spike = engine.ingest(_report("2025-01-07", [("192.0.2.1", 5000, "pass", "pass")]))
+    assert [a["kind"] for a in spike] == ["volume_spike"]
+    # Another org's volume is judged against its own baseline
+    other = _report("2025-01-07", [("192.0.2.1", 5000, "pass", "pass")], org="yahoo")
+    assert engine.ingest(other) == []
+
+
+def test_state_round_trips_and_prunes_stale_senders(tmp_path):
+    engine = trends.TrendEngine.for_archive(str(tmp_path))
+    engine.ingest(_report("2025-01-01", [("192.0.2.1", 10, "fail", "fail")]))
+    engine.ingest(_report("2025-12-01", [("192.0.2.2", 10, "pass", "pass")]))
+    engine.save()
+
+    reloaded = trends.TrendEngine.for_archive(str(tmp_path))
+    assert list(reloaded.senders) == ["example.com|192.0.2.2"]
+    assert reloaded.alerts[0]["kind"] == "new_sender"
+
+
+def test_replayed_reports_are_folded_in_once(tmp_path):
+    report = _report("2025-01-01", [("192.0.2.1", 10, "pass", "pass")])
+    for r in report:
+        r["report_id"] = "r1"
+    engine = trends.TrendEngine.for_archive(str(tmp_path))
+    engine.ingest(report)
+    engine.save()
+
+    # e.g. `trends --ingest` over reports the fetch already fed in
+    reloaded = trends.TrendEngine.for_archive(str(tmp_path))
+    reloaded.ingest(report)
+    assert reloaded.senders["example.com|192.0.2.1"]["orgs"]["google.com"][0] == 1
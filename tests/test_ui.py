@@ -0,0 +1,62 @@
+# tests/test_ui.py
+import io
+import json
+
+from mailops import dmarc_parser, ui
+
+ROWS = [
+    {
+        "org_name": "google.com",
+        "date": "2024-01-01",
+        "source_ip": "192.0.2.1",
+        "hostname": "a-very-long-hostname-that-will-be-cut.example.net",
+        "count": "3",
+        "spf": "fail",
+        "dkim": "fail",
+        "disposition": "reject",
+        "status_msg": "BLOCKED (Spoofing)",
+        "status_color": "",
+        "file": "report.xml",
+    }
+]
+
+
+def test_set_color_off_strips_escape_codes():
+    ui.set_color(False)
+    try:
+        assert ui.Colors.RED == "" and ui.Colors.RESET == ""
+        out = io.StringIO()
+        dmarc_parser.render_records(ROWS, "table", out)
+        assert "\033[" not in out.getvalue()
+        assert "a-very-long-hostname-that-w.. " in out.getvalue()
+    finally:
+        ui.set_color(ui.should_use_color())
+
+
+def test_tsv_and_json_renderers():
+    out = io.StringIO()
+    dmarc_parser.render_records(ROWS, "tsv", out)
+    header, row = out.getvalue().splitlines()
+    assert header.split("\t") == dmarc_parser.EXPORT_FIELDS
+    assert row.split("\t")[2] == "192.0.2.1"
+
+    out = io.StringIO()
+    dmarc_parser.render_records(ROWS * 3, "json", out)
+    data = json.loads(out.getvalue())
+    assert len(data) == 3 and "status_color" not in data[0]
+
+    out = io.StringIO()
+    dmarc_parser.render_records(ROWS * 2, "jsonl", out)
+    assert [json.loads(line)["spf"] for line in out.getvalue().splitlines()] == [
+        "fail",
+        "fail",
+    ]
+
+
+def test_buffered_output_flushes_in_chunks():
+    out = io.StringIO()
+    with ui.BufferedOutput(out, limit=10) as buf:
+        buf.write_line("0123456789")
+        assert out.getvalue() == "0123456789\n"
+        buf.write_line("tail")
+    assert out.getvalue() == "0123456789\ntail\n"